@@ -32,6 +32,20 @@ class ParameterSerializer(serializers.Serializer):
     default = serializers.CharField(required=False)
 
 
+class ResourcesSerializer(serializers.Serializer):
+    """Serializer for the resource limits of a function"""
+
+    cpus = serializers.FloatField(min_value=0.01, required=False)
+    memory = serializers.RegexField(
+        r"^[1-9][0-9]*[bkmg]?$",
+        required=False,
+        error_messages={
+            "invalid": "Must be a number of bytes, optionally in b, k, m or g"
+        },
+    )
+    pids = serializers.IntegerField(min_value=1, required=False)
+
+
 class FunctionSerializer(serializers.Serializer):
     """Serializer for function description"""
 
@@ -44,6 +58,8 @@ class FunctionSerializer(serializers.Serializer):
     )
     parameters = ParameterSerializer(many=True)
     return_type = serializers.ChoiceField(choices=RETURN_TYPE_CHOICES, required=False)
+    resources = ResourcesSerializer(required=False)
+    timeout = serializers.IntegerField(min_value=1, required=False)
 
 
 class PackageDefinitionSerializer(serializers.Serializer):
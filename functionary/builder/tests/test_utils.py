@@ -144,6 +144,22 @@ def test_deactivate_removed_functions(
     assert package1.functions.get(name="function2").active is False
 
 
+@pytest.mark.django_db
+def test_update_functions_sets_resources(package1):
+    """Resource limits from the definition are stored on the function"""
+    resources = {"cpus": 0.5, "memory": "256m", "pids": 64}
+
+    PackageManager(package1).update_functions(
+        [
+            {"name": "limited", "parameters": [], "resources": resources},
+            {"name": "unlimited", "parameters": []},
+        ]
+    )
+
+    assert package1.functions.get(name="limited").resources == resources
+    assert package1.functions.get(name="unlimited").resources == {}
+
+
 @pytest.mark.django_db
 def test_delete_removed_function_parameters(function1):
     assert function1.parameters.count() == 2
@@ -157,6 +173,29 @@ def test_delete_removed_function_parameters(function1):
     assert function1.parameters.filter(name="param1").exists()
 
 
+@pytest.mark.django_db
+def test_update_functions_bumps_parameters_version_once(function1):
+    """Updating the functions invalidates cached parameter validators with a single
+    bump, however many parameters change"""
+    function1.refresh_from_db()
+    version = function1.parameters_version
+
+    PackageManager(function1.package).update_functions(
+        [
+            {
+                "name": "function1",
+                "parameters": [
+                    {"name": "param1", "type": "string", "required": True},
+                    {"name": "param3", "type": "integer", "required": False},
+                ],
+            }
+        ]
+    )
+    function1.refresh_from_db()
+
+    assert function1.parameters_version == version + 1
+
+
 @pytest.mark.django_db
 def test_unavailable_docker_socket(mocker):
     def mock_unavailabe_docker_socket():
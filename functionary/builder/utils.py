@@ -69,6 +69,10 @@ class PackageManager:
             self._save_functions(functions, function_parameters)
             self._delete_removed_functions(function_definitions, function_parameters)
 
+            # Parameters are saved and deleted without bumping their functions'
+            # parameters_version, so bump them all once here
+            Function.bump_parameters_versions(package=self.package)
+
     def _create_functions_from_definition(
         self, definitions: list[dict]
     ) -> tuple[list[Function], list[FunctionParameter]]:
@@ -90,6 +94,8 @@ class PackageManager:
             function_obj.return_type = function_def.get("return_type")
             function_obj.description = function_def.get("description")
             function_obj.variables = function_def.get("variables", [])
+            function_obj.resources = function_def.get("resources", {})
+            function_obj.timeout = function_def.get("timeout")
             function_obj.active = True
 
             functions.append(function_obj)
@@ -144,7 +150,7 @@ class PackageManager:
             func.save()
 
         for parameter in function_parameters:
-            parameter.save()
+            parameter.save(bump_version=False)
 
     def _deactivate_removed_functions(self, definitions: list[dict]):
         """Deactivate and package functions not present in the definitions"""
@@ -30,6 +30,14 @@ class BadRequest(APIException):
     default_code = "bad_request"
 
 
+class Conflict(APIException):
+    """The request conflicts with the current state of the resource"""
+
+    status_code = 409
+    default_detail = "Request conflicts with the current state of the resource"
+    default_code = "conflict"
+
+
 class MissingEnvironmentHeader(APIException):
     """Required environment header is missing"""
 
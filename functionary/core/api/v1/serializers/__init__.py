@@ -1,6 +1,7 @@
 from .function import FunctionSerializer  # noqa
 from .package import PackageSerializer  # noqa
 from .task import (  # noqa
+    TaskBulkCreateSerializer,
     TaskCreateByIdSerializer,
     TaskCreateByNameSerializer,
     TaskCreateResponseSerializer,
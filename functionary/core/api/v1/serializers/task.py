@@ -7,6 +7,8 @@ from rest_framework import serializers
 from core.api.v1.utils import cast_parameters, parse_parameters
 from core.models import Function, Task
 
+TASK_BULK_CREATE_MAX_TASKS = 10000
+
 
 class TaskSerializer(serializers.ModelSerializer):
     """Basic serializer for the Task model"""
@@ -21,7 +23,7 @@ class TaskCreateByIdSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ["function", "parameters"]
+        fields = ["function", "parameters", "timeout", "priority"]
 
     def to_internal_value(self, data) -> OrderedDict:
         parse_parameters(data)
@@ -48,7 +50,7 @@ class TaskCreateByNameSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Task
-        fields = ["function_name", "package_name", "parameters"]
+        fields = ["function_name", "package_name", "parameters", "timeout", "priority"]
 
     def to_internal_value(self, data: OrderedDict) -> OrderedDict:
         parse_parameters(data)
@@ -100,6 +102,70 @@ class TaskCreateByNameSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(serializers.as_serializer_error(exc))
 
 
+class TaskBulkCreateSerializer(serializers.Serializer):
+    """Serializer for creating many Tasks of the same function. The function can be
+    identified by either its id, or the function_name and package_name. Only
+    functions in the environment passed in the serializer context are accepted."""
+
+    function = serializers.PrimaryKeyRelatedField(
+        queryset=Function.objects.none(), required=False
+    )
+    function_name = serializers.CharField(required=False)
+    package_name = serializers.CharField(required=False)
+    parameters = serializers.ListField(
+        child=serializers.DictField(),
+        min_length=1,
+        max_length=TASK_BULK_CREATE_MAX_TASKS,
+    )
+    timeout = serializers.IntegerField(min_value=1, required=False)
+    priority = serializers.ChoiceField(
+        choices=Task.PRIORITY_CHOICES, default=Task.PRIORITY_LOW
+    )
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["function"].queryset = self._get_functions()
+
+    def _get_functions(self):
+        """Functions in the context environment, or none without one, such as when
+        the serializer is only built for the schema"""
+        environment = self.context.get("environment")
+
+        if environment is None:
+            return Function.objects.none()
+
+        return Function.objects.filter(package__environment=environment)
+
+    def validate(self, data: OrderedDict) -> OrderedDict:
+        if "function" in data:
+            return data
+
+        if "function_name" not in data or "package_name" not in data:
+            raise serializers.ValidationError(
+                "Either function, or function_name and package_name are required"
+            )
+
+        function_name = data.pop("function_name")
+        package_name = data.pop("package_name")
+
+        try:
+            data["function"] = self._get_functions().get(
+                name=function_name,
+                package__name=package_name,
+            )
+        except Function.DoesNotExist:
+            raise serializers.ValidationError(
+                {
+                    "function_name": (
+                        f"No function {function_name} found for package "
+                        f"{package_name}"
+                    )
+                }
+            )
+
+        return data
+
+
 class TaskCreateResponseSerializer(serializers.ModelSerializer):
     """Serializer for returning the task id after creation"""
 
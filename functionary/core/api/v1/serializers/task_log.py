@@ -1,12 +1,8 @@
 """ TaskLog serializers """
 from rest_framework import serializers
 
-from core.models import TaskLog
 
+class TaskLogSerializer(serializers.Serializer):
+    """Basic serializer for the log output of a Task"""
 
-class TaskLogSerializer(serializers.ModelSerializer):
-    """Basic serializer for the TaskLog model"""
-
-    class Meta:
-        model = TaskLog
-        fields = ["log"]
+    log = serializers.CharField()
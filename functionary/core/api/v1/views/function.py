@@ -1,3 +1,12 @@
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from drf_spectacular.types import OpenApiTypes
+from drf_spectacular.utils import extend_schema
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+
+from core.api import HEADER_PARAMETERS
 from core.api.permissions import HasEnvironmentPermissionForAction
 from core.api.viewsets import EnvironmentReadOnlyModelViewSet
 from core.models import Function
@@ -12,3 +21,37 @@ class FunctionViewSet(EnvironmentReadOnlyModelViewSet):
     serializer_class = FunctionSerializer
     permission_classes = [HasEnvironmentPermissionForAction]
     environment_through_field = "package"
+
+    @extend_schema(
+        description=(
+            "Retrieve the JSON schema of the function's parameters. Responses "
+            "include ETag and Last-Modified headers so that clients can revalidate "
+            "a previously retrieved schema using If-None-Match or If-Modified-Since."
+        ),
+        parameters=HEADER_PARAMETERS,
+        responses={
+            status.HTTP_200_OK: OpenApiTypes.OBJECT,
+            status.HTTP_304_NOT_MODIFIED: None,
+        },
+    )
+    @action(methods=["get"], detail=True, url_path="schema", url_name="schema")
+    def parameter_schema(self, request, pk=None):
+        function: Function = self.get_object()
+
+        etag = quote_etag(f"{function.id}-{function.parameters_version}")
+        last_modified = int(function.parameters_updated_at.timestamp())
+
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+
+        if response is None:
+            response = Response(function.schema, status=status.HTTP_200_OK)
+
+        response["ETag"] = etag
+        response["Last-Modified"] = http_date(last_modified)
+
+        # Clients must revalidate since the schema changes when a package is published
+        patch_cache_control(response, private=True, no_cache=True)
+
+        return response
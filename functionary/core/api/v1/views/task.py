@@ -1,7 +1,7 @@
 from typing import Union
 
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import ValidationError as DjangoValidationError
+from django.db import transaction
 from drf_spectacular.utils import (
     PolymorphicProxySerializer,
     extend_schema,
@@ -10,13 +10,15 @@ from drf_spectacular.utils import (
 from rest_framework import mixins, serializers, status
 from rest_framework.decorators import action
 from rest_framework.exceptions import NotFound, ValidationError
-from rest_framework.parsers import MultiPartParser
+from rest_framework.parsers import JSONParser, MultiPartParser
 from rest_framework.request import Request
 from rest_framework.response import Response
 
 from core.api import HEADER_PARAMETERS
+from core.api.exceptions import Conflict
 from core.api.permissions import HasEnvironmentPermissionForAction
 from core.api.v1.serializers import (
+    TaskBulkCreateSerializer,
     TaskCreateByIdSerializer,
     TaskCreateByNameSerializer,
     TaskCreateResponseSerializer,
@@ -26,8 +28,10 @@ from core.api.v1.serializers import (
 )
 from core.api.v1.utils import PREFIX, SEPARATOR, get_parameter_name
 from core.api.viewsets import EnvironmentGenericViewSet
-from core.models import Task, TaskResult
+from core.models import Function, Task, TaskDispatch, TaskResult
 from core.utils.minio import S3Error, handle_file_parameters
+from core.utils.parameter import PARAMETER_TYPE, get_validator
+from core.utils.tasking import cancel_task
 
 RENDER_PREFIX = f"{PREFIX}{SEPARATOR}".replace("\\", "")
 
@@ -50,7 +54,9 @@ class TaskViewSet(
     permission_classes = [HasEnvironmentPermissionForAction]
 
     def get_serializer_class(self):
-        if self.action == "create":
+        if self.action == "bulk":
+            return TaskBulkCreateSerializer
+        elif self.action == "create":
             if "function_name" in self.request.data.keys():
                 return TaskCreateByNameSerializer
             else:
@@ -120,6 +126,88 @@ class TaskViewSet(
             response_serializer.data, status=status.HTTP_201_CREATED, headers=headers
         )
 
+    @extend_schema(
+        description=(
+            "Execute a function many times in a single request. The function to be "
+            "executed can be defined either by supplying function as a string uuid, "
+            "or function_name and package_name. `parameters` is a list containing "
+            "one set of parameters for each task to create. If any set of "
+            "parameters is invalid, no tasks are created. Functions with file "
+            "parameters can not be executed in bulk."
+        ),
+        request=TaskBulkCreateSerializer,
+        responses={
+            status.HTTP_201_CREATED: TaskCreateResponseSerializer(many=True),
+        },
+        parameters=HEADER_PARAMETERS,
+    )
+    @action(methods=["post"], detail=False, parser_classes=[JSONParser])
+    def bulk(self, request: Request):
+        environment = self.get_environment()
+        request_serializer: TaskBulkCreateSerializer = self.get_serializer(
+            data=request.data,
+            context={**self.get_serializer_context(), "environment": environment},
+        )
+        request_serializer.is_valid(raise_exception=True)
+
+        function: Function = request_serializer.validated_data["function"]
+
+        _validate_bulk_function(function)
+        validator = get_validator(function)
+        parameter_sets = request_serializer.validated_data["parameters"]
+        errors = {}
+
+        for index, parameters in enumerate(parameter_sets):
+            try:
+                validator.validate(parameters)
+            except DjangoValidationError as err:
+                errors[index] = err.messages
+
+        if errors:
+            raise serializers.ValidationError({"parameters": errors})
+
+        tasks = [
+            Task(
+                creator=request.user,
+                environment=environment,
+                function=function,
+                parameters=parameters,
+                timeout=request_serializer.validated_data.get("timeout"),
+                priority=request_serializer.validated_data["priority"],
+            )
+            for parameters in parameter_sets
+        ]
+
+        # bulk_create skips the post_create hook that queues each task for the
+        # dispatcher, so they are queued together
+        with transaction.atomic():
+            Task.objects.bulk_create(tasks)
+            TaskDispatch.objects.bulk_create(
+                [TaskDispatch(task=task) for task in tasks]
+            )
+
+        response_serializer = TaskCreateResponseSerializer(tasks, many=True)
+
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+
+    @extend_schema(
+        description=(
+            "Cancel a task that has not finished. A task that a runner has already "
+            "started is stopped."
+        ),
+        request=None,
+        parameters=HEADER_PARAMETERS,
+        responses={status.HTTP_200_OK: TaskSerializer},
+    )
+    @action(methods=["post"], detail=True, parser_classes=[JSONParser])
+    def cancel(self, request, pk=None):
+        task = self.get_object()
+
+        if not cancel_task(task):
+            raise Conflict(f"Task {pk} has already finished.")
+
+        return Response(TaskSerializer(task).data, status=status.HTTP_200_OK)
+
     @extend_schema(
         description="Retrieve the task results",
         parameters=HEADER_PARAMETERS,
@@ -145,14 +233,29 @@ class TaskViewSet(
     def log(self, request, pk=None):
         task = self.get_object()
 
-        try:
-            serializer = TaskLogSerializer(task.tasklog)
-        except ObjectDoesNotExist:
+        if (log := task.log) is None:
             raise NotFound(f"No log found for task {pk}.")
 
+        serializer = TaskLogSerializer({"log": log})
+
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
+def _validate_bulk_function(function: Function) -> None:
+    """Ensure that the function can be executed in bulk
+
+    Raises:
+        ValidationError: The function can not be executed in bulk
+    """
+    if function.active is False:
+        raise serializers.ValidationError({"function": "This function is not active"})
+
+    if function.parameters.filter(parameter_type=PARAMETER_TYPE.FILE).exists():
+        raise serializers.ValidationError(
+            {"function": "Functions with file parameters can not be executed in bulk"}
+        )
+
+
 def _handle_file_parameters(
     request: Request,
     task: Task,
@@ -0,0 +1,74 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils.benchmark import run_benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        "Run synthetic workflows through the workflow engine, with in-memory stand-ins "
+        "for the message broker and runners, and report the time and database "
+        "queries spent in each stage"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--length", type=int, default=5, help="The number of layers of steps"
+        )
+        parser.add_argument(
+            "--width", type=int, default=1, help="The number of steps in each layer"
+        )
+        parser.add_argument(
+            "--items",
+            type=int,
+            default=0,
+            help="End the workflow with a step that maps over this many items",
+        )
+        parser.add_argument(
+            "--result-size",
+            type=int,
+            default=1024,
+            help="The number of bytes of padding in each task's result",
+        )
+        parser.add_argument(
+            "--runs", type=int, default=10, help="The number of runs of the workflow"
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Run even though DEBUG is disabled",
+        )
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options["force"]:
+            raise CommandError(
+                "A task dispatcher using this database would publish the benchmark's "
+                "tasks to the runners. Run the benchmark against a development "
+                "database with DEBUG enabled, or pass --force."
+            )
+
+        try:
+            tracer = run_benchmark(
+                length=options["length"],
+                width=options["width"],
+                runs=options["runs"],
+                items=options["items"],
+                result_size=options["result_size"],
+            )
+        except RuntimeError as exc:
+            raise CommandError(exc)
+
+        runs = options["runs"]
+        self.stdout.write(
+            f"{'stage':<12}{'calls':>8}{'ms/run':>12}{'ms/call':>10}"
+            f"{'queries/run':>14}{'queries/call':>14}"
+        )
+
+        for stage, stats in tracer.stages.items():
+            self.stdout.write(
+                f"{stage:<12}{stats.calls:>8}"
+                f"{stats.seconds * 1000 / runs:>12.2f}"
+                f"{stats.seconds * 1000 / stats.calls:>10.3f}"
+                f"{stats.queries / runs:>14.1f}"
+                f"{stats.queries / stats.calls:>14.2f}"
+            )
@@ -0,0 +1,34 @@
+import logging
+from time import sleep
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from pika.exceptions import AMQPError
+
+from core.management.commands.utils import run
+from core.utils.messaging import wait_for_connection
+from core.utils.tasking import dispatch_tasks
+
+logger = logging.getLogger(__name__)
+logger.setLevel(getattr(logging, settings.LOG_LEVEL))
+
+
+class Command(BaseCommand):
+    help = "Publish newly created tasks to the runners"
+
+    def handle(self, *args, **kwargs):
+        wait_for_connection()
+        run(_dispatch_forever)
+
+
+def _dispatch_forever() -> None:
+    """Drain the task outbox, waiting for more tasks whenever it is empty"""
+    while True:
+        try:
+            dispatched = dispatch_tasks()
+        except AMQPError as exc:
+            logger.error(f"Unable to publish tasks: {exc!r}")
+            dispatched = 0
+
+        if dispatched < settings.TASK_DISPATCH_BATCH_SIZE:
+            sleep(settings.TASK_DISPATCH_INTERVAL)
@@ -1,11 +1,17 @@
 from .environment import Environment  # noqa
 from .function import Function  # noqa
-from .mixins import ModelSaveHookMixin  # noqa
+from .mixins import (  # noqa
+    ModelSaveHookMixin,
+    VersionedParametersMixin,
+    VersionFieldsMixin,
+)
 from .package import Package  # noqa
 from .parameter import FunctionParameter, WorkflowParameter  # noqa
 from .scheduled_task import ScheduledTask  # noqa
 from .task import Task  # noqa
+from .task_dispatch import TaskDispatch  # noqa
 from .task_log import TaskLog  # noqa
+from .task_log_chunk import TaskLogChunk  # noqa
 from .task_result import TaskResult  # noqa
 from .team import Team  # noqa
 from .user import User  # noqa
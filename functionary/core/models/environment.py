@@ -2,9 +2,12 @@
 import uuid
 
 from django.db import models
+from django.db.models import F
 
+from core.models.mixins import VersionFieldsMixin
 
-class Environment(models.Model):
+
+class Environment(VersionFieldsMixin):
     """Second tier of a namespacing under Team. Environments act as the primary point
     of association for packages, tasks, etc.
 
@@ -12,13 +15,18 @@ class Environment(models.Model):
         id: unique identifier (UUID)
         name: the name of the environment
         team: the Team that this environment belongs to
+        variables_version: incremented whenever a variable visible in the environment
+                           is changed or removed
     """
 
+    VERSION_FIELDS = ["variables_version"]
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=64)
     team = models.ForeignKey(
         to="Team", related_name="environments", on_delete=models.CASCADE, db_index=True
     )
+    variables_version = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         constraints = [
@@ -30,6 +38,13 @@ class Environment(models.Model):
     def __str__(self):
         return f"{self.team.name} - {self.name}"
 
+    @classmethod
+    def bump_variables_versions(cls, **filters):
+        """Record that the variables of the matching environments have changed"""
+        cls.objects.filter(**filters).update(
+            variables_version=F("variables_version") + 1
+        )
+
     @property
     def variables(self):
         """Retrieve the variables visible in this environment.
@@ -4,6 +4,7 @@ import uuid
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from core.models.mixins import VersionedParametersMixin
 from core.utils.parameter import get_schema
 
 
@@ -16,7 +17,7 @@ def list_of_strings(value):
     )
 
 
-class Function(models.Model):
+class Function(VersionedParametersMixin):
     """Function is a unit of work that can be tasked
 
     Attributes:
@@ -29,7 +30,12 @@ class Function(models.Model):
         description: more details about the function
         variables: list of variable names to set before execution
         return_type: the type of the object being returned
+        resources: limits on the cpus, memory and pids used while running the
+            function
+        timeout: the number of seconds the function may run for
         active: whether the function is currently activated
+        parameters_version: incremented whenever the function's parameters change
+        parameters_updated_at: when the function's parameters last changed
     """
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -44,6 +50,8 @@ class Function(models.Model):
     description = models.TextField(null=True)
     variables = models.JSONField(default=list, validators=[list_of_strings])
     return_type = models.CharField(max_length=64, null=True)
+    resources = models.JSONField(default=dict, blank=True)
+    timeout = models.PositiveIntegerField(null=True, blank=True)
     active = models.BooleanField(default=True)
 
     class Meta:
@@ -1,4 +1,6 @@
-from django.db import transaction
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.functions import Now
 
 
 class ModelSaveHookMixin:
@@ -52,3 +54,63 @@ class ModelSaveHookMixin:
             self.post_save()
 
         return self
+
+
+class VersionFieldsMixin(models.Model):
+    """Abstract model for models with version fields that are only changed by bulk
+    updates, such as the version of their parameter definitions. Regular saves leave
+    the fields listed in VERSION_FIELDS untouched so that saving an instance loaded
+    before a version was bumped does not revert it.
+    """
+
+    VERSION_FIELDS: list[str] = []
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        """Custom save that excludes the version fields from updates"""
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.VERSION_FIELDS
+            ]
+
+        return super().save(*args, **kwargs)
+
+
+class VersionedParametersMixin(VersionFieldsMixin):
+    """Abstract model for models with parameter definitions, such as Function and
+    Workflow. It tracks a version number that is bumped whenever the parameter
+    definitions change, so that anything derived from them can be cached against
+    the version.
+
+    The version is only changed by the bump methods.
+
+    Attributes:
+        parameters_version: incremented whenever a parameter is changed or removed
+        parameters_updated_at: when the parameters were last changed or removed
+    """
+
+    VERSION_FIELDS = ["parameters_version", "parameters_updated_at"]
+
+    parameters_version = models.PositiveIntegerField(default=0, editable=False)
+    parameters_updated_at = models.DateTimeField(auto_now_add=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    @classmethod
+    def bump_parameters_versions(cls, **filters):
+        """Record that the parameter definitions of the matching instances have
+        changed"""
+        cls.objects.filter(**filters).update(
+            parameters_version=F("parameters_version") + 1,
+            parameters_updated_at=Now(),
+        )
+
+    def bump_parameters_version(self):
+        """Record that the parameter definitions have changed"""
+        type(self).bump_parameters_versions(pk=self.pk)
+        self.refresh_from_db(fields=self.VERSION_FIELDS)
@@ -1,7 +1,7 @@
 import uuid
 
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 
 from core.utils.parameter import PARAMETER_TYPE_CHOICES
 
@@ -14,7 +14,13 @@ VALID_PARAMETER_NAME = RegexValidator(
 
 
 class Parameter(models.Model):
-    """Base model for common components of FunctionParameter and WorkflowParameter"""
+    """Base model for common components of FunctionParameter and WorkflowParameter
+
+    Subclasses set owner_field to the name of the foreign key to the Function or
+    Workflow that the parameter belongs to.
+    """
+
+    owner_field: str
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     name = models.CharField(max_length=64, validators=[VALID_PARAMETER_NAME])
@@ -26,6 +32,34 @@ class Parameter(models.Model):
     class Meta:
         abstract = True
 
+    @property
+    def owner(self):
+        """The Function or Workflow that the parameter belongs to"""
+        return getattr(self, self.owner_field)
+
+    def save(self, *args, bump_version: bool = True, **kwargs):
+        """Custom save that bumps the owner's parameters_version
+
+        Args:
+            bump_version: Whether to bump the owner's parameters_version. Callers
+                          that save many parameters at once can pass False and bump
+                          the versions once they are done.
+        """
+        if not bump_version:
+            return super().save(*args, **kwargs)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.owner.bump_parameters_version()
+
+    def delete(self, *args, **kwargs):
+        """Custom delete that bumps the owner's parameters_version"""
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            self.owner.bump_parameters_version()
+
+        return deleted
+
 
 class FunctionParameter(Parameter):
     """Input parameters for Functions
@@ -39,6 +73,8 @@ class FunctionParameter(Parameter):
         required: whether or note the parameter is required
     """
 
+    owner_field = "function"
+
     function = models.ForeignKey(to="Function", on_delete=models.CASCADE)
 
     class Meta:
@@ -61,6 +97,8 @@ class WorkflowParameter(Parameter):
         required: whether or note the parameter is required
     """
 
+    owner_field = "workflow"
+
     workflow = models.ForeignKey(to="Workflow", on_delete=models.CASCADE)
 
     class Meta:
@@ -1,4 +1,5 @@
 """ Task model """
+import json
 import uuid
 from json import JSONDecodeError
 from typing import Optional, Union
@@ -11,6 +12,9 @@ from django.db import models
 from core.models import ModelSaveHookMixin, ScheduledTask
 from core.utils.parameter import validate_parameters
 
+# The number of bytes of log output shown when previewing a large log
+LOG_PREVIEW_SIZE = 1024 * 1024
+
 
 class Task(ModelSaveHookMixin, models.Model):
     """A Task is an individual execution of a function
@@ -26,6 +30,9 @@ class Task(ModelSaveHookMixin, models.Model):
                      should include an environment.
         parameters: JSON representing the parameters that will be passed to the function
         status: tasking status
+        priority: how soon the task is run relative to other waiting tasks
+        timeout: the number of seconds the task may run for, overriding the
+                 function's timeout
         creator: the user that initiated the task
         created_at: task creation timestamp
         updated_at: task updated timestamp
@@ -35,20 +42,46 @@ class Task(ModelSaveHookMixin, models.Model):
     IN_PROGRESS = "IN_PROGRESS"
     COMPLETE = "COMPLETE"
     ERROR = "ERROR"
+    TIMEOUT = "TIMEOUT"
+    CANCELED = "CANCELED"
 
     STATUS_CHOICES = [
         (PENDING, "Pending"),
         (IN_PROGRESS, "In Progress"),
         (COMPLETE, "Complete"),
         (ERROR, "Error"),
+        (TIMEOUT, "Timed Out"),
+        (CANCELED, "Canceled"),
     ]
 
+    FINISHED_STATUSES = [COMPLETE, ERROR, TIMEOUT, CANCELED]
+
+    PRIORITY_LOW = 0
+    PRIORITY_NORMAL = 1
+    PRIORITY_HIGH = 2
+
+    PRIORITY_CHOICES = [
+        (PRIORITY_LOW, "Low"),
+        (PRIORITY_NORMAL, "Normal"),
+        (PRIORITY_HIGH, "High"),
+    ]
+
+    # The task queues are declared with this as their x-max-priority, by both the
+    # core application and the runners. It must match MAX_PRIORITY in
+    # runner/runner/listener.py, as RabbitMQ refuses to declare an existing queue
+    # with different arguments.
+    MAX_PRIORITY = PRIORITY_HIGH
+
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     function = models.ForeignKey(to="Function", on_delete=models.CASCADE)
     environment = models.ForeignKey(to="Environment", on_delete=models.CASCADE)
     parameters = models.JSONField(encoder=DjangoJSONEncoder)
     return_type = models.CharField(max_length=64, null=True)
     status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    priority = models.PositiveSmallIntegerField(
+        choices=PRIORITY_CHOICES, default=PRIORITY_NORMAL
+    )
+    timeout = models.PositiveIntegerField(null=True, blank=True)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -101,35 +134,67 @@ class Task(ModelSaveHookMixin, models.Model):
 
     def post_create(self):
         """Post create hooks"""
-        from core.utils.tasking import publish_task
+        from core.models import TaskDispatch
 
-        publish_task.delay(self.id)
+        # Written in the same transaction as the task, for the dispatcher to publish
+        TaskDispatch.objects.create(task=self)
 
     @property
     def raw_result(self) -> Optional[str]:
         """Convenience property for accessing the result output"""
         try:
-            return self.taskresult.result
+            return self.taskresult.content
         except ObjectDoesNotExist:
             return None
 
     @property
     def result(self) -> Optional[Union[bool, dict, float, int, list, str]]:
         """Convenience property for accessing the result output loaded as JSON"""
-        try:
-            return self.taskresult.json
-        except ObjectDoesNotExist:
+        if (raw_result := self.raw_result) is None:
             return None
+
+        try:
+            return json.loads(raw_result)
         except JSONDecodeError:
-            return self.taskresult.result
+            return raw_result
 
     @property
     def log(self) -> Optional[str]:
-        """Convenience property for accessing the log output"""
+        """Convenience property for accessing the log output. Output streamed in
+        chunks is followed by any output recorded along with the result."""
+        chunks = list(self.log_chunks.values_list("data", flat=True))
+
         try:
-            return self.tasklog.log
+            return "".join(chunks) + self.tasklog.content
         except ObjectDoesNotExist:
-            return None
+            return "".join(chunks) if chunks else None
+
+    @property
+    def log_preview(self) -> Optional[str]:
+        """The start of the log output, without downloading all of a log that is
+        stored outside of the database"""
+        try:
+            if self.tasklog.object_name:
+                return self.tasklog.preview(LOG_PREVIEW_SIZE)
+        except ObjectDoesNotExist:
+            pass
+
+        return self.log
+
+    @property
+    def log_preview_truncated(self) -> bool:
+        """Whether log_preview is only part of the log output"""
+        try:
+            return bool(self.tasklog.object_name) and (
+                self.tasklog.size > LOG_PREVIEW_SIZE
+            )
+        except ObjectDoesNotExist:
+            return False
+
+    @property
+    def run_timeout(self) -> Optional[int]:
+        """The number of seconds the task may run for, if it is limited"""
+        return self.timeout or self.function.timeout
 
     @property
     def variables(self):
@@ -0,0 +1,32 @@
+from django.db import models
+from django.utils import timezone
+
+
+class TaskDispatch(models.Model):
+    """An outbox entry for a Task that has yet to be published to the runners
+
+    Entries are written in the same transaction as their Task, so a committed Task
+    is always published eventually, and are removed once the dispatcher has
+    published the Task.
+
+    Attributes:
+        task: the Task to publish
+        attempts: the number of times publishing the Task has failed
+        available_at: when the entry can next be picked up by the dispatcher
+        created_at: entry creation timestamp
+    """
+
+    task = models.OneToOneField(
+        to="Task", on_delete=models.CASCADE, related_name="dispatch"
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["available_at"], name="task_dispatch_available_at")
+        ]
+
+    def __str__(self):
+        return str(self.task_id)
@@ -1,9 +1,18 @@
 from django.db import models
 
+from core.models.task_output import TaskOutput
 
-class TaskLog(models.Model):
-    """Log output from the execution of a Task"""
 
-    task = models.OneToOneField(primary_key=True, to="Task", on_delete=models.CASCADE)
+class TaskLog(TaskOutput):
+    """Log output from the execution of a Task
+
+    Attributes:
+        log: the log output, when it is kept in the database
+        folded_sequence: the sequence of the last streamed log chunk that was folded
+                         into the stored log, if any were
+    """
+
+    content_field = "log"
+
     log = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    folded_sequence = models.PositiveIntegerField(blank=True, null=True)
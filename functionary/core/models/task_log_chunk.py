@@ -0,0 +1,27 @@
+from django.db import models
+
+
+class TaskLogChunk(models.Model):
+    """A chunk of log output streamed from the execution of a Task
+
+    Attributes:
+        task: the Task that produced the output
+        sequence: the position of the chunk within the Task's output
+        data: the log output
+        created_at: chunk creation timestamp
+    """
+
+    task = models.ForeignKey(
+        to="Task", on_delete=models.CASCADE, related_name="log_chunks"
+    )
+    sequence = models.PositiveIntegerField()
+    data = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["task", "sequence"], name="task_log_chunk_sequence_unique"
+            )
+        ]
+        ordering = ["task", "sequence"]
@@ -0,0 +1,56 @@
+from django.db import models
+
+
+class TaskOutput(models.Model):
+    """Base model for the output of a Task, such as its log or result
+
+    Output above the configured size threshold is stored compressed in the S3 bucket
+    of the Task's environment rather than in the database. In that case only the
+    object_name and size are kept in the row and the content is downloaded when it is
+    accessed.
+
+    Attributes:
+        task: the Task that produced the output
+        object_name: name of the stored object when the output is not in the database
+        size: size of the output in bytes
+        created_at: creation timestamp
+    """
+
+    # Name of the field on the concrete model that holds output kept in the database
+    content_field = ""
+
+    task = models.OneToOneField(primary_key=True, to="Task", on_delete=models.CASCADE)
+    object_name = models.CharField(max_length=255, blank=True, null=True)
+    size = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def content(self) -> str:
+        """The output, downloaded from the S3 bucket if necessary"""
+        if not self.object_name:
+            return getattr(self, self.content_field)
+
+        return self._download().decode()
+
+    def preview(self, length: int) -> str:
+        """Get the start of the output without downloading all of it
+
+        Args:
+            length: The maximum number of bytes of output to return
+
+        Returns:
+            Up to length bytes of the output
+        """
+        if not self.object_name:
+            return getattr(self, self.content_field)[:length]
+
+        return self._download(max_length=length).decode(errors="ignore")
+
+    def _download(self, max_length: int = 0) -> bytes:
+        from core.utils.minio import MinioInterface
+
+        minio = MinioInterface(bucket_name=str(self.task.environment_id))
+        return minio.get_compressed_file(self.object_name, max_length) or b""
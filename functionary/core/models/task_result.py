@@ -2,15 +2,17 @@ import json
 
 from django.db import models
 
+from core.models.task_output import TaskOutput
 
-class TaskResult(models.Model):
+
+class TaskResult(TaskOutput):
     """Results from the execution of a Task"""
 
-    task = models.OneToOneField(primary_key=True, to="Task", on_delete=models.CASCADE)
+    content_field = "result"
+
     result = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
 
     @property
     def json(self):
         """Return the result as loaded JSON rather than the raw string"""
-        return json.loads(self.result)
+        return json.loads(self.content)
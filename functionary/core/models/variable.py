@@ -1,8 +1,9 @@
 """ Package model """
 import uuid
 
+from django.apps import apps
 from django.core.validators import RegexValidator
-from django.db import models
+from django.db import models, transaction
 
 VALID_VARIABLE_NAME = RegexValidator(
     regex="^[A-Z_][A-Z0-9_]*$",
@@ -63,6 +64,31 @@ class Variable(models.Model):
             ),
         ]
 
+    def save(self, *args, **kwargs):
+        """Custom save that invalidates the cached variables of the affected
+        environments"""
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self._bump_environment_variables_versions()
+
+    def delete(self, *args, **kwargs):
+        """Custom delete that invalidates the cached variables of the affected
+        environments"""
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            self._bump_environment_variables_versions()
+
+        return deleted
+
+    def _bump_environment_variables_versions(self):
+        """Team variables are visible in all of the team's environments"""
+        Environment = apps.get_model("core", "Environment")
+
+        if self.team_id is not None:
+            Environment.bump_variables_versions(team_id=self.team_id)
+        else:
+            Environment.bump_variables_versions(id=self.environment_id)
+
     @property
     def parent(self):
         return self.team if self.team is not None else self.environment
@@ -3,9 +3,12 @@ import uuid
 from django.conf import settings
 from django.db import models
 
+from core.models.mixins import VersionedParametersMixin
 
-class Workflow(models.Model):
-    """A Workflow defines a series of tasks to be executed in sequence.
+
+class Workflow(VersionedParametersMixin):
+    """A Workflow defines a series of tasks to be executed in sequence, or as a graph
+    of steps that each run once the steps they depend on have completed.
 
     Attributes:
         id: unique identifier (UUID)
@@ -16,6 +19,8 @@ class Workflow(models.Model):
         creator: the user that initiated the task
         created_at: task creation timestamp
         updated_at: task updated timestamp
+        parameters_version: incremented whenever the workflow's parameters change
+        parameters_updated_at: when the workflow's parameters last changed
     """
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -64,6 +69,32 @@ class Workflow(models.Model):
 
         return steps
 
+    def get_dependencies(self) -> dict[uuid.UUID, set[uuid.UUID]]:
+        """Determines the steps that each step of the Workflow depends on
+
+        Steps that declare the steps they depend on depend on exactly those, so steps
+        that do not depend on each other run at the same time. Steps that declare
+        none depend on the step before them, so a workflow without any declared
+        dependencies runs its steps in sequence.
+
+        Returns:
+            The ids of the steps that each step depends on, keyed by the step's id
+        """
+        steps = list(self.steps.values_list("id", "next"))
+        declared = self.steps.model.depends_on.through.objects.filter(
+            from_workflowstep__workflow=self
+        ).values_list("from_workflowstep", "to_workflowstep")
+        dependencies = {step_id: set() for step_id, _ in steps}
+
+        for step_id, dependency_id in declared:
+            dependencies[step_id].add(dependency_id)
+
+        for step_id, next_id in steps:
+            if next_id is not None and not dependencies[next_id]:
+                dependencies[next_id].add(step_id)
+
+        return dependencies
+
     @property
     def parameters(self):
         """Convenience alias for workflowparameter_set"""
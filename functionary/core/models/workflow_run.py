@@ -1,20 +1,27 @@
-import json
+import logging
 import uuid
-from typing import Optional
+from collections import defaultdict
+from typing import Any, Optional
 
 from django.conf import settings
 from django.core.serializers.json import DjangoJSONEncoder
-from django.db import models
+from django.db import models, transaction
 from django.template import Context
 
 from core.models import Task
 from core.utils.parameter import validate_parameters
+from core.utils.template import get_template_context
+
+# The statuses of tasks that fail the WorkflowRun they are part of
+FAILED_STATUSES = (Task.ERROR, Task.TIMEOUT, Task.CANCELED)
+
+logger = logging.getLogger(__name__)
 
 
 class WorkflowRun(models.Model):
-    """A WorkflowRun represents an run of a Workflow. When a WorkflowRun
-    is created a task will be created for each of its WorkflowSteps, in order of their
-    sequence number.
+    """A WorkflowRun represents an run of a Workflow. A task is created for each of
+    its WorkflowSteps once the steps that it depends on have completed, so steps that
+    do not depend on each other run at the same time.
 
     Attributes:
         id: unique identifier (UUID)
@@ -23,6 +30,10 @@ class WorkflowRun(models.Model):
                      should include an environment.
         status: tasking status
         parameters: parameters that can be referenced by the steps in the WorkflowRun
+        context: the results of the steps that have completed, keyed by step name.
+                 Results are merged in as the run advances past their tasks, so that
+                 executing a step does not need to load the result of every step
+                 before it.
         creator: the user that initiated the task
         created_at: task creation timestamp
         updated_at: task updated timestamp
@@ -37,6 +48,7 @@ class WorkflowRun(models.Model):
         max_length=16, choices=Task.STATUS_CHOICES, default=Task.PENDING
     )
     parameters = models.JSONField(blank=True, null=True, encoder=DjangoJSONEncoder)
+    context = models.JSONField(default=dict, blank=True, encoder=DjangoJSONEncoder)
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.PROTECT)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -57,27 +69,69 @@ class WorkflowRun(models.Model):
             ),
         ]
 
-    def get_context(self) -> Context:
-        """Generates a context for resolving tasking parameters.
+    def get_results(self) -> dict[str, Any]:
+        """Gathers the parameters and step results of the WorkflowRun, which step
+        parameter templates and map_over references are resolved against
 
         Returns:
-            A Context containing data from all WorkflowRunSteps that have
-            occurred for this WorkflowRun
+            A dict of the parameters, under "parameters", and of the result of each
+            step that has completed, under the step's name. The result of a step that
+            maps over a list is the list of the results of its tasks.
         """
-        context = {"parameters": {}}
+        return {**self.context, "parameters": self.parameters or {}}
+
+    def _has_result(self, name: str, map_index: Optional[int]) -> bool:
+        """Whether the context holds the result of the named step's task"""
+        if (merged := self.context.get(name)) is None:
+            return False
 
-        parameters = self.parameters or {}
-        for key, value in parameters.items():
-            context["parameters"][key] = json.dumps(value)
+        if map_index is None:
+            return True
 
-        for step in self.steps.all():
-            name = step.workflow_step.name
-            task = step.task
+        results = merged["result"]
 
-            context[name] = {}
-            context[name]["result"] = task.result
+        # A task that returned null is merged again, which is harmless
+        return map_index < len(results) and results[map_index] is not None
 
-        return Context(context)
+    def _merge_results(self, task_ids: list[uuid.UUID]) -> None:
+        """Merge the results of completed tasks of the WorkflowRun into its context"""
+        if not task_ids:
+            return
+
+        run_steps = self.steps.select_related(
+            "task__taskresult", "workflow_step"
+        ).filter(workflow_step__isnull=False, task__in=task_ids)
+
+        for run_step in run_steps:
+            name = run_step.workflow_step.name
+            result = run_step.task.result
+
+            if (index := run_step.map_index) is None:
+                self.context[name] = {"result": result}
+                continue
+
+            # The tasks of a mapped step can finish in any order
+            results = self.context.setdefault(name, {"result": []})["result"]
+            results.extend([None] * (index + 1 - len(results)))
+            results[index] = result
+
+    def get_context(self, results: Optional[dict] = None, **extra) -> Context:
+        """Generates a context for resolving tasking parameters.
+
+        Args:
+            results: The WorkflowRun's results, as returned by get_results. Fetched
+                     when not provided.
+            extra: Additional JSON values to make available, such as the item that a
+                   mapped step is run for
+
+        Returns:
+            A Context containing data from all WorkflowRunSteps that have
+            occurred for this WorkflowRun
+        """
+        if results is None:
+            results = self.get_results()
+
+        return get_template_context(results, **extra)
 
     def _update_status(self, status: str) -> None:
         if self.status != status:
@@ -100,12 +154,11 @@ class WorkflowRun(models.Model):
         """Set the WorkflowRun status to IN_PROGRESS"""
         self._update_status(Task.IN_PROGRESS)
 
-    def execute(self) -> Optional[Task]:
-        """Executes the first step in the Workflow
+    def execute(self) -> list[Task]:
+        """Executes the steps of the Workflow that depend on no other steps
 
         Returns:
-            The Task spawned for the next step in the Workflow. Returns None if there
-            are no more remaining steps to be run.
+            The Tasks spawned for the steps
         Raises:
             Exception: The WorkflowRun has already been started
         """
@@ -115,4 +168,109 @@ class WorkflowRun(models.Model):
 
         self.in_progress()
 
-        return self.workflow.first_step.execute(workflow_run=self)
+        return self.advance()
+
+    def advance(self) -> list[Task]:
+        """Executes every step whose dependencies have completed, or updates the
+        status of the WorkflowRun once all of its steps have completed or one of them
+        has failed
+
+        The results of any completed tasks that are not yet in the context are merged
+        into it first. Which tasks have completed is decided from their statuses, so
+        a result is merged even if advancing the run failed when its task finished.
+
+        The WorkflowRun is locked while this happens, so that when several of its
+        tasks finish at once, their results are all merged into the context and the
+        steps that follow them are only executed once.
+
+        Returns:
+            The Tasks spawned for the steps that were executed
+        """
+        with transaction.atomic():
+            self.status, self.context = (
+                WorkflowRun.objects.select_for_update()
+                .values_list("status", "context")
+                .get(pk=self.pk)
+            )
+
+            if self.status != Task.IN_PROGRESS:
+                return []
+
+            statuses = defaultdict(list)
+            unmerged = []
+
+            for step_id, name, map_index, task_id, status in self.steps.filter(
+                workflow_step__isnull=False
+            ).values_list(
+                "workflow_step",
+                "workflow_step__name",
+                "map_index",
+                "task",
+                "task__status",
+            ):
+                statuses[step_id].append(status)
+
+                if status == Task.COMPLETE and not self._has_result(name, map_index):
+                    unmerged.append(task_id)
+
+            self._merge_results(unmerged)
+
+            if any(
+                status in FAILED_STATUSES
+                for step_statuses in statuses.values()
+                for status in step_statuses
+            ):
+                self.error()
+                return []
+
+            try:
+                # Tasks are not kept for steps that fail to execute
+                with transaction.atomic():
+                    started = self._execute_ready_steps(statuses)
+            except ValueError as exc:
+                logger.warning(f"Unable to advance WorkflowRun {self.id}: {exc}")
+                self.error()
+                return []
+
+            self.save(update_fields=["status", "context", "updated_at"])
+
+            return started
+
+    def _execute_ready_steps(self, statuses: dict[uuid.UUID, list]) -> list[Task]:
+        """Execute the steps that have not run yet and whose dependencies have
+        completed, and complete the WorkflowRun if there are none left to run
+
+        Raises:
+            ValueError: A step failed to execute, or steps are left that can never
+                run, such as steps that depend on each other in a cycle
+        """
+        steps = list(self.workflow.steps.select_related("function", "workflow"))
+        dependencies = self.workflow.get_dependencies()
+        completed = {
+            step_id
+            for step_id, step_statuses in statuses.items()
+            if all(status == Task.COMPLETE for status in step_statuses)
+        }
+        waiting = [step for step in steps if step.id not in statuses]
+        started = []
+
+        # A mapped step with nothing to map over completes straight away, which can
+        # make the steps that depend on it ready in turn
+        while ready := [step for step in waiting if dependencies[step.id] <= completed]:
+            for step in ready:
+                waiting.remove(step)
+
+                if tasks := step.execute(self):
+                    started.extend(tasks)
+                else:
+                    completed.add(step.id)
+                    self.context[step.name] = {"result": []}
+
+        if len(completed) == len(steps):
+            self.status = Task.COMPLETE
+        elif not started and statuses.keys() <= completed:
+            # Nothing is running that could make the waiting steps ready
+            names = ", ".join(step.name for step in waiting)
+            raise ValueError(f"Steps {names} can never run")
+
+        return started
@@ -5,7 +5,12 @@ from django.db import models
 
 class WorkflowRunStep(models.Model):
     """A WorkflowRunStep tracks the run of a Task as a part of a
-    Workflow"""
+    Workflow
+
+    Attributes:
+        map_index: The index of the item that the Task was run for, when its step
+                   maps over a list
+    """
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     task = models.OneToOneField(
@@ -19,3 +24,4 @@ class WorkflowRunStep(models.Model):
         on_delete=models.CASCADE,
         related_name="steps",
     )
+    map_index = models.PositiveIntegerField(blank=True, null=True)
@@ -1,13 +1,12 @@
-import json
 import uuid
 from typing import TYPE_CHECKING
 
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.db import models, transaction
-from django.template import Context, Template
 
 from core.models import Task, WorkflowRunStep
+from core.utils.template import get_parameter_template, resolve_reference
 
 if TYPE_CHECKING:
     from core.models import WorkflowRun
@@ -28,12 +27,19 @@ class WorkflowStep(models.Model):
         workflow: the Workflow to which this step belongs
         next: The step that follows this one in the workflow. A value of None indicates
               that this is the final step.
+        depends_on: The steps that must complete before this one runs. When none
+                    are declared, the step depends on the one before it.
+        map_over: A reference to a list, such as step_name.result or
+                  parameters.name. When set, a task is run for each item of the list,
+                  which is available to the parameter_template as {{item}}.
         name: An internal name for the step which can be used as a reference for
               input into other steps of the Workflow.
         function: the function that the task will be an run of
         parameter_template: Stringified JSON representing the parameters that will be
                             passed to the function. May contain django template syntax
                             in place of values (e.g. {{step_name.result}})
+        revision: incremented whenever the step is saved, so that its compiled
+                  parameter_template can be cached
     """
 
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -44,8 +50,13 @@ class WorkflowStep(models.Model):
     next = models.ForeignKey(
         to="WorkflowStep", blank=True, null=True, on_delete=models.PROTECT
     )
+    depends_on = models.ManyToManyField(
+        to="WorkflowStep", blank=True, symmetrical=False, related_name="dependents"
+    )
     function = models.ForeignKey(to="Function", on_delete=models.CASCADE)
     parameter_template = models.TextField(blank=True, null=True)
+    map_over = models.CharField(max_length=256, blank=True, null=True)
+    revision = models.PositiveIntegerField(default=0, editable=False)
 
     class Meta:
         constraints = [
@@ -55,44 +66,72 @@ class WorkflowStep(models.Model):
             ),
         ]
 
-    def _get_parameters(self, context: Context):
-        """Uses a given Context to resolve the parameter_template into a parameters
-        dict
+    def save(self, *args, **kwargs):
+        """Custom save that starts a new revision of the step"""
+        if not self._state.adding:
+            self.revision += 1
+
+        return super().save(*args, **kwargs)
+
+    def _get_map_items(self, results: dict) -> list:
+        """Resolve map_over against the results of a WorkflowRun
+
+        Raises:
+            ValueError: map_over does not refer to a list
         """
+        value = resolve_reference(results, self.map_over)
+
+        if not isinstance(value, list):
+            raise ValueError(f"{self.map_over} of step {self.name} is not a list")
 
-        resolved_parameters = (
-            Template(self.parameter_template or "{}")
-            .render(context)
-            .replace("&quot;", '"')
-        )
+        return value
 
-        return json.loads(resolved_parameters)
+    def execute(self, workflow_run: "WorkflowRun") -> list[Task]:
+        """Executes the Tasks for this step's function and parameters
 
-    def execute(self, workflow_run: "WorkflowRun") -> Task:
-        """Executes a Task based on this step's function and parameters
+        A step that maps over a list executes a Task for each item of the list, and
+        none if the list is empty.
 
         Args:
-            workflow_run: The WorkflowRun that the task belongs to
+            workflow_run: The WorkflowRun that the tasks belong to
 
         Returns:
-            The executed Task
-        """
+            The executed Tasks
 
-        with transaction.atomic():
-            run_context = workflow_run.get_context()
+        Raises:
+            ValueError: map_over does not refer to a list, or the parameter_template
+                is not valid JSON or refers to values that do not exist
+        """
+        results = workflow_run.get_results()
+        parameter_template = get_parameter_template(self)
 
-            task = Task(
-                creator=workflow_run.creator,
-                environment=self.workflow.environment,
-                function=self.function,
-                parameters=self._get_parameters(run_context),
-            ).save()
+        if self.map_over:
+            items = enumerate(self._get_map_items(results))
+        else:
+            items = [(None, None)]
 
-            WorkflowRunStep.objects.create(
-                task=task, workflow_step=self, workflow_run=workflow_run
-            )
+        tasks = []
 
-        return task
+        with transaction.atomic():
+            for index, item in items:
+                extra = {} if index is None else {"item": item, "index": index}
+
+                task = Task(
+                    creator=workflow_run.creator,
+                    environment=self.workflow.environment,
+                    function=self.function,
+                    parameters=parameter_template.render(results, **extra),
+                ).save()
+
+                WorkflowRunStep.objects.create(
+                    task=task,
+                    workflow_step=self,
+                    workflow_run=workflow_run,
+                    map_index=index,
+                )
+                tasks.append(task)
+
+        return tasks
 
     def clean(self):
         if self.workflow.environment != self.function.package.environment:
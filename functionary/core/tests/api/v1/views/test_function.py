@@ -0,0 +1,75 @@
+import pytest
+from django.test.client import Client
+from django.urls import reverse
+
+from core.models import Environment, Function, Package, Team
+from core.utils.parameter import PARAMETER_TYPE
+
+
+@pytest.fixture
+def environment() -> Environment:
+    team = Team.objects.create(name="team")
+    return team.environments.get()
+
+
+@pytest.fixture
+def package(environment: Environment) -> Package:
+    return Package.objects.create(name="testpackage", environment=environment)
+
+
+@pytest.fixture
+def function(package: Package) -> Function:
+    _function = Function.objects.create(
+        name="testfunction",
+        package=package,
+        environment=package.environment,
+    )
+
+    _function.parameters.create(name="prop1", parameter_type=PARAMETER_TYPE.INTEGER)
+
+    return _function
+
+
+@pytest.fixture
+def request_headers(environment: Environment) -> dict:
+    return {"HTTP_X_ENVIRONMENT_ID": str(environment.id)}
+
+
+def test_schema(admin_client: Client, function: Function, request_headers: dict):
+    """The function schema is returned with validators for revalidation"""
+    url = reverse("function-schema", kwargs={"pk": function.id})
+
+    response = admin_client.get(url, **request_headers)
+
+    assert response.status_code == 200
+    assert "prop1" in response.json()["properties"]
+    assert response["ETag"]
+    assert response["Last-Modified"]
+
+
+def test_schema_not_modified(
+    admin_client: Client, function: Function, request_headers: dict
+):
+    """Revalidating an unchanged schema returns a 304"""
+    url = reverse("function-schema", kwargs={"pk": function.id})
+    etag = admin_client.get(url, **request_headers)["ETag"]
+
+    response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag, **request_headers)
+
+    assert response.status_code == 304
+    assert response["ETag"] == etag
+
+
+def test_schema_changed(
+    admin_client: Client, function: Function, request_headers: dict
+):
+    """Changing the function's parameters changes the ETag"""
+    url = reverse("function-schema", kwargs={"pk": function.id})
+    etag = admin_client.get(url, **request_headers)["ETag"]
+
+    function.parameters.create(name="prop2", parameter_type=PARAMETER_TYPE.STRING)
+    response = admin_client.get(url, HTTP_IF_NONE_MATCH=etag, **request_headers)
+
+    assert response.status_code == 200
+    assert response["ETag"] != etag
+    assert "prop2" in response.json()["properties"]
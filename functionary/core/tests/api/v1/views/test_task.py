@@ -6,7 +6,15 @@ from django.test.client import MULTIPART_CONTENT, Client
 from django.urls import reverse
 from rest_framework import status
 
-from core.models import Environment, Function, Package, Task, TaskResult, Team
+from core.models import (
+    Environment,
+    Function,
+    Package,
+    Task,
+    TaskDispatch,
+    TaskResult,
+    Team,
+)
 from core.utils.minio import S3FileUploadError
 from core.utils.parameter import PARAMETER_TYPE
 
@@ -372,3 +380,151 @@ def test_result_type_is_preserved(
     task_result.save()
     response = admin_client.get(url, **request_headers)
     assert type(response.data["result"]) is bool
+
+
+def test_cancel_task(mocker, admin_client: Client, task: Task, request_headers: dict):
+    """Canceling a task returns it as canceled, or a conflict once it has finished"""
+    mocker.patch("core.utils.tasking.send_message")
+    url = f"{reverse('task-list')}{task.id}/cancel/"
+
+    response = admin_client.post(url, **request_headers)
+
+    assert response.status_code == 200
+    assert response.data["status"] == Task.CANCELED
+
+    response = admin_client.post(url, **request_headers)
+
+    assert response.status_code == 409
+
+
+def test_bulk_create_tasks(
+    admin_client: Client,
+    int_function: Function,
+    package: Package,
+    request_headers: dict,
+):
+    """Create many Tasks and queue them for the dispatcher together"""
+    url = reverse("task-bulk")
+
+    task_input = {
+        "function": str(int_function.id),
+        "parameters": [{"prop1": 1}, {"prop1": 2}, {"prop1": 3}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    task_ids = [task["id"] for task in response.data]
+
+    assert response.status_code == 201
+    assert Task.objects.filter(id__in=task_ids).count() == 3
+    assert set(
+        Task.objects.filter(id__in=task_ids).values_list("priority", flat=True)
+    ) == {Task.PRIORITY_LOW}
+    assert TaskDispatch.objects.filter(task_id__in=task_ids).count() == 3
+
+    task_input = {
+        "function_name": int_function.name,
+        "package_name": package.name,
+        "parameters": [{"prop1": 4}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    assert response.status_code == 201
+    assert Task.objects.filter(function=int_function).count() == 4
+
+
+def test_bulk_create_rejects_invalid_parameters(
+    admin_client: Client,
+    int_function: Function,
+    request_headers: dict,
+):
+    """No Tasks are created when any set of parameters is invalid"""
+    url = reverse("task-bulk")
+
+    task_input = {
+        "function": str(int_function.id),
+        "parameters": [{"prop1": 1}, {"prop1": "not an integer"}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    assert response.status_code == 400
+    assert 1 in response.data["parameters"]
+    assert 0 not in response.data["parameters"]
+    assert not Task.objects.filter(function=int_function).exists()
+
+
+def test_bulk_create_rejects_file_parameters(
+    admin_client: Client,
+    file_function: Function,
+    request_headers: dict,
+):
+    """Functions with file parameters can not be executed in bulk"""
+    url = reverse("task-bulk")
+
+    task_input = {
+        "function": str(file_function.id),
+        "parameters": [{"prop1": "file.txt"}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    assert response.status_code == 400
+    assert not Task.objects.filter(function=file_function).exists()
+
+
+def test_bulk_create_only_finds_functions_in_the_environment(
+    admin_client: Client,
+    int_function: Function,
+    package: Package,
+    request_headers: dict,
+):
+    """Functions from other environments are reported as not found"""
+    url = reverse("task-bulk")
+    other_environment = Team.objects.create(name="other").environments.get()
+    other_package = Package.objects.create(
+        name=package.name, environment=other_environment
+    )
+    other_function = Function.objects.create(
+        name=int_function.name,
+        package=other_package,
+        environment=other_environment,
+    )
+    other_function.parameters.create(
+        name="prop1", parameter_type=PARAMETER_TYPE.INTEGER
+    )
+
+    task_input = {
+        "function_name": int_function.name,
+        "package_name": package.name,
+        "parameters": [{"prop1": 1}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    assert response.status_code == 201
+    assert Task.objects.filter(function=int_function).count() == 1
+
+    task_input = {
+        "function": str(other_function.id),
+        "parameters": [{"prop1": 1}],
+    }
+
+    response = admin_client.post(
+        url, data=task_input, content_type="application/json", **request_headers
+    )
+
+    assert response.status_code == 400
+    assert "function" in response.data
+    assert not Task.objects.filter(function=other_function).exists()
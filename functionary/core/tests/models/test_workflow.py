@@ -1,7 +1,19 @@
+import json
+
 import pytest
 from django.core.exceptions import ValidationError
 
-from core.models import Function, Package, Team, User, Workflow, WorkflowRun
+from core.models import (
+    Function,
+    Package,
+    Task,
+    TaskResult,
+    Team,
+    User,
+    Workflow,
+    WorkflowRun,
+    WorkflowStep,
+)
 from core.utils.parameter import PARAMETER_TYPE
 
 
@@ -71,6 +83,53 @@ def workflow(function, environment, user):
     return _workflow
 
 
+@pytest.fixture
+def parallel_workflow(function, environment, user):
+    """Two steps that each depend on nothing, followed by one that depends on both"""
+    _workflow = Workflow.objects.create(
+        environment=environment, name="parallel", creator=user
+    )
+
+    left = _workflow.steps.create(
+        name="left", function=function, parameter_template='{"prop1": 1}'
+    )
+    right = _workflow.steps.create(
+        name="right", function=function, parameter_template='{"prop1": 2}'
+    )
+    join = _workflow.steps.create(
+        name="join",
+        function=function,
+        parameter_template='{"prop1": {{left.result}}}',
+    )
+    join.depends_on.set([left, right])
+
+    return _workflow
+
+
+def _run(workflow, parameters=None):
+    return WorkflowRun.objects.create(
+        workflow=workflow,
+        environment=workflow.environment,
+        parameters=parameters,
+        creator=workflow.creator,
+    )
+
+
+def _finish(tasks, result=None, status=Task.COMPLETE):
+    for task in tasks:
+        task.status = status
+        task.save()
+        TaskResult.objects.create(task=task, result=json.dumps(result))
+
+    return tasks
+
+
+def _advance(run, tasks, result=None, status=Task.COMPLETE):
+    _finish(tasks, result, status)
+
+    return run.advance()
+
+
 @pytest.mark.django_db
 def test_first_step(workflow):
     """The first step in the workflow is properly determined"""
@@ -103,3 +162,173 @@ def test_workflow_run_parameters_validation(workflow):
 
     with pytest.raises(ValidationError):
         run.clean()
+
+
+@pytest.mark.django_db
+def test_workflow_run_executes_steps_in_sequence(workflow):
+    """Without declared dependencies, each step runs once the one before completes"""
+    run = _run(workflow)
+
+    tasks = run.execute()
+    assert [task.parameters for task in tasks] == [{"prop1": 1}]
+
+    tasks = _advance(run, tasks)
+    assert [task.parameters for task in tasks] == [{"prop1": 2}]
+
+    tasks = _advance(run, tasks)
+    assert _advance(run, tasks) == []
+    assert run.status == Task.COMPLETE
+
+
+@pytest.mark.django_db
+def test_workflow_run_executes_independent_steps_together(parallel_workflow):
+    """Steps run as soon as the steps they depend on have completed"""
+    run = _run(parallel_workflow)
+
+    left, right = sorted(run.execute(), key=lambda task: task.parameters["prop1"])
+
+    assert _advance(run, [left], result=7) == []
+
+    (join,) = _advance(run, [right])
+    assert join.parameters == {"prop1": 7}
+
+    _advance(run, [join])
+    assert run.status == Task.COMPLETE
+
+
+@pytest.mark.django_db
+def test_workflow_run_backfills_missing_results(parallel_workflow):
+    """Results of tasks that completed without the run advancing are still merged
+    before the steps that depend on them run"""
+    run = _run(parallel_workflow)
+
+    left, right = sorted(run.execute(), key=lambda task: task.parameters["prop1"])
+    _finish([left], result=7)
+
+    (join,) = _advance(run, [right])
+    assert join.parameters == {"prop1": 7}
+    assert run.context["left"] == {"result": 7}
+
+
+@pytest.mark.django_db
+def test_workflow_run_errors_when_a_step_fails(parallel_workflow):
+    """A failed task fails the run, and no further steps are executed"""
+    run = _run(parallel_workflow)
+
+    left, right = run.execute()
+    _finish([left], status=Task.TIMEOUT)
+
+    assert _advance(run, [right]) == []
+    assert run.status == Task.ERROR
+
+
+@pytest.mark.django_db
+def test_workflow_run_context_is_merged_incrementally(
+    parallel_workflow, django_assert_num_queries
+):
+    """Step results are merged into the stored context as their tasks finish, and
+    the context is read without loading the results of earlier steps"""
+    run = _run(parallel_workflow)
+    left, right = sorted(run.execute(), key=lambda task: task.parameters["prop1"])
+
+    _advance(run, [left], result={"a": 1})
+    _advance(run, [right], result=[2])
+
+    run.refresh_from_db()
+    assert run.context == {"left": {"result": {"a": 1}}, "right": {"result": [2]}}
+
+    with django_assert_num_queries(0):
+        results = run.get_results()
+
+    assert results["left"] == {"result": {"a": 1}}
+
+
+@pytest.mark.django_db
+def test_mapped_step_runs_a_task_for_each_item(parallel_workflow):
+    """A step that maps over a list runs a task for each item, and its result is the
+    list of the task results"""
+    parallel_workflow.parameters.create(
+        name="values", parameter_type=PARAMETER_TYPE.JSON
+    )
+    join = parallel_workflow.steps.get(name="join")
+    join.map_over = "parameters.values"
+    join.parameter_template = '{"prop1": {{item}}}'
+    join.save()
+    last = parallel_workflow.steps.create(
+        name="last",
+        function=join.function,
+        parameter_template='{"prop1": {{join.result|length}}}',
+    )
+    last.depends_on.set([join])
+    run = _run(parallel_workflow, parameters={"values": [4, 5, 6]})
+
+    mapped = _advance(run, run.execute())
+    assert [task.parameters["prop1"] for task in mapped] == [4, 5, 6]
+
+    for task in reversed(mapped):
+        finished = _advance(run, [task], result=task.parameters["prop1"] * 2)
+
+    assert run.get_results()["join"] == {"result": [8, 10, 12]}
+    (task,) = finished
+    assert task.parameters == {"prop1": 3}
+
+
+@pytest.mark.django_db
+def test_mapped_step_over_an_empty_list_completes(parallel_workflow):
+    """Mapping over an empty list runs no tasks and lets the run complete"""
+    join = parallel_workflow.steps.get(name="join")
+    join.map_over = "left.result"
+    join.save()
+    run = _run(parallel_workflow)
+
+    assert _advance(run, run.execute(), result=[]) == []
+    assert run.status == Task.COMPLETE
+    assert run.get_results()["join"] == {"result": []}
+
+
+@pytest.mark.django_db
+def test_mapped_step_over_a_non_list_errors(parallel_workflow):
+    """Mapping over something other than a list fails the run"""
+    join = parallel_workflow.steps.get(name="join")
+    join.map_over = "left.result"
+    join.save()
+    run = _run(parallel_workflow)
+
+    assert _advance(run, run.execute(), result="not a list") == []
+    assert run.status == Task.ERROR
+    assert not run.steps.filter(workflow_step=join).exists()
+
+
+@pytest.mark.django_db
+def test_unresolved_reference_errors(parallel_workflow):
+    """A parameter template that refers to a value that does not exist fails the
+    run"""
+    join = parallel_workflow.steps.get(name="join")
+    join.parameter_template = '{"prop1": {{left.result.missing}}}'
+    join.save()
+    run = _run(parallel_workflow)
+
+    assert _advance(run, run.execute(), result={"present": 1}) == []
+    assert run.status == Task.ERROR
+    assert not run.steps.filter(workflow_step=join).exists()
+
+
+@pytest.mark.django_db
+def test_workflow_run_errors_when_steps_can_never_run(workflow):
+    """A run whose remaining steps depend on each other in a cycle errors rather
+    than waiting forever"""
+    first = workflow.steps.get(name="first")
+    middle = workflow.steps.get(name="middle")
+    last = workflow.steps.get(name="last")
+
+    # Bypass validation to build steps that wait on each other
+    WorkflowStep.objects.filter(pk=last.pk).update(next=middle)
+    WorkflowStep.objects.filter(pk=middle.pk).update(next=last)
+    WorkflowStep.objects.filter(pk=first.pk).update(next=None)
+    run = _run(workflow)
+
+    tasks = run.execute()
+
+    assert len(tasks) == 1
+    assert _advance(run, tasks) == []
+    assert run.status == Task.ERROR
@@ -0,0 +1,23 @@
+import pytest
+
+from core.models import Team, Workflow
+from core.utils.benchmark import run_benchmark
+
+
+@pytest.mark.django_db(transaction=True)
+def test_run_benchmark():
+    """Workflows run to completion through the stand-ins, each stage is measured, and
+    nothing the benchmark created is left behind"""
+    tracer = run_benchmark(length=3, width=2, runs=2, items=4, result_size=16)
+    stages = tracer.stages
+
+    assert stages["workflow"].calls == 2
+    assert stages["execute"].calls == 2
+    # One round for each layer and one for the mapped step
+    assert stages["record"].calls == 2 * 4
+    assert stages["render"].calls == 2 * (3 * 2 + 4)
+    assert stages["serialize"].calls == 2 * (3 * 2 + 4)
+    assert stages["advance"].queries > 0
+    assert stages["render"].queries == 0
+    assert not Workflow.objects.exists()
+    assert not Team.objects.exists()
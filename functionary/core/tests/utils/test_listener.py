@@ -0,0 +1,184 @@
+import json
+import threading
+
+import pytest
+from django.db import OperationalError
+from pika.spec import Basic, BasicProperties
+
+from core.utils.listener import ResultConsumer, start_listening
+from core.utils.messaging import TASK_RESULTS_QUEUE
+
+
+@pytest.fixture
+def record_task_results(mocker):
+    return mocker.patch("core.utils.listener.record_task_results")
+
+
+@pytest.fixture
+def consumer(mocker) -> ResultConsumer:
+    return ResultConsumer(mocker.MagicMock(), batch_size=3, batch_window=1)
+
+
+def _deliver(consumer: ResultConsumer, delivery_tag: int, msg_type="TASK_RESULT"):
+    consumer.on_message(
+        consumer.channel,
+        Basic.Deliver(delivery_tag=delivery_tag),
+        BasicProperties(headers={"x-msg-type": msg_type}),
+        json.dumps({"task_id": delivery_tag}).encode(),
+    )
+
+
+@pytest.mark.django_db
+def test_batch_is_recorded_when_full(consumer, record_task_results):
+    """A full batch is recorded at once and acked with a single multiple ack"""
+    _deliver(consumer, 1)
+    _deliver(consumer, 2)
+
+    record_task_results.assert_not_called()
+    consumer.channel.connection.ioloop.call_later.assert_called_once_with(
+        1, consumer.flush
+    )
+
+    _deliver(consumer, 3)
+
+    record_task_results.assert_called_once_with(
+        [{"task_id": 1}, {"task_id": 2}, {"task_id": 3}]
+    )
+    consumer.channel.basic_ack.assert_called_once_with(3, multiple=True)
+    consumer.channel.connection.ioloop.remove_timeout.assert_called_once()
+
+
+@pytest.mark.django_db
+def test_partial_batch_is_recorded_by_timer(consumer, record_task_results):
+    """A partial batch is recorded when the batch window ends"""
+    _deliver(consumer, 1)
+
+    consumer.flush()
+
+    record_task_results.assert_called_once_with([{"task_id": 1}])
+    consumer.channel.basic_ack.assert_called_once_with(1, multiple=True)
+
+
+@pytest.mark.django_db
+def test_log_chunks_are_recorded_first(mocker, consumer, record_task_results):
+    """Log chunks are recorded ahead of the results in the same batch"""
+    manager = mocker.MagicMock()
+    manager.attach_mock(record_task_results, "results")
+    manager.attach_mock(
+        mocker.patch("core.utils.listener.record_task_log_chunks"), "chunks"
+    )
+
+    _deliver(consumer, 1, "TASK_RESULT")
+    _deliver(consumer, 2, "TASK_LOG_CHUNK")
+    consumer.flush()
+
+    assert [call[0] for call in manager.mock_calls] == ["chunks", "results"]
+
+
+@pytest.mark.django_db
+def test_failed_batch_is_recorded_individually(consumer, record_task_results):
+    """Messages in a failed batch are retried alone and bad ones are rejected"""
+    record_task_results.side_effect = [Exception("batch"), None, Exception("bad")]
+
+    _deliver(consumer, 1)
+    _deliver(consumer, 2)
+    consumer.flush()
+
+    consumer.channel.basic_ack.assert_called_once_with(1, multiple=True)
+    consumer.channel.basic_reject.assert_called_once_with(2, requeue=False)
+
+
+@pytest.mark.django_db
+def test_recorded_messages_are_acked_together(consumer, record_task_results):
+    """Messages recorded individually are acked with a single multiple ack"""
+    record_task_results.side_effect = [Exception("batch"), Exception("bad"), None, None]
+
+    _deliver(consumer, 1)
+    _deliver(consumer, 2)
+    _deliver(consumer, 3)
+
+    consumer.channel.basic_reject.assert_called_once_with(1, requeue=False)
+    consumer.channel.basic_ack.assert_called_once_with(3, multiple=True)
+
+
+@pytest.mark.django_db
+def test_database_errors_requeue_with_backoff(consumer, record_task_results):
+    """Messages that fail while the database is unavailable are requeued after a delay
+    that grows with each failure, rather than rejected"""
+    ioloop = consumer.channel.connection.ioloop
+    record_task_results.side_effect = OperationalError("down")
+
+    _deliver(consumer, 1)
+    consumer.flush()
+    _deliver(consumer, 2)
+    consumer.flush()
+
+    requeues = [
+        call.args
+        for call in ioloop.call_later.call_args_list
+        if call.args[1] != consumer.flush
+    ]
+
+    consumer.channel.basic_reject.assert_not_called()
+    consumer.channel.basic_nack.assert_not_called()
+    assert [delay for delay, _ in requeues] == [
+        consumer.retry_delay,
+        consumer.retry_delay * 2,
+    ]
+
+    requeues[0][1]()
+
+    consumer.channel.basic_nack.assert_called_once_with(1, requeue=True)
+
+
+@pytest.mark.django_db
+def test_recorded_messages_skip_requeueing_ones(consumer, record_task_results):
+    """Acking recorded messages does not also ack earlier ones waiting to be
+    requeued"""
+    record_task_results.side_effect = [OperationalError("down"), None]
+
+    _deliver(consumer, 1)
+    consumer.flush()
+    _deliver(consumer, 2)
+    consumer.flush()
+
+    consumer.channel.basic_ack.assert_called_once_with(2)
+
+
+def test_prefetch_is_set_before_consuming(mocker):
+    """The prefetch count is applied to the channel and is at least the batch size"""
+    consumer = ResultConsumer(
+        mocker.MagicMock(), batch_size=10, batch_window=1, prefetch_count=5
+    )
+
+    consumer.start()
+
+    assert consumer.channel.method_calls[:2] == [
+        mocker.call.basic_qos(prefetch_count=10),
+        mocker.call.basic_consume(TASK_RESULTS_QUEUE, consumer.on_message),
+    ]
+
+
+def test_connection_per_consumer(mocker):
+    """Each consumer has its own connection, whose ioloop runs in its own thread"""
+    connections = [
+        mocker.MagicMock(is_closing=False, is_closed=False) for _ in range(3)
+    ]
+    build_connection = mocker.patch(
+        "core.utils.listener.build_connection", side_effect=connections
+    )
+    threads = set()
+
+    for connection in connections:
+        connection.ioloop.start.side_effect = lambda: threads.add(
+            threading.current_thread()
+        )
+
+    start_listening(consumers=3)
+
+    assert build_connection.call_count == 3
+    assert len(threads) == 3
+    assert threading.current_thread() not in threads
+
+    for connection in connections:
+        connection.ioloop.add_callback_threadsafe.assert_called_once()
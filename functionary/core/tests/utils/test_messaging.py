@@ -0,0 +1,319 @@
+import uuid
+
+import pytest
+from pika.exceptions import (
+    AMQPConnectionError,
+    ChannelClosedByBroker,
+    NackError,
+    StreamLostError,
+    UnroutableError,
+)
+from pika.frame import Method
+from pika.spec import Basic, BasicProperties
+
+from core.models import Task
+from core.utils.messaging import (
+    PUBLIC_EXCHANGE,
+    PUBLIC_QUEUE,
+    BatchPublisher,
+    PublisherPool,
+    _drain_legacy_task_queue,
+    confirm_channel_pool,
+    get_route,
+    publisher_pool,
+    send_message,
+)
+
+
+class FakeBroker:
+    """Drives a ConfirmChannel's callbacks the way a SelectConnection would
+
+    Messages sent to the "unroutable" routing key are returned, messages sent to the
+    "nack" routing key are nacked and all of the rest are acked with a single
+    multiple ack at the end of each batch.
+    """
+
+    def __init__(self, open_callback):
+        self.open_callback = open_callback
+        self.close_callbacks = []
+        self.published = []
+        self.confirmed = 0
+        self.timers = []
+        self.is_open = True
+        self.ioloop = self
+
+    def add_on_close_callback(self, callback):
+        self.close_callbacks.append(callback)
+
+    def start(self):
+        if self.open_callback is not None:
+            open_callback, self.open_callback = self.open_callback, None
+            open_callback(self)
+            return
+
+        for tag, (routing_key, properties, body) in enumerate(self.published, 1):
+            if tag <= self.confirmed:
+                continue
+
+            if routing_key == "unroutable":
+                self.on_return(self, Basic.Return(), properties, body)
+            elif routing_key == "nack":
+                self.on_confirm(Method(1, Basic.Nack(delivery_tag=tag)))
+
+        if self.is_open:
+            self.confirmed = len(self.published)
+            self.on_confirm(
+                Method(1, Basic.Ack(delivery_tag=self.confirmed, multiple=True))
+            )
+
+    def stop(self):
+        pass
+
+    def call_later(self, delay, callback):
+        self.timers.append(callback)
+        return callback
+
+    def remove_timeout(self, timer):
+        self.timers.remove(timer)
+
+    def close(self):
+        self.is_open = False
+
+        for callback in self.close_callbacks:
+            callback(self, "closed")
+
+    def channel(self, on_open_callback):
+        on_open_callback(self)
+
+    def add_on_return_callback(self, callback):
+        self.on_return = callback
+
+    def confirm_delivery(self, ack_nack_callback, callback):
+        self.on_confirm = ack_nack_callback
+        callback(None)
+
+    def basic_publish(self, exchange, routing_key, body, properties, mandatory):
+        self.published.append((routing_key, properties, body))
+
+
+@pytest.fixture
+def build_connection(mocker):
+    mock_build_connection = mocker.patch("core.utils.messaging.build_connection")
+    mock_build_connection.return_value.channel.return_value.is_closed = False
+    mock_build_connection.return_value.channel.return_value.connection.is_closed = False
+
+    publisher_pool.reset()
+    yield mock_build_connection
+    publisher_pool.reset()
+
+
+def test_send_message_reuses_connection(build_connection):
+    """Subsequent messages are published on the same connection"""
+    send_message("exchange", "routing_key", "MSG_TYPE", {"message": 1})
+    send_message("exchange", "routing_key", "MSG_TYPE", {"message": 2})
+
+    channel = build_connection.return_value.channel.return_value
+
+    build_connection.assert_called_once()
+    channel.confirm_delivery.assert_called_once()
+    assert channel.basic_publish.call_count == 2
+
+
+def test_closed_connection_is_replaced(build_connection):
+    """A connection closed since its last use is reopened"""
+    pool = PublisherPool()
+    channel = pool.get_channel()
+    channel.connection.is_closed = True
+
+    pool.get_channel()
+
+    assert build_connection.call_count == 2
+
+
+def test_lost_connection_is_retried(build_connection):
+    """Publishing is retried once on a new connection when the connection is lost"""
+    channel = build_connection.return_value.channel.return_value
+    channel.basic_publish.side_effect = [StreamLostError(), None]
+
+    send_message("exchange", "routing_key", "MSG_TYPE", {})
+
+    assert build_connection.call_count == 2
+    assert channel.basic_publish.call_count == 2
+
+
+def test_unroutable_is_not_retried(build_connection):
+    """Unroutable messages are raised rather than retried"""
+    channel = build_connection.return_value.channel.return_value
+    channel.basic_publish.side_effect = UnroutableError([])
+
+    with pytest.raises(UnroutableError):
+        send_message("exchange", "routing_key", "MSG_TYPE", {})
+
+    build_connection.assert_called_once()
+
+
+def test_reset_forgets_connections(build_connection):
+    """After a reset, such as in a forked child, a new connection is opened"""
+    pool = PublisherPool()
+    pool.get_channel()
+    pool.reset()
+    pool.get_channel()
+
+    assert build_connection.call_count == 2
+
+
+@pytest.fixture
+def fake_broker(mocker):
+    confirm_channel_pool.reset()
+    yield mocker.patch("core.utils.messaging.build_connection", side_effect=FakeBroker)
+    confirm_channel_pool.reset()
+
+
+@pytest.mark.usefixtures("fake_broker")
+def test_batch_publish():
+    """All messages in a batch are published and confirmed"""
+    publisher = BatchPublisher()
+
+    for count in range(3):
+        publisher.add("exchange", "routing_key", "MSG_TYPE", {"count": count})
+
+    assert publisher.publish() == [None, None, None]
+
+
+@pytest.mark.usefixtures("fake_broker")
+def test_batch_publish_errors_per_message():
+    """Unroutable and nacked messages are reported individually"""
+    publisher = BatchPublisher()
+    publisher.add("exchange", "routing_key", "MSG_TYPE", {})
+    publisher.add("exchange", "unroutable", "MSG_TYPE", {})
+    publisher.add("exchange", "nack", "MSG_TYPE", {})
+    publisher.add("exchange", "routing_key", "MSG_TYPE", {})
+
+    errors = publisher.publish()
+
+    assert errors[0] is None
+    assert isinstance(errors[1], UnroutableError)
+    assert isinstance(errors[2], NackError)
+    assert errors[3] is None
+
+
+def test_batches_reuse_connection(fake_broker):
+    """Consecutive batches are published on the same connection"""
+    for _ in range(2):
+        publisher = BatchPublisher()
+        publisher.add("exchange", "routing_key", "MSG_TYPE", {})
+        publisher.add("exchange", "nack", "MSG_TYPE", {})
+
+        errors = publisher.publish()
+
+        assert errors[0] is None
+        assert isinstance(errors[1], NackError)
+
+    fake_broker.assert_called_once()
+
+
+def test_batch_publish_connection_lost(fake_broker):
+    """Messages that were not confirmed before the connection closed are failed, and
+    the next batch opens a new connection"""
+
+    class LostConnection(FakeBroker):
+        def start(self):
+            if self.open_callback is not None:
+                return super().start()
+
+            self.close()
+
+    fake_broker.side_effect = LostConnection
+
+    publisher = BatchPublisher()
+    publisher.add("exchange", "routing_key", "MSG_TYPE", {})
+
+    assert isinstance(publisher.publish()[0], AMQPConnectionError)
+
+    publisher.publish()
+    assert fake_broker.call_count == 2
+
+
+def test_batch_publish_timeout(fake_broker):
+    """Messages that are not confirmed in time are failed and the connection is
+    closed, so that their confirms are not mistaken for those of a later batch"""
+
+    class SilentBroker(FakeBroker):
+        def start(self):
+            if self.open_callback is not None:
+                return super().start()
+
+            for timer in list(self.timers):
+                timer()
+
+    fake_broker.side_effect = SilentBroker
+
+    publisher = BatchPublisher(timeout=1)
+    publisher.add("exchange", "routing_key", "MSG_TYPE", {})
+
+    assert isinstance(publisher.publish()[0], AMQPConnectionError)
+
+    publisher.publish()
+    assert fake_broker.call_count == 2
+
+
+def test_empty_batch_does_not_connect(mocker):
+    """Publishing an empty batch does not open a connection"""
+    build_connection = mocker.patch("core.utils.messaging.build_connection")
+
+    assert BatchPublisher().publish() == []
+    build_connection.assert_not_called()
+
+
+def test_tasks_are_routed_by_environment(mocker, settings):
+    """Tasks are spread over the queues by environment"""
+    settings.TASK_QUEUE_SHARDS = 4
+    environment_ids = [uuid.UUID(int=number) for number in [4, 5, 9]]
+    routes = [
+        get_route(mocker.MagicMock(environment_id=environment_id))
+        for environment_id in environment_ids
+    ]
+
+    assert routes == [
+        (PUBLIC_EXCHANGE, "public.0"),
+        (PUBLIC_EXCHANGE, "public.1"),
+        (PUBLIC_EXCHANGE, "public.1"),
+    ]
+
+
+def test_legacy_task_queue_is_drained(mocker):
+    """Tasks left on the queue used before sharding are moved to the queue of their
+    environment and the old queue is deleted"""
+    task = mocker.MagicMock(environment_id=uuid.UUID(int=5))
+    mocker.patch(
+        "core.utils.messaging.Task.objects.get",
+        side_effect=[task, Task.DoesNotExist("Task matching query does not exist.")],
+    )
+    connection = mocker.MagicMock()
+    channel = connection.channel.return_value
+    properties = BasicProperties(headers={"x-msg-type": "TASK_PACKAGE"})
+    body = f'{{"id": "{uuid.uuid4()}"}}'.encode()
+    channel.basic_get.side_effect = [
+        (Basic.GetOk(delivery_tag=1), properties, body),
+        (Basic.GetOk(delivery_tag=2), properties, body),
+        (None, None, None),
+    ]
+
+    _drain_legacy_task_queue(connection)
+
+    channel.basic_publish.assert_called_once_with(
+        PUBLIC_EXCHANGE, "public.1", body, properties, mandatory=True
+    )
+    assert channel.basic_ack.call_count == 2
+    channel.queue_delete.assert_called_once_with(PUBLIC_QUEUE, if_empty=True)
+
+
+def test_missing_legacy_task_queue_is_skipped(mocker):
+    """Nothing is drained when the queue used before sharding does not exist"""
+    connection = mocker.MagicMock()
+    channel = connection.channel.return_value
+    channel.queue_declare.side_effect = ChannelClosedByBroker(404, "NOT_FOUND")
+
+    _drain_legacy_task_queue(connection)
+
+    channel.basic_get.assert_not_called()
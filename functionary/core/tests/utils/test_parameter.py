@@ -4,7 +4,12 @@ import pytest
 from django.core.exceptions import ValidationError
 
 from core.models import Function, FunctionParameter, Package, Team
-from core.utils.parameter import PARAMETER_TYPE, validate_parameters
+from core.utils.parameter import (
+    PARAMETER_TYPE,
+    ParameterValidator,
+    get_validator,
+    validate_parameters,
+)
 
 
 @pytest.fixture
@@ -127,3 +132,45 @@ def test_datetime_str_parameter(function, datetime_param):
     """Properly formatted strings for datetime parameters successfully validate"""
     datetime_value = "2023-02-27T12:30:00Z"
     validate_parameters({datetime_param.name: datetime_value}, function)
+
+
+@pytest.mark.django_db
+def test_parameter_validator_is_reusable(
+    function, json_param, date_param, django_assert_num_queries
+):
+    """A ParameterValidator validates many sets of parameters without querying"""
+    validator = ParameterValidator(function)
+
+    with django_assert_num_queries(0):
+        validator.validate({json_param.name: {"a": 1}, date_param.name: "2022-01-01"})
+        validator.validate({json_param.name: [1], date_param.name: "2022-01-02"})
+
+        with pytest.raises(ValidationError):
+            validator.validate({json_param.name: [1]})
+
+
+@pytest.mark.django_db
+def test_validators_are_cached_per_parameters_version(function, json_param):
+    """Validators are reused until the parameter definitions change"""
+    validator = get_validator(function)
+
+    assert get_validator(Function.objects.get(id=function.id)) is validator
+
+    json_param.required = False
+    json_param.save()
+
+    assert get_validator(function) is not validator
+    validate_parameters({}, function)
+
+
+@pytest.mark.django_db
+def test_stale_instance_does_not_revert_parameters_version(function, json_param):
+    """Saving an instance loaded before its parameters changed keeps the version"""
+    stale_function = Function.objects.get(id=function.id)
+
+    json_param.delete()
+    stale_function.save()
+    stale_function.refresh_from_db()
+
+    assert stale_function.parameters_version == function.parameters_version
+    validate_parameters({}, stale_function)
@@ -1,7 +1,17 @@
+import io
+
 import pytest
+from constance.test import override_config
+from minio.error import S3Error
+from pika.exceptions import NackError
 
-from core.models import Function, Package, Task, Team, Variable
-from core.utils.tasking import record_task_result
+from core.models import Function, Package, Task, TaskDispatch, TaskLog, Team, Variable
+from core.utils.tasking import (
+    cancel_task,
+    dispatch_tasks,
+    record_task_log_chunks,
+    record_task_results,
+)
 
 
 @pytest.fixture
@@ -71,9 +81,295 @@ def test_output_masking(task):
         "result": "doesntmatter",
     }
 
-    record_task_result(task_result_message)
+    record_task_results([task_result_message])
     task_log = task.tasklog.log
 
     assert task_log.count("hi") == 2
     assert task_log.count("hide me") == 0
     assert task_log.count("Hide me") == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("var3")
+def test_log_chunks(task):
+    """Streamed log chunks are masked and assembled in order, ahead of the output
+    recorded with the result"""
+    for sequence, data in [(1, "second hide me\n"), (0, "first\n"), (1, "dupe\n")]:
+        record_task_log_chunks(
+            [{"task_id": task.id, "sequence": sequence, "data": data}]
+        )
+
+    assert task.log == "first\nsecond ********\n"
+
+    record_task_results([{"task_id": task.id, "status": 0, "result": "null"}])
+
+    assert task.log == "first\nsecond ********\n"
+
+
+class FakeMinio:
+    """In memory stand in for the Minio client"""
+
+    objects = {}
+
+    def __init__(self, **_):
+        pass
+
+    def bucket_exists(self, bucket_name):
+        return True
+
+    def put_object(self, bucket_name, object_name, data, length):
+        self.objects[(bucket_name, object_name)] = data.read(length)
+
+    def stat_object(self, bucket_name, object_name):
+        if (bucket_name, object_name) not in self.objects:
+            raise S3Error("NoSuchKey", "", "", "", "", None)
+
+    def get_object(self, bucket_name, object_name, offset=0, length=0):
+        data = self.objects[(bucket_name, object_name)]
+        end = offset + length if length else None
+        response = io.BytesIO(data[offset:end])
+        response.release_conn = lambda: None
+
+        return response
+
+
+@pytest.fixture
+def fake_minio(mocker):
+    FakeMinio.objects = {}
+    mocker.patch("core.utils.minio.Minio", FakeMinio)
+
+    return FakeMinio.objects
+
+
+@pytest.mark.django_db
+@override_config(TASK_OUTPUT_OFFLOAD_SIZE=100)
+def test_large_output_is_stored_in_s3(task, fake_minio):
+    """Output over the offload size is stored compressed in S3 with the log chunks
+    combined into it"""
+    log_lines = [f"line {number}\n" for number in range(20)]
+    result = '"' + "x" * 200 + '"'
+
+    for sequence, line in enumerate(log_lines):
+        record_task_log_chunks(
+            [{"task_id": task.id, "sequence": sequence, "data": line}]
+        )
+
+    record_task_results([{"task_id": task.id, "status": 0, "result": result}])
+    task = Task.objects.get(id=task.id)
+
+    assert len(fake_minio) == 2
+    assert task.tasklog.object_name and task.tasklog.log == ""
+    assert task.taskresult.object_name and task.taskresult.result == ""
+    assert not task.log_chunks.exists()
+    assert task.log == "".join(log_lines)
+    assert task.result == "x" * 200
+    assert task.tasklog.preview(12) == "line 0\nline "
+
+
+@pytest.mark.django_db
+@override_config(TASK_OUTPUT_OFFLOAD_SIZE=100)
+def test_chunks_after_stored_log_are_dropped(task, fake_minio):
+    """Chunks that arrive after the log chunks were folded into a stored log are not
+    shown ahead of it"""
+    log_lines = [f"line {number}\n" for number in range(20)]
+
+    for sequence, line in enumerate(log_lines):
+        record_task_log_chunks(
+            [{"task_id": task.id, "sequence": sequence, "data": line}]
+        )
+
+    record_task_results([{"task_id": task.id, "status": 0, "result": "null"}])
+
+    for sequence, line in [(3, "redelivered\n"), (20, "late\n")]:
+        record_task_log_chunks(
+            [{"task_id": task.id, "sequence": sequence, "data": line}]
+        )
+
+    task = Task.objects.get(id=task.id)
+
+    assert task.tasklog.folded_sequence == 19
+    assert not task.log_chunks.exists()
+    assert task.log == "".join(log_lines)
+
+
+@pytest.mark.django_db
+@override_config(TASK_OUTPUT_OFFLOAD_SIZE=100)
+def test_log_chunk_sizes_are_counted_in_bytes(task, fake_minio):
+    """Multibyte log output is offloaded by its size in bytes"""
+    record_task_log_chunks([{"task_id": task.id, "sequence": 0, "data": "\u00e9" * 60}])
+    record_task_results([{"task_id": task.id, "status": 0, "result": "null"}])
+    task = Task.objects.get(id=task.id)
+
+    assert task.tasklog.object_name
+    assert task.tasklog.size == 120
+
+
+@pytest.mark.django_db
+@override_config(TASK_OUTPUT_OFFLOAD_SIZE=100)
+def test_small_output_is_stored_in_database(task, fake_minio):
+    """Output under the offload size stays in the database"""
+    record_task_results(
+        [{"task_id": task.id, "status": 0, "output": "small", "result": "1"}]
+    )
+
+    assert not fake_minio
+    assert TaskLog.objects.get(task=task).log == "small"
+    assert task.result == 1
+
+
+@pytest.mark.django_db
+def test_record_task_results_batch(task, function, environment, admin_user):
+    """A batch of results is recorded together and redelivered results are
+    ignored"""
+    failed_task = Task.objects.create(
+        function=function,
+        environment=environment,
+        parameters={},
+        creator=admin_user,
+    )
+    messages = [
+        {"task_id": str(task.id), "status": 0, "output": "ok", "result": "1"},
+        {"task_id": str(failed_task.id), "status": 1, "output": "", "result": "null"},
+    ]
+
+    record_task_results(messages)
+    record_task_results([{**messages[0], "status": 1, "output": "redelivered"}])
+    task.refresh_from_db()
+    failed_task.refresh_from_db()
+
+    assert task.status == Task.COMPLETE
+    assert task.log == "ok"
+    assert task.result == 1
+    assert failed_task.status == Task.ERROR
+
+
+@pytest.mark.django_db
+def test_timed_out_task(task):
+    """A task stopped by the runner for running too long is marked as timed out"""
+    record_task_results(
+        [
+            {
+                "task_id": task.id,
+                "status": 137,
+                "reason": "TIMEOUT",
+                "output": "timed out",
+                "result": "null",
+            }
+        ]
+    )
+    task.refresh_from_db()
+
+    assert task.status == Task.TIMEOUT
+    assert task.log == "timed out"
+
+
+@pytest.mark.django_db
+def test_cancel_task(mocker, task):
+    """Canceling a task marks it as canceled and tells the runners to stop it"""
+    send_message = mocker.patch("core.utils.tasking.send_message")
+
+    assert cancel_task(task)
+    assert task.status == Task.CANCELED
+    send_message.assert_called_once_with(
+        "runners.control", "", "CANCEL_TASK", {"task_id": str(task.id)}
+    )
+
+    # The output of the stopped task is still recorded
+    record_task_results(
+        [{"task_id": task.id, "status": 137, "output": "stopped", "result": "null"}]
+    )
+    task.refresh_from_db()
+
+    assert task.status == Task.CANCELED
+    assert task.log == "stopped"
+
+
+@pytest.mark.django_db
+def test_cancel_finished_task(mocker, task):
+    """A task that has already finished can not be canceled"""
+    send_message = mocker.patch("core.utils.tasking.send_message")
+    task.status = Task.COMPLETE
+    task.save()
+
+    assert not cancel_task(task)
+    send_message.assert_not_called()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("var1")
+def test_dispatch_tasks(mocker, task, function, environment, admin_user):
+    """Tasks waiting in the outbox are published together and removed from it"""
+    canceled_task = Task.objects.create(
+        function=function,
+        environment=environment,
+        parameters={},
+        creator=admin_user,
+        status=Task.CANCELED,
+    )
+    publisher = mocker.patch("core.utils.tasking.BatchPublisher").return_value
+    publisher.publish.return_value = [None]
+
+    assert TaskDispatch.objects.count() == 2
+    assert dispatch_tasks() == 2
+
+    publisher.add.assert_called_once()
+    assert publisher.add.call_args.args[3]["id"] == str(task.id)
+    assert not TaskDispatch.objects.filter(task__in=[task, canceled_task]).exists()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("var1")
+def test_dispatch_failures_are_retried_later(mocker, task):
+    """Tasks that fail to publish stay in the outbox and are retried after a
+    delay"""
+    publisher = mocker.patch("core.utils.tasking.BatchPublisher").return_value
+    publisher.publish.return_value = [NackError([])]
+
+    assert dispatch_tasks() == 1
+    assert dispatch_tasks() == 0
+
+    dispatch = TaskDispatch.objects.get(task=task)
+    assert dispatch.attempts == 1
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("var1")
+def test_dispatch_gives_up_after_max_attempts(
+    mocker, settings, task, django_capture_on_commit_callbacks
+):
+    """Tasks that keep failing to publish are errored and removed from the outbox"""
+    settings.TASK_DISPATCH_MAX_ATTEMPTS = 2
+    handle_workflow_runs = mocker.patch("core.utils.tasking._handle_workflow_runs")
+    publisher = mocker.patch("core.utils.tasking.BatchPublisher").return_value
+    publisher.publish.return_value = [NackError([])]
+    TaskDispatch.objects.filter(task=task).update(attempts=1)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        assert dispatch_tasks() == 1
+
+    task.refresh_from_db()
+    assert task.status == Task.ERROR
+    assert "Unable to publish the task" in task.log
+    assert not TaskDispatch.objects.filter(task=task).exists()
+    handle_workflow_runs.assert_called_once()
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("var1")
+def test_dispatch_tasks_for_environment(mocker, task):
+    """Dispatching for an environment leaves the tasks of the others in the outbox
+    and publishes with the given publisher"""
+    other_environment = Team.objects.create(name="other").environments.get()
+    publisher_factory = mocker.MagicMock()
+    publisher_factory.return_value.publish.return_value = [None]
+
+    assert dispatch_tasks(environment=other_environment) == 0
+    assert (
+        dispatch_tasks(
+            environment=task.environment, publisher_factory=publisher_factory
+        )
+        == 1
+    )
+
+    publisher_factory.return_value.add.assert_called_once()
+    assert not TaskDispatch.objects.filter(task=task).exists()
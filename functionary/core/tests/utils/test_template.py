@@ -0,0 +1,106 @@
+import gc
+import weakref
+
+import pytest
+
+from core.models import Function, Package, Team, User, Workflow
+from core.utils.template import (
+    DjangoTemplate,
+    StructuredTemplate,
+    compile_template,
+    get_parameter_template,
+)
+
+RESULTS = {
+    "parameters": {"count": 3, "name": "widget"},
+    "step": {"result": {"items": [1, 2], "ok": True}},
+}
+
+
+def test_references_are_substituted_structurally():
+    """Referenced values are substituted as they are, whatever their type"""
+    template = compile_template(
+        '{"count": {{parameters.count}}, "result": {{step.result}}, '
+        '"first": {{ step.result.items.0 }}}'
+    )
+
+    assert isinstance(template, StructuredTemplate)
+    assert template.render(RESULTS) == {
+        "count": 3,
+        "result": {"items": [1, 2], "ok": True},
+        "first": 1,
+    }
+
+
+@pytest.mark.parametrize(
+    "reference", ["nothing.here", "step.result.missing", "step.result.items.2", "item"]
+)
+def test_unresolved_references_are_rejected(reference):
+    """References to values that do not exist are errors rather than null"""
+    template = compile_template('{"value": {{' + reference + "}}}")
+
+    with pytest.raises(ValueError):
+        template.render(RESULTS)
+
+
+def test_references_within_strings_are_interpolated():
+    """References within a string are replaced by their text"""
+    template = compile_template(
+        '{"label": "{{parameters.name}} x{{parameters.count}}", '
+        '"quoted": "{{parameters.name}}", "escaped": "\\"{{item}}\\""}'
+    )
+
+    assert template.render(RESULTS, item=[1]) == {
+        "label": "widget x3",
+        "quoted": "widget",
+        "escaped": '"[1]"',
+    }
+
+
+def test_templates_with_other_syntax_are_rendered_by_django():
+    """Filters and tags fall back to django template rendering"""
+    template = compile_template(
+        '{"length": {{step.result.items|length}}, "name": {{parameters.name}}}'
+    )
+
+    assert isinstance(template, DjangoTemplate)
+    assert template.render(RESULTS) == {"length": 2, "name": "widget"}
+
+
+def test_invalid_template():
+    with pytest.raises(ValueError):
+        compile_template('{"count": {{parameters.count}}')
+
+
+@pytest.mark.django_db
+def test_parameter_templates_are_cached_per_revision():
+    """A step's template is compiled once, and again once the step is updated"""
+    team = Team.objects.create(name="team")
+    environment = team.environments.get()
+    package = Package.objects.create(name="testpackage", environment=environment)
+    function = Function.objects.create(
+        name="testfunction", package=package, environment=environment
+    )
+    workflow = Workflow.objects.create(
+        environment=environment,
+        name="workflow",
+        creator=User.objects.create(username="user"),
+    )
+    step = workflow.steps.create(
+        name="step", function=function, parameter_template='{"prop1": 1}'
+    )
+
+    template = get_parameter_template(step)
+    assert get_parameter_template(workflow.steps.get()) is template
+
+    step.parameter_template = '{"prop1": 2}'
+    step.save()
+
+    assert get_parameter_template(step).render(RESULTS) == {"prop1": 2}
+
+    # The cache does not keep the step alive
+    step_ref = weakref.ref(step)
+    del step
+    gc.collect()
+
+    assert step_ref() is None
@@ -0,0 +1,105 @@
+import pytest
+
+from core.models import Team, Variable
+from core.utils.variable import VariableSnapshot, get_variables
+
+
+@pytest.fixture
+def team():
+    return Team.objects.create(name="team")
+
+
+@pytest.fixture
+def environment(team):
+    return team.environments.get()
+
+
+@pytest.fixture
+def env_var(environment):
+    return Variable.objects.create(
+        name="SHARED", environment=environment, value="from environment"
+    )
+
+
+@pytest.fixture
+def team_var(team):
+    return Variable.objects.create(name="SHARED", team=team, value="from team")
+
+
+@pytest.fixture
+def protected_var(team):
+    return Variable.objects.create(
+        name="SECRET", team=team, value="password", protect=True
+    )
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("team_var", "env_var")
+def test_environment_variables_override_team_variables(environment):
+    """Environment variables take precedence over Team variables of the same name"""
+    assert get_variables(environment).values(["SHARED", "MISSING"]) == {
+        "SHARED": "from environment"
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("team_var")
+def test_snapshots_are_cached(environment, django_assert_num_queries):
+    """Variables are only queried once per version of the environment's variables"""
+    get_variables(environment)
+
+    with django_assert_num_queries(0):
+        get_variables(environment)
+
+
+@pytest.mark.django_db
+def test_variable_changes_invalidate_snapshots(environment, team_var):
+    """Saving a team variable invalidates the snapshots of the team's environments"""
+    assert get_variables(environment).values(["SHARED"]) == {"SHARED": "from team"}
+
+    team_var.value = "changed"
+    team_var.save()
+    environment.refresh_from_db()
+
+    assert get_variables(environment).values(["SHARED"]) == {"SHARED": "changed"}
+
+    team_var.delete()
+    environment.refresh_from_db()
+
+    assert get_variables(environment).values(["SHARED"]) == {}
+
+
+@pytest.mark.django_db
+def test_stale_environment_does_not_revert_variables_version(environment, team_var):
+    """Saving an environment loaded before its variables changed keeps the version"""
+    team_var.save()
+    environment.save()
+    environment.refresh_from_db()
+
+    assert environment.variables_version == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures("protected_var")
+def test_mask_only_requested_variables(environment):
+    """Only the protected values of the named variables are masked"""
+    snapshot = get_variables(environment)
+    output = "the password is password"
+
+    assert snapshot.mask(output, ["SECRET"]) == "the ******** is ********"
+    assert snapshot.mask(output, []) == output
+
+
+def test_mask_prefers_longest_values():
+    """Values containing other protected values are masked in full"""
+    snapshot = VariableSnapshot(
+        [
+            Variable(name="SHORT", value="secret", protect=True, team_id=1),
+            Variable(name="LONG", value="secret-token", protect=True, team_id=1),
+            Variable(name="OPEN", value="visible", protect=False, team_id=1),
+        ]
+    )
+
+    masked = snapshot.mask("secret-token secret visible", ["SHORT", "LONG", "OPEN"])
+
+    assert masked == "******** ******** visible"
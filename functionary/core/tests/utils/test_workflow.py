@@ -2,7 +2,7 @@ import pytest
 
 from core.models import Function, Package, Team, User, Workflow, WorkflowStep
 from core.utils.parameter import PARAMETER_TYPE
-from core.utils.workflow import add_step, move_step, remove_step
+from core.utils.workflow import add_step, move_step, remove_step, set_dependencies
 
 
 @pytest.fixture
@@ -165,6 +165,24 @@ def test_move_step(workflow):
     assert ordered_steps[2] == first
 
 
+@pytest.mark.django_db
+def test_move_step_rejects_cycles(workflow):
+    """A move that makes a step follow a step that depends on it is rejected"""
+    first = workflow.steps.get(name="first")
+    last = workflow.steps.get(name="last")
+    set_dependencies(last, [first])
+
+    with pytest.raises(ValueError):
+        move_step(first, None)
+
+    # The move is rolled back
+    assert [step.name for step in workflow.ordered_steps] == [
+        "first",
+        "middle",
+        "last",
+    ]
+
+
 @pytest.mark.django_db
 def test_move_step_only_within_same_workflow(workflow, other_workflow):
     """The step to move and its new next target must be in the same Workflow"""
@@ -172,3 +190,69 @@ def test_move_step_only_within_same_workflow(workflow, other_workflow):
         move_step(
             workflow.steps.get(name="first"), other_workflow.steps.get(name="first")
         )
+
+
+@pytest.mark.django_db
+def test_set_dependencies(workflow):
+    first = workflow.steps.get(name="first")
+    middle = workflow.steps.get(name="middle")
+    last = workflow.steps.get(name="last")
+
+    set_dependencies(last, [first])
+
+    # Declared dependencies replace the step before, for that step only
+    assert workflow.get_dependencies() == {
+        first.id: set(),
+        middle.id: {first.id},
+        last.id: {first.id},
+    }
+
+    set_dependencies(last, [])
+
+    assert workflow.get_dependencies()[last.id] == {middle.id}
+
+
+@pytest.mark.django_db
+def test_set_dependencies_rejects_cycles(workflow):
+    first = workflow.steps.get(name="first")
+    middle = workflow.steps.get(name="middle")
+    last = workflow.steps.get(name="last")
+
+    set_dependencies(middle, [first])
+    set_dependencies(last, [middle])
+
+    with pytest.raises(ValueError):
+        set_dependencies(first, [last])
+
+    with pytest.raises(ValueError):
+        set_dependencies(first, [first])
+
+
+@pytest.mark.django_db
+def test_set_dependencies_rejects_cycles_through_sequence(workflow):
+    """Steps without declared dependencies still count as depending on the step
+    before them"""
+    first = workflow.steps.get(name="first")
+    last = workflow.steps.get(name="last")
+
+    with pytest.raises(ValueError):
+        set_dependencies(first, [last])
+
+
+@pytest.mark.django_db
+def test_set_dependencies_only_within_same_workflow(workflow, other_workflow):
+    with pytest.raises(ValueError):
+        set_dependencies(workflow.first_step, [other_workflow.first_step])
+
+
+@pytest.mark.django_db
+def test_remove_step_keeps_dependencies(workflow):
+    first = workflow.steps.get(name="first")
+    middle = workflow.steps.get(name="middle")
+    last = workflow.steps.get(name="last")
+
+    set_dependencies(middle, [first])
+    set_dependencies(last, [middle])
+    remove_step(middle)
+
+    assert set(last.depends_on.all()) == {first}
@@ -0,0 +1,353 @@
+"""Benchmarking of the workflow engine
+
+Drives synthetic workflows through the engine, from WorkflowRun.execute through
+dispatching the tasks, recording their results and advancing the run, with an
+in-memory broker and runner in place of RabbitMQ and the runners. Time spent in the
+stand-ins is not measured, so what is reported is the overhead that the engine itself
+adds to each workflow.
+
+Each stage reports the time spent in it and the database queries made while in it.
+Stages are inclusive, so advancing runs is also counted as part of recording the
+results that triggered it, and rendering templates as part of whichever stage
+executed the steps.
+
+The benchmark only dispatches the tasks of its own environment, but a dispatcher
+running against the same database would publish them to the real runners, so it is
+meant to be run against a development database.
+"""
+
+import json
+from contextlib import ExitStack, contextmanager
+from time import perf_counter
+from typing import Callable, Iterator, Optional
+from uuid import uuid4
+
+from django.db import connection
+
+from core.models import (
+    Function,
+    Package,
+    Task,
+    Team,
+    User,
+    Workflow,
+    WorkflowRun,
+    WorkflowStep,
+)
+from core.utils import tasking
+from core.utils.messaging import BatchPublisher
+from core.utils.parameter import PARAMETER_TYPE
+from core.utils.template import DjangoTemplate, StructuredTemplate
+
+
+class StageStats:
+    """The measurements of a stage of the engine
+
+    Attributes:
+        calls: The number of times the stage ran
+        seconds: The total time spent in the stage
+        queries: The total number of database queries made in the stage
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.seconds = 0.0
+        self.queries = 0
+
+
+class Tracer:
+    """Measures the time and queries spent in each stage of the engine
+
+    Attributes:
+        stages: The measurements of each stage, in the order the stages first ran
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageStats] = {}
+        self._active: list[StageStats] = []
+
+    @contextmanager
+    def collect(self) -> Iterator[None]:
+        """Count the database queries of the stages measured within the context"""
+        with connection.execute_wrapper(self._count_query):
+            yield
+
+    @contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        """Measure the stage for as long as the context is active
+
+        Args:
+            stage: The name of the stage
+        """
+        stats = self.stages.setdefault(stage, StageStats())
+        stats.calls += 1
+        self._active.append(stats)
+        start = perf_counter()
+
+        try:
+            yield
+        finally:
+            stats.seconds += perf_counter() - start
+            self._active.remove(stats)
+
+    @contextmanager
+    def trace(self, owner: object, name: str, stage: str) -> Iterator[None]:
+        """Measure every call of a function as the stage, for as long as the context
+        is active
+
+        Args:
+            owner: The class or module the function belongs to
+            name: The name of the function
+            stage: The name of the stage
+        """
+        function = getattr(owner, name)
+        inherited = name not in vars(owner)
+
+        def traced(*args, **kwargs):
+            with self.measure(stage):
+                return function(*args, **kwargs)
+
+        setattr(owner, name, traced)
+
+        try:
+            yield
+        finally:
+            if inherited:
+                delattr(owner, name)
+            else:
+                setattr(owner, name, function)
+
+    def _count_query(self, execute: Callable, sql, params, many, context):
+        for stats in self._active:
+            stats.queries += 1
+
+        return execute(sql, params, many, context)
+
+
+class InMemoryBroker:
+    """Holds published task messages in place of the message broker
+
+    Attributes:
+        messages: The task messages waiting to be run
+    """
+
+    def __init__(self) -> None:
+        self.messages: list[dict] = []
+
+    def publisher(self) -> BatchPublisher:
+        """A BatchPublisher that publishes to this broker"""
+        return InMemoryPublisher(self)
+
+    def take(self) -> list[dict]:
+        """Take all of the waiting task messages"""
+        messages, self.messages = self.messages, []
+
+        return messages
+
+
+class InMemoryPublisher(BatchPublisher):
+    """A BatchPublisher that delivers its messages to an InMemoryBroker"""
+
+    def __init__(self, broker: InMemoryBroker) -> None:
+        super().__init__()
+        self.broker = broker
+
+    def publish(self) -> list:
+        for message in self.messages:
+            self.broker.messages.append(json.loads(message.body))
+
+        return [None] * len(self.messages)
+
+
+class InMemoryRunner:
+    """Runs tasks in place of a runner, returning their results straight away
+
+    The result of each task is the depth parameter it was run with plus one, padded
+    to give results a realistic size.
+
+    Attributes:
+        result_size: The number of bytes of padding in each result
+    """
+
+    def __init__(self, result_size: int = 0) -> None:
+        self.result_size = result_size
+
+    def run(self, task_messages: list[dict]) -> list[dict]:
+        """Run the tasks
+
+        Args:
+            task_messages: The TASK_PACKAGE messages of the tasks
+
+        Returns:
+            The TASK_RESULT message for each task
+        """
+        return [
+            {
+                "task_id": message["id"],
+                "status": 0,
+                "output": "",
+                "result": json.dumps(
+                    {
+                        "depth": message["function_parameters"]["depth"] + 1,
+                        "padding": "x" * self.result_size,
+                    }
+                ),
+            }
+            for message in task_messages
+        ]
+
+
+def create_benchmark_workflow(
+    team: Team, creator: User, length: int, width: int, items: int = 0
+) -> Workflow:
+    """Create a synthetic workflow of layers of steps that each depend on every step
+    of the layer before them
+
+    Args:
+        team: The team to create the workflow in
+        creator: The user that creates the workflow
+        length: The number of layers of steps
+        width: The number of steps in each layer
+        items: When more than 0, the workflow ends with a step that maps over this
+               many items
+
+    Returns:
+        The workflow
+    """
+    environment = team.environments.get()
+    package = Package.objects.create(name="benchmark", environment=environment)
+    function = Function.objects.create(
+        name="benchmark", package=package, environment=environment, active=True
+    )
+    function.parameters.create(name="depth", parameter_type=PARAMETER_TYPE.INTEGER)
+
+    workflow = Workflow.objects.create(
+        environment=environment, name="benchmark", creator=creator
+    )
+    workflow.parameters.create(name="items", parameter_type=PARAMETER_TYPE.JSON)
+    layer: list[WorkflowStep] = []
+
+    for depth in range(length):
+        previous, layer = layer, []
+
+        for index in range(width):
+            if previous:
+                reference = f"{previous[index].name}.result.depth"
+                template = '{"depth": {{' + reference + "}}}"
+            else:
+                template = '{"depth": 0}'
+
+            step = workflow.steps.create(
+                name=f"step_{depth}_{index}",
+                function=function,
+                parameter_template=template,
+            )
+            step.depends_on.set(previous)
+            layer.append(step)
+
+    if items:
+        step = workflow.steps.create(
+            name="mapped",
+            function=function,
+            parameter_template='{"depth": {{item}}}',
+            map_over="parameters.items",
+        )
+        step.depends_on.set(layer)
+
+    return workflow
+
+
+def _run_workflow(
+    workflow: Workflow,
+    tracer: Tracer,
+    broker: InMemoryBroker,
+    runner: InMemoryRunner,
+    items: int,
+) -> None:
+    """Run the workflow to completion, one round of ready steps at a time"""
+    workflow_run = WorkflowRun.objects.create(
+        workflow=workflow,
+        environment=workflow.environment,
+        parameters={"items": list(range(items))},
+        creator=workflow.creator,
+    )
+
+    with tracer.measure("workflow"):
+        with tracer.measure("execute"):
+            workflow_run.execute()
+
+        while True:
+            with tracer.measure("dispatch"):
+                while tasking.dispatch_tasks(
+                    environment=workflow.environment,
+                    publisher_factory=broker.publisher,
+                ):
+                    pass
+
+            if not (task_messages := broker.take()):
+                break
+
+            task_result_messages = runner.run(task_messages)
+
+            with tracer.measure("record"):
+                tasking.record_task_results(task_result_messages)
+
+    workflow_run.refresh_from_db()
+
+    if workflow_run.status != Task.COMPLETE:
+        raise RuntimeError(f"Benchmark workflow finished as {workflow_run.status}")
+
+
+def run_benchmark(
+    length: int,
+    width: int,
+    runs: int = 1,
+    items: int = 0,
+    result_size: int = 0,
+    tracer: Optional[Tracer] = None,
+) -> Tracer:
+    """Run a synthetic workflow through the engine and measure each stage
+
+    Everything the benchmark creates is removed once it is done.
+
+    Args:
+        length: The number of layers of steps in the workflow
+        width: The number of steps in each layer
+        runs: The number of times to run the workflow
+        items: When more than 0, the workflow ends with a step that maps over this
+               many items
+        result_size: The number of bytes of padding in each task's result
+        tracer: The Tracer to measure the stages with
+
+    Returns:
+        The Tracer holding the measurements
+
+    Raises:
+        RuntimeError: A run of the workflow did not complete
+    """
+    tracer = tracer or Tracer()
+    broker = InMemoryBroker()
+    runner = InMemoryRunner(result_size)
+    name = f"benchmark-{uuid4().hex}"
+    team = Team.objects.create(name=name)
+    creator = User.objects.create(username=name)
+
+    try:
+        workflow = create_benchmark_workflow(team, creator, length, width, items)
+
+        with ExitStack() as stack:
+            stack.enter_context(tracer.trace(WorkflowRun, "advance", "advance"))
+            stack.enter_context(tracer.trace(BatchPublisher, "add", "serialize"))
+            stack.enter_context(tracer.trace(StructuredTemplate, "render", "render"))
+            stack.enter_context(tracer.trace(DjangoTemplate, "render", "render"))
+            stack.enter_context(tracer.collect())
+
+            for _ in range(runs):
+                _run_workflow(workflow, tracer, broker, runner, items)
+    finally:
+        WorkflowRun.objects.filter(environment__team=team).delete()
+        Task.objects.filter(environment__team=team).delete()
+        team.delete()
+        creator.delete()
+
+    return tracer
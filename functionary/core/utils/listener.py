@@ -1,23 +1,291 @@
 import json
 import logging
+import threading
+from functools import partial
+from typing import NamedTuple, Optional
 
-from core.utils.messaging import build_connection
-from core.utils.tasking import record_task_result
+from django import db
+from django.conf import settings
+from django.db import (
+    InterfaceError,
+    OperationalError,
+    close_old_connections,
+    transaction,
+)
+from pika.channel import Channel
+from pika.spec import Basic, BasicProperties
+
+from core.utils.messaging import TASK_RESULTS_QUEUE, build_connection
+from core.utils.tasking import record_task_log_chunks, record_task_results
 
 logger = logging.getLogger(__name__)
 
+# Errors from the database being unavailable, after which messages are requeued rather
+# than rejected, as recording them may succeed once the database is back
+RETRYABLE_ERRORS = (InterfaceError, OperationalError)
+
+
+class _Delivery(NamedTuple):
+    delivery_tag: int
+    msg_type: str
+    body: dict
+
+
+class ResultConsumer:
+    """Consumes task result messages, recording them in batches
+
+    Deliveries are collected until either batch_size of them have been received or
+    batch_window seconds have passed since the first of them. The whole batch is then
+    recorded in a single transaction and the deliveries are acked once it has been
+    committed, using a single multiple ack. If recording the batch fails, each of its
+    messages is retried on its own so that one bad message does not hold up the rest.
+    Messages that fail because the database is unavailable are instead requeued after
+    a delay that grows with each consecutive failure.
+
+    The broker delivers up to prefetch_count unacked messages to the channel, so that
+    the next batch can be filling while the current one is being recorded.
+
+    Attributes:
+        channel: The channel that messages are consumed on
+        batch_size: The maximum number of messages in a batch
+        batch_window: The maximum number of seconds to wait for a batch to fill
+        prefetch_count: The maximum number of unacked messages delivered to the channel
+        retry_delay: The seconds to wait before requeueing messages after the first
+                     consecutive database failure
+        retry_max_delay: The maximum seconds to wait before requeueing messages
+        pending: The deliveries waiting to be recorded
+    """
+
+    def __init__(
+        self,
+        channel: Channel,
+        batch_size: int = settings.RESULT_BATCH_SIZE,
+        batch_window: float = settings.RESULT_BATCH_WINDOW,
+        prefetch_count: int = settings.RESULT_PREFETCH_COUNT,
+        retry_delay: float = settings.RESULT_RETRY_DELAY,
+        retry_max_delay: float = settings.RESULT_RETRY_MAX_DELAY,
+    ) -> None:
+        self.channel = channel
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.prefetch_count = max(prefetch_count, batch_size)
+        self.retry_delay = retry_delay
+        self.retry_max_delay = retry_max_delay
+        self.pending: list[_Delivery] = []
+        self._flush_timer: Optional[object] = None
+        self._failures = 0
+        self._requeueing: set[int] = set()
+
+    def start(self) -> None:
+        """Start consuming from the task results queue"""
+        self.channel.basic_qos(prefetch_count=self.prefetch_count)
+        self.channel.basic_consume(TASK_RESULTS_QUEUE, self.on_message)
+
+    def on_message(
+        self,
+        channel: Channel,
+        deliver: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        """Called when we receive a message from RabbitMQ"""
+        try:
+            msg_type = properties.headers.get("x-msg-type", "__NONE__")
+            msg_body = json.loads(body.decode())
+        except Exception as exc:
+            logger.error("Error handling received message: %s", exc)
+            channel.basic_reject(deliver.delivery_tag, requeue=False)
+            return
+
+        logger.info("Received message %s", msg_type)
+
+        if msg_type not in _MESSAGE_TYPES:
+            logger.error("Unrecognized message type: %s", msg_type)
+            channel.basic_ack(deliver.delivery_tag)
+            return
+
+        self.pending.append(_Delivery(deliver.delivery_tag, msg_type, msg_body))
+
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        elif self._flush_timer is None:
+            self._flush_timer = self.channel.connection.ioloop.call_later(
+                self.batch_window, self.flush
+            )
+
+    def flush(self) -> None:
+        """Record the pending deliveries and ack them"""
+        if self._flush_timer is not None:
+            self.channel.connection.ioloop.remove_timeout(self._flush_timer)
+            self._flush_timer = None
+
+        batch, self.pending = self.pending, []
+
+        if not batch:
+            return
+
+        # The listener is long running, so make sure the database connection is usable
+        close_old_connections()
+
+        try:
+            _record(batch)
+        except RETRYABLE_ERRORS as exc:
+            self._requeue(batch, exc)
+            return
+        except Exception as exc:
+            logger.error("Error recording batch of %s messages: %s", len(batch), exc)
+            self._record_individually(batch)
+            return
+
+        self._failures = 0
+        self._ack([delivery.delivery_tag for delivery in batch])
+        logger.debug("Recorded batch of %s messages", len(batch))
+
+    def _record_individually(self, batch: list[_Delivery]) -> None:
+        """Record each delivery on its own, rejecting any that can never be recorded.
+        If the database becomes unavailable, the remaining deliveries are requeued."""
+        recorded_tags = []
+
+        for index, delivery in enumerate(batch):
+            try:
+                _record([delivery])
+            except RETRYABLE_ERRORS as exc:
+                self._requeue(batch[index:], exc)
+                break
+            except Exception as exc:
+                logger.error("Error recording %s message: %s", delivery.msg_type, exc)
+                self.channel.basic_reject(delivery.delivery_tag, requeue=False)
+            else:
+                recorded_tags.append(delivery.delivery_tag)
+
+        if recorded_tags:
+            self._failures = 0
+            self._ack(recorded_tags)
+
+    def _ack(self, delivery_tags: list[int]) -> None:
+        """Ack the recorded deliveries with a single multiple ack. Rejected deliveries
+        are already settled, so the multiple ack only covers the recorded ones, unless
+        earlier deliveries are still waiting to be requeued."""
+        last_tag = delivery_tags[-1]
+
+        if any(tag < last_tag for tag in self._requeueing):
+            for delivery_tag in delivery_tags:
+                self.channel.basic_ack(delivery_tag)
+        else:
+            self.channel.basic_ack(last_tag, multiple=True)
+
+    def _requeue(self, deliveries: list[_Delivery], exc: Exception) -> None:
+        """Requeue the deliveries once the retry delay has passed. They stay unacked
+        until then, so once prefetch_count messages are waiting the broker stops
+        delivering more and the listener backs off."""
+        delay = min(self.retry_delay * 2**self._failures, self.retry_max_delay)
+        self._failures += 1
+        logger.warning(
+            "Requeueing %s messages in %s seconds after a database error: %s",
+            len(deliveries),
+            delay,
+            exc,
+        )
+        delivery_tags = [delivery.delivery_tag for delivery in deliveries]
+        self._requeueing.update(delivery_tags)
+        self.channel.connection.ioloop.call_later(
+            delay, partial(self._nack, delivery_tags)
+        )
+
+    def _nack(self, delivery_tags: list[int]) -> None:
+        """Return the deliveries to the queue to be delivered again"""
+        self._requeueing.difference_update(delivery_tags)
+
+        if not self.channel.is_open:
+            # The broker requeues unacked deliveries itself when the channel closes
+            return
 
-def start_listening():
-    logger.info("Starting listener")
-    connection = build_connection(open_callback=_on_connection_open)
+        for delivery_tag in delivery_tags:
+            self.channel.basic_nack(delivery_tag, requeue=True)
+
+
+# Log chunks are recorded ahead of results so that chunks in the same batch as their
+# task's result are in place when it is recorded. Chunks in later batches are still
+# shown ahead of the output recorded with the result, unless the log was stored in S3
+# along with it, in which case record_task_log_chunks drops them.
+_MESSAGE_TYPES = ["TASK_LOG_CHUNK", "TASK_RESULT"]
+
+
+def _record(batch: list[_Delivery]) -> None:
+    """Record the messages in the batch, grouped by message type, in a single
+    transaction"""
+    with transaction.atomic():
+        for msg_type in _MESSAGE_TYPES:
+            if not (messages := [d.body for d in batch if d.msg_type == msg_type]):
+                continue
+
+            match msg_type:
+                case "TASK_LOG_CHUNK":
+                    record_task_log_chunks(messages)
+                case "TASK_RESULT":
+                    record_task_results(messages)
+
+
+def start_listening(consumers: int = settings.RESULT_CONSUMERS):
+    """Consume task results until interrupted or a connection is lost
+
+    Args:
+        consumers: The number of consumers to run. Each has its own connection and
+            a thread running that connection's ioloop, so that one consumer recording
+            a batch does not hold up the others or the heartbeats of their
+            connections.
+    """
+    logger.info("Starting listener with %s consumer(s)", consumers)
+    closed = threading.Event()
+    connections = [
+        build_connection(open_callback=_on_connection_open) for _ in range(consumers)
+    ]
+    threads = [
+        threading.Thread(
+            target=_run_connection,
+            args=(connection, closed),
+            name=f"result-consumer-{index}",
+        )
+        for index, connection in enumerate(connections)
+    ]
+
+    for thread in threads:
+        thread.start()
 
     try:
-        connection.ioloop.start()
+        # Once any consumer has lost its connection the others are stopped too, so
+        # that the listener exits and can be restarted at full strength
+        closed.wait()
     except KeyboardInterrupt:
-        connection.close()
+        pass
+
+    for connection in connections:
+        connection.ioloop.add_callback_threadsafe(partial(_close, connection))
+
+    for thread in threads:
+        thread.join()
+
+
+def _run_connection(connection, closed: threading.Event) -> None:
+    """Run the connection's ioloop until the connection is closed"""
 
-        # Loop until we're fully closed, will stop on its own
+    def on_close(connection, exc):
+        logger.info("Connection closed: %s", exc)
+        connection.ioloop.stop()
+
+    connection.add_on_close_callback(on_close)
+
+    try:
         connection.ioloop.start()
+    finally:
+        closed.set()
+        db.connection.close()
+
+
+def _close(connection) -> None:
+    """Close the connection unless it is already closing"""
+    if not (connection.is_closing or connection.is_closed):
+        connection.close()
 
 
 def _on_connection_open(connection):
@@ -31,25 +299,4 @@ def _on_channel_open(new_channel):
     logger.debug("Channel opened")
 
     # TODO: Generalize this to support consuming of more than just tasking results
-    new_channel.basic_consume("tasking.results", _handle_delivery)
-
-
-def _handle_delivery(channel, deliver, properties, body):
-    """Called when we receive a message from RabbitMQ"""
-
-    # TODO: Implement handling of specific exceptions
-    try:
-        msg_type = properties.headers.get("x-msg-type", "__NONE__")
-        msg_body = json.loads(body.decode())
-
-        logger.info("Received message %s", msg_type)
-
-        match msg_type:
-            case "TASK_RESULT":
-                record_task_result.delay(msg_body)
-            case _:
-                logger.error("Unrecognized message type: %s", msg_type)
-
-        channel.basic_ack(deliver.delivery_tag)
-    except Exception as exc:
-        logger.error("Error handling received message: %s", exc)
+    ResultConsumer(new_channel).start()
@@ -1,20 +1,42 @@
 import json
 import logging
+import os
 import ssl
+import threading
+import uuid
 from time import sleep
-from typing import Tuple
+from typing import NamedTuple, Optional, Tuple
 
 import pika
 from django.conf import settings
-from pika.exceptions import AMQPConnectionError, UnroutableError
+from pika.adapters.blocking_connection import BlockingChannel, ReturnedMessage
+from pika.channel import Channel
+from pika.exceptions import (
+    AMQPChannelError,
+    AMQPConnectionError,
+    AMQPError,
+    ChannelClosedByBroker,
+    NackError,
+    UnroutableError,
+)
 from pika.exchange_type import ExchangeType
+from pika.frame import Method
+from pika.spec import Basic, BasicProperties
+
+from core.models import Task
 
 logger = logging.getLogger(__name__)
 
 PUBLIC_EXCHANGE = "runners.public"
+
+# The task queue of the public runner pool before tasks were sharded over several
+# queues. The shard queues are named after it.
 PUBLIC_QUEUE = "public"
 TASK_RESULTS_QUEUE = "tasking.results"
 
+# Messages for every runner, such as to cancel a task that any of them may be running
+CONTROL_EXCHANGE = "runners.control"
+
 
 def build_connection(ca=None, cert=None, key=None, open_callback=None):
     """Creates a connection to RabbitMQ.
@@ -57,21 +79,97 @@ def build_connection(ca=None, cert=None, key=None, open_callback=None):
         return pika.BlockingConnection(pika.ConnectionParameters(**connection_params))
 
 
+class PublisherPool:
+    """Per-process pool of persistent publisher channels
+
+    Each thread is given its own connection and confirm mode channel, since pika
+    connections are not thread safe. Connections are opened on first use and reopened
+    if they have gone away. After a fork, the child discards the parent's connections
+    and opens its own rather than sharing the parent's socket.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        """Forget all pooled connections without closing them"""
+        self._local = threading.local()
+
+    def get_channel(self) -> BlockingChannel:
+        """Return this thread's publisher channel, opening a new one if needed"""
+        channel: BlockingChannel | None = getattr(self._local, "channel", None)
+
+        if channel is None or channel.is_closed or channel.connection.is_closed:
+            self.discard()
+
+            channel = build_connection().channel()
+            channel.confirm_delivery()
+            self._local.channel = channel
+
+        return channel
+
+    def discard(self) -> None:
+        """Close this thread's publisher connection and remove it from the pool"""
+        channel: BlockingChannel | None = getattr(self._local, "channel", None)
+        self._local.channel = None
+
+        if channel is not None and channel.connection.is_open:
+            try:
+                channel.connection.close()
+            except AMQPConnectionError:
+                pass
+
+    def publish(self, **kwargs) -> None:
+        """Publish a message on this thread's channel
+
+        A pooled connection that has been closed by the broker, or lost, since it was
+        last used is replaced and the publish is retried once.
+
+        Args:
+            kwargs: Passed through to BlockingChannel.basic_publish
+
+        Raises:
+            pika.exceptions.UnroutableError: if unable to publish the message
+            pika.exceptions.NackError: if the broker rejected the message
+        """
+        try:
+            self.get_channel().basic_publish(**kwargs)
+        except (UnroutableError, NackError):
+            raise
+        except (AMQPChannelError, AMQPConnectionError) as exc:
+            logger.debug("Publisher connection lost, reconnecting: %s", exc)
+            self.discard()
+            self.get_channel().basic_publish(**kwargs)
+
+
+publisher_pool = PublisherPool()
+os.register_at_fork(after_in_child=publisher_pool.reset)
+
+
+def get_task_queue(shard: int) -> str:
+    """The name of the public runner pool's queue for the given shard"""
+    return f"{PUBLIC_QUEUE}.{shard}"
+
+
 def get_route(task) -> Tuple[str, str]:
     """Determine the correct exchange and routing key for provided task
 
+    Tasks are sent to the public runner pool, on the queue that their environment is
+    sharded to. Runners consume every queue evenly, so the tasks of one environment
+    only wait behind those of the environments that share its queue.
+
     Args:
         task: Task instance to determine routing information for
 
     Returns:
         A tuple of strings: (exchange, routing_key)
     """
-    # TODO: Implement actual routing determination logic. For now, this always returns
-    #       the public runner pool exchange and routing key
-    return (PUBLIC_EXCHANGE, PUBLIC_QUEUE)
+    shard = task.environment_id.int % settings.TASK_QUEUE_SHARDS
+
+    return (PUBLIC_EXCHANGE, get_task_queue(shard))
 
 
-def send_message(exchange, routing_key, msg_type, message):
+def send_message(exchange, routing_key, msg_type, message, priority=None):
     """Sends a JSON message to the specified queue.
 
     Sends the given message to the queue. If msg_type is populated, it
@@ -82,39 +180,339 @@ def send_message(exchange, routing_key, msg_type, message):
         routing_key: The routing key to use when delivering the message
         msg_type: The value of x-msg-type to set in the header, or None
         message: The message to send, must be valid JSON.
+        priority: The priority of the message in its queue, or None
 
     Raises:
         pika.exceptions.UnroutableError: if unable to publish the message
     """
 
-    headers = {"x-msg-type": msg_type} if msg_type else {}
-
-    # TODO Update this to use a persistent connection to the queue
-    publish_props = pika.BasicProperties(
-        content_type="application/json",
-        content_encoding="utf-8",
-        headers=headers,
-        delivery_mode=1,
-    )
-
-    connection = build_connection()
-    channel = connection.channel()
-    channel.confirm_delivery()
-
     try:
-        channel.basic_publish(
+        publisher_pool.publish(
             exchange=exchange,
             routing_key=routing_key,
             body=json.dumps(message),
-            properties=publish_props,
+            properties=_get_publish_properties(msg_type, priority=priority),
             mandatory=True,
         )
     except UnroutableError as ue:
         # TODO revisit this and handle exceptions better. Currently used for retry logic
         logger.error("Failed to send message to %s using %s", exchange, routing_key)
         raise ue
-    finally:
-        connection.close()
+
+
+def _get_publish_properties(msg_type: Optional[str], **kwargs) -> BasicProperties:
+    """Properties for publishing a JSON message with the given x-msg-type header"""
+    headers = {"x-msg-type": msg_type} if msg_type else {}
+
+    return pika.BasicProperties(
+        content_type="application/json",
+        content_encoding="utf-8",
+        headers=headers,
+        delivery_mode=1,
+        **kwargs,
+    )
+
+
+class _BatchMessage(NamedTuple):
+    exchange: str
+    routing_key: str
+    body: bytes
+    properties: BasicProperties
+
+
+class ConfirmChannel:
+    """A long-lived SelectConnection and confirm mode channel for BatchPublishers
+
+    The broker's confirms arrive asynchronously, so BatchPublishers publish on a
+    SelectConnection rather than the BlockingConnections of the PublisherPool. The
+    connection is only serviced while a batch is being published, so it is reopened
+    if the broker has closed it since the last batch.
+
+    Attributes:
+        connection: The connection
+        channel: The confirm mode channel, or None once it has closed
+        delivery_tag: The delivery tag of the last message published on the channel
+        publisher: The BatchPublisher whose batch is being published, if any
+
+    Raises:
+        pika.exceptions.AMQPConnectionError: failed to connect to message broker
+    """
+
+    def __init__(self) -> None:
+        self.channel: Optional[Channel] = None
+        self.delivery_tag = 0
+        self.publisher: Optional["BatchPublisher"] = None
+
+        self.connection = build_connection(open_callback=self._on_connection_open)
+        self.connection.add_on_close_callback(self._on_connection_closed)
+
+        # Serviced until the channel is ready or the connection closes
+        self.connection.ioloop.start()
+
+        if self.channel is None:
+            raise AMQPConnectionError("Unable to open a publisher channel")
+
+    @property
+    def is_open(self) -> bool:
+        """Whether batches can be published on the channel"""
+        return self.channel is not None and self.channel.is_open
+
+    def publish(self, publisher: "BatchPublisher", timeout: float) -> None:
+        """Publish a batch of messages and wait for the broker to confirm them
+
+        Args:
+            publisher: The BatchPublisher whose messages to publish
+            timeout: The most seconds to wait for the confirms. The connection is
+                     closed if they have not all arrived by then, as they would
+                     otherwise arrive during a later batch.
+        """
+        self.publisher = publisher
+
+        for index, message in enumerate(publisher.messages):
+            self.delivery_tag += 1
+            publisher.add_pending(self.delivery_tag, index)
+
+            self.channel.basic_publish(
+                exchange=message.exchange,
+                routing_key=message.routing_key,
+                body=message.body,
+                properties=message.properties,
+                mandatory=True,
+            )
+
+        timer = self.connection.ioloop.call_later(timeout, self._on_timeout)
+
+        try:
+            self.connection.ioloop.start()
+        finally:
+            self.connection.ioloop.remove_timeout(timer)
+            self.publisher = None
+
+    def _on_connection_open(self, connection: pika.SelectConnection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_closed(self, _connection, reason: Exception) -> None:
+        self.channel = None
+
+        if self.publisher is not None:
+            self.publisher.fail_pending(AMQPConnectionError(reason))
+
+        self.connection.ioloop.stop()
+
+    def _on_channel_open(self, channel: Channel) -> None:
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.add_on_return_callback(self._on_return)
+        channel.confirm_delivery(
+            ack_nack_callback=self._on_confirm,
+            callback=lambda _: self._on_channel_ready(channel),
+        )
+
+    def _on_channel_ready(self, channel: Channel) -> None:
+        self.channel = channel
+        self.connection.ioloop.stop()
+
+    def _on_channel_closed(self, _channel, reason: AMQPChannelError) -> None:
+        self.channel = None
+
+        if self.publisher is not None:
+            self.publisher.fail_pending(reason)
+
+        if self.connection.is_open:
+            self.connection.close()
+
+    def _on_timeout(self) -> None:
+        logger.error("Timed out waiting for the broker to confirm messages")
+
+        if self.publisher is not None:
+            self.publisher.fail_pending(
+                AMQPConnectionError("Timed out waiting for publisher confirms")
+            )
+
+        self.channel = None
+        self.connection.close()
+
+    def _on_return(self, _channel: Channel, method, properties, body) -> None:
+        if self.publisher is not None:
+            self.publisher.on_return(method, properties, body)
+
+    def _on_confirm(self, frame: Method) -> None:
+        if self.publisher is None:
+            return
+
+        self.publisher.on_confirm(frame)
+
+        if self.publisher.done:
+            self.connection.ioloop.stop()
+
+
+class ConfirmChannelPool:
+    """Per-process pool of ConfirmChannels, one for each thread
+
+    After a fork, the child discards the parent's connections and opens its own
+    rather than sharing the parent's socket.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        """Forget all pooled connections without closing them"""
+        self._local = threading.local()
+
+    def get_channel(self) -> ConfirmChannel:
+        """Return this thread's ConfirmChannel, opening a new one if needed
+
+        Raises:
+            pika.exceptions.AMQPConnectionError: failed to connect to message broker
+        """
+        channel: ConfirmChannel | None = getattr(self._local, "channel", None)
+
+        if channel is None or not channel.is_open:
+            self._local.channel = None
+            channel = ConfirmChannel()
+            self._local.channel = channel
+
+        return channel
+
+
+confirm_channel_pool = ConfirmChannelPool()
+os.register_at_fork(after_in_child=confirm_channel_pool.reset)
+
+
+class BatchPublisher:
+    """Publishes a batch of messages without waiting on each message's confirm
+
+    Messages are queued with add() and then sent with publish(). All of the messages
+    are written to the broker back to back on the thread's pooled ConfirmChannel, and
+    the broker's publisher confirms are resolved asynchronously as they arrive, so a
+    batch costs roughly one round-trip rather than one per message.
+
+    Example:
+        publisher = BatchPublisher()
+
+        for task in tasks:
+            publisher.add(exchange, routing_key, "TASK_PACKAGE", message)
+
+        errors = publisher.publish()
+
+    Attributes:
+        messages: The queued messages
+        timeout: The most seconds to wait for the broker to confirm the messages
+    """
+
+    def __init__(self, timeout: float = settings.RABBITMQ_CONFIRM_TIMEOUT) -> None:
+        self.messages: list[_BatchMessage] = []
+        self.timeout = timeout
+
+        self._errors: list[Optional[AMQPError]] = []
+        self._indexes: dict[str, int] = {}
+        self._pending: dict[int, int] = {}
+        self._returned: dict[int, ReturnedMessage] = {}
+
+    @property
+    def done(self) -> bool:
+        """Whether every published message has been confirmed or failed"""
+        return not self._pending
+
+    def add(
+        self,
+        exchange: str,
+        routing_key: str,
+        msg_type: str,
+        message,
+        priority: Optional[int] = None,
+    ) -> None:
+        """Queue a JSON message to be sent to the specified queue
+
+        Args:
+            exchange: The message broker exchange to send the message to
+            routing_key: The routing key to use when delivering the message
+            msg_type: The value of x-msg-type to set in the header, or None
+            message: The message to send, must be valid JSON.
+            priority: The priority of the message in its queue, or None
+        """
+        properties = _get_publish_properties(
+            msg_type, message_id=str(uuid.uuid4()), priority=priority
+        )
+
+        self.messages.append(
+            _BatchMessage(
+                exchange, routing_key, json.dumps(message).encode(), properties
+            )
+        )
+
+    def publish(self) -> list[Optional[AMQPError]]:
+        """Publish all of the queued messages and wait for the broker to confirm them
+
+        Returns:
+            A list with an entry for each queued message, in the order they were
+            added. The entry is None if the message was delivered, otherwise the
+            error for that message: pika.exceptions.UnroutableError if it could not
+            be routed, pika.exceptions.NackError if the broker rejected it, or
+            pika.exceptions.AMQPConnectionError if the connection was lost, or the
+            timeout passed, before it was confirmed.
+
+        Raises:
+            pika.exceptions.AMQPConnectionError: failed to connect to message broker
+        """
+        self._errors = [None] * len(self.messages)
+        self._indexes = {}
+        self._pending = {}
+        self._returned = {}
+
+        if not self.messages:
+            return self._errors
+
+        confirm_channel_pool.get_channel().publish(self, self.timeout)
+
+        failed = sum(error is not None for error in self._errors)
+        if failed:
+            logger.error("Failed to send %s of %s messages", failed, len(self._errors))
+
+        return self._errors
+
+    def add_pending(self, delivery_tag: int, index: int) -> None:
+        """Record the delivery tag that the message at the index was published with"""
+        self._indexes[self.messages[index].properties.message_id] = index
+        self._pending[delivery_tag] = index
+
+    def fail_pending(self, error: AMQPError) -> None:
+        """Mark all messages that are still awaiting a confirm as failed"""
+        for index in self._pending.values():
+            self._errors[index] = error
+
+        self._pending.clear()
+
+    def on_return(
+        self, method: Basic.Return, properties: BasicProperties, body: bytes
+    ) -> None:
+        """Record a message that the broker returned as unroutable"""
+        # The broker always sends a return before the confirm for the same message
+        if (index := self._indexes.get(properties.message_id)) is not None:
+            self._returned[index] = ReturnedMessage(method, properties, body)
+
+    def on_confirm(self, frame: Method) -> None:
+        """Resolve the messages that the broker acked or nacked"""
+        method = frame.method
+        acked = isinstance(method, Basic.Ack)
+
+        if method.multiple:
+            tags = [tag for tag in self._pending if tag <= method.delivery_tag]
+        else:
+            tags = [method.delivery_tag]
+
+        for tag in tags:
+            if (index := self._pending.pop(tag, None)) is None:
+                continue
+
+            message = self.messages[index]
+
+            if not acked:
+                self._errors[index] = NackError(
+                    [ReturnedMessage(method, message.properties, message.body)]
+                )
+            elif returned := self._returned.pop(index, None):
+                self._errors[index] = UnroutableError([returned])
 
 
 def initialize_messaging():
@@ -129,17 +527,80 @@ def initialize_messaging():
         durable=True,
         auto_delete=False,
     )
-    logger.debug("Configuring rabbitmq queue: %s", PUBLIC_QUEUE)
-    channel.queue_declare(PUBLIC_QUEUE, durable=True, auto_delete=False)
-    channel.queue_bind(PUBLIC_QUEUE, PUBLIC_EXCHANGE)
+    for shard in range(settings.TASK_QUEUE_SHARDS):
+        queue = get_task_queue(shard)
+        logger.debug("Configuring rabbitmq queue: %s", queue)
+        channel.queue_declare(
+            queue,
+            durable=True,
+            auto_delete=False,
+            arguments={"x-max-priority": Task.MAX_PRIORITY},
+        )
+        channel.queue_bind(queue, PUBLIC_EXCHANGE, routing_key=queue)
+
+    logger.debug("Configuring rabbitmq exchange: %s", CONTROL_EXCHANGE)
+    channel.exchange_declare(
+        CONTROL_EXCHANGE,
+        exchange_type=ExchangeType.fanout,
+        durable=True,
+        auto_delete=False,
+    )
 
     logger.debug("Configuring rabbitmq queue: %s", TASK_RESULTS_QUEUE)
     channel.queue_declare(TASK_RESULTS_QUEUE, durable=True, auto_delete=False)
 
     channel.close()
+    _drain_legacy_task_queue(connection)
     connection.close()
 
 
+def _drain_legacy_task_queue(connection: pika.BlockingConnection) -> None:
+    """Move any tasks left on the task queue used before tasks were sharded onto the
+    queues of their environments, and delete it once it is empty. Runners no longer
+    consume it, so tasks published to it before an upgrade would otherwise never
+    run."""
+    channel = connection.channel()
+
+    try:
+        channel.queue_declare(PUBLIC_QUEUE, passive=True)
+    except ChannelClosedByBroker:
+        # The queue does not exist, so there is nothing to drain
+        return
+
+    channel.confirm_delivery()
+    moved = 0
+
+    while True:
+        method, properties, body = channel.basic_get(PUBLIC_QUEUE)
+
+        if method is None:
+            break
+
+        try:
+            task = Task.objects.get(id=json.loads(body)["id"])
+        except (KeyError, ValueError, Task.DoesNotExist) as exc:
+            logger.warning("Dropping message from %s queue: %s", PUBLIC_QUEUE, exc)
+        else:
+            exchange, routing_key = get_route(task)
+            channel.basic_publish(
+                exchange, routing_key, body, properties, mandatory=True
+            )
+            moved += 1
+
+        channel.basic_ack(method.delivery_tag)
+
+    logger.info("Moved %s tasks from the %s queue", moved, PUBLIC_QUEUE)
+
+    try:
+        channel.queue_delete(PUBLIC_QUEUE, if_empty=True)
+    except ChannelClosedByBroker as exc:
+        # Something is still publishing to the queue, so drain it again next time
+        logger.warning("Unable to delete the %s queue: %s", PUBLIC_QUEUE, exc)
+        return
+
+    channel.close()
+
+
 def connection_ready() -> bool:
     """Determine if we are able to connect to the message broker
 
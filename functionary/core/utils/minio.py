@@ -1,7 +1,10 @@
+import gzip
 import logging
 import os
+import zlib
 from datetime import timedelta
 from io import BytesIO
+from typing import Optional
 
 from constance import config
 from django.conf import settings
@@ -9,7 +12,6 @@ from django.http import HttpRequest
 from minio import Minio
 from minio.error import S3Error as MinioS3Error
 from urllib3.exceptions import MaxRetryError
-from urllib3.response import HTTPResponse
 
 from core.models import Task
 
@@ -18,6 +20,10 @@ logger = logging.getLogger(__name__)
 logger.setLevel(getattr(logging, LOG_LEVEL))
 
 
+# The smallest range requested when partially downloading a compressed file
+MIN_RANGED_READ_SIZE = 16 * 1024
+
+
 class S3Error(Exception):
     pass
 
@@ -109,16 +115,84 @@ class MinioInterface:
         except MinioS3Error:
             return False
 
-    def get_object(self, filename: str) -> HTTPResponse:
+    def get_object(
+        self, filename: str, offset: int = 0, length: int = 0
+    ) -> Optional[bytes]:
+        """Downloads all or part of a file from the bucket
+
+        Args:
+            filename: The name of the file
+            offset: The position of the first byte to download
+            length: The number of bytes to download, or 0 to download to the end
+
+        Returns:
+            The downloaded bytes, or None if the file does not exist
+        """
+        if not self.does_file_exist(filename):
+            return None
+
+        response = self.client.get_object(
+            self.bucket_name, filename, offset=offset, length=length
+        )
+
         try:
-            if not self.does_file_exist(filename):
-                return None
-            response: HTTPResponse = self.client.get_object(self.bucket_name, filename)
-            return response
+            return response.read()
         finally:
             response.close()
             response.release_conn()
 
+    def put_compressed_file(self, data: bytes, filename: str) -> None:
+        """Compresses data with gzip and uploads it to the bucket
+
+        Args:
+            data: The bytes to compress and upload
+            filename: The name of the file
+
+        Raises:
+            S3FileUploadError: Raised when file fails to get uploaded
+        """
+        compressed = gzip.compress(data)
+        self.put_file(BytesIO(compressed), len(compressed), filename)
+
+    def get_compressed_file(
+        self, filename: str, max_length: int = 0
+    ) -> Optional[bytes]:
+        """Downloads and decompresses a file uploaded with put_compressed_file
+
+        When max_length is given the file is downloaded with ranged reads, stopping
+        once max_length decompressed bytes are available.
+
+        Args:
+            filename: The name of the file
+            max_length: The maximum number of bytes to return, or 0 for all of them
+
+        Returns:
+            The decompressed bytes, or None if the file does not exist
+        """
+        if not max_length:
+            compressed = self.get_object(filename)
+            return None if compressed is None else gzip.decompress(compressed)
+
+        # A partially downloaded gzip stream can still be inflated by zlib
+        decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+        read_size = max(max_length, MIN_RANGED_READ_SIZE)
+        output = b""
+        offset = 0
+
+        while len(output) < max_length:
+            compressed = self.get_object(filename, offset=offset, length=read_size)
+
+            if compressed is None:
+                return None if offset == 0 else output
+
+            output += decompressor.decompress(compressed, max_length - len(output))
+            offset += len(compressed)
+
+            if len(compressed) < read_size:
+                break
+
+        return output
+
     def get_presigned_url(self, filename: str) -> str:
         if self.bucket_exists():
             return self.client.get_presigned_url(
@@ -1,7 +1,8 @@
 import datetime
 import json
 from copy import deepcopy
-from typing import TYPE_CHECKING, List, Type, TypeVar, Union
+from functools import lru_cache
+from typing import TYPE_CHECKING, List, Optional, Type, TypeVar, Union
 
 import jsonschema
 from django.core.exceptions import ValidationError as DjangoValidationError
@@ -37,15 +38,26 @@ _PARAMETER_TYPE_MAP = {
 
 PARAMETER_TYPE_CHOICES = [(_type, _type) for _type in _PARAMETER_TYPE_MAP.keys()]
 
+# Enough validators for the functions and workflows in use at any one time, as each
+# one that is evicted queries its parameter definitions again when it is next used
+PARAMETER_VALIDATOR_CACHE_SIZE = 1024
+
 DATE_FORMAT = r"%Y-%m-%d"
 DATETIME_FORMAT = r"%Y-%m-%dT%H:%M:%SZ"
 
 
-def _get_pydantic_model(instance: Union["Function", "Workflow"]) -> Type[BaseModel]:
-    """Get a pydantic model describing the parameters of the provided instance"""
+def _get_pydantic_model(
+    instance: Union["Function", "Workflow"],
+    parameters: Optional[List["FunctionParameter"]] = None,
+) -> Type[BaseModel]:
+    """Get a pydantic model describing the parameters of the provided instance.
+    The instance's parameters are queried unless they are provided."""
     params_dict = {}
 
-    for parameter in instance.parameters.all():
+    if parameters is None:
+        parameters = instance.parameters.all()
+
+    for parameter in parameters:
         field = Field()
         field.alias = parameter.name
         field.title = parameter.name
@@ -106,24 +118,6 @@ def _serialize_json_parameters(
         task_parameters[name] = json.dumps(task_parameters[name])
 
 
-def _serialize_parameters(
-    parameters: dict, instance: Union["Function", "Workflow"]
-) -> dict:
-    """Serializes json type parameters for use in validation"""
-    parameters_copy = deepcopy(parameters)
-
-    # Retrieve all parameters, then filter later, to avoid multiple database lookups
-    present_parameters = list(
-        instance.parameters.filter(name__in=parameters.keys()).all()
-    )
-
-    _serialize_date_parameters(parameters_copy, present_parameters)
-    _serialize_datetime_parameters(parameters_copy, present_parameters)
-    _serialize_json_parameters(parameters_copy, present_parameters)
-
-    return parameters_copy
-
-
 def get_schema(instance: Union["Function", "Workflow"]) -> dict:
     """Creates a pydantic model from the parameter definitions and returns the schema
     as a JSON string
@@ -134,7 +128,91 @@ def get_schema(instance: Union["Function", "Workflow"]) -> dict:
     Returns:
         An OpenAPI / JSON Schema compatible schema dictionary
     """
-    return _get_pydantic_model(instance).schema()
+    return get_validator(instance).schema
+
+
+class ParameterValidator:
+    """Validates parameters against the parameter definitions of a Function or
+    Workflow
+
+    The parameter definitions are queried and the pydantic model and JSON schema
+    validator are built once, when the ParameterValidator is created, so that many
+    sets of parameters can be validated without repeating that work.
+
+    Attributes:
+        instance: The Function or Workflow that parameters are validated against
+    """
+
+    def __init__(self, instance: Union["Function", "Workflow"]) -> None:
+        self.instance = instance
+        self._parameters = list(instance.parameters.all())
+        self._pydantic_model = _get_pydantic_model(instance, self._parameters)
+
+        self._schema = self._pydantic_model.schema()
+        validator_class = jsonschema.validators.validator_for(self._schema)
+        validator_class.check_schema(self._schema)
+        self._validator = validator_class(self._schema)
+
+    @property
+    def schema(self) -> dict:
+        """An OpenAPI / JSON Schema compatible schema dictionary"""
+        return deepcopy(self._schema)
+
+    def serialize(self, parameters: dict) -> dict:
+        """Serializes date, datetime and json type parameters for use in validation"""
+        parameters_copy = deepcopy(parameters)
+        present_parameters = [p for p in self._parameters if p.name in parameters]
+
+        _serialize_date_parameters(parameters_copy, present_parameters)
+        _serialize_datetime_parameters(parameters_copy, present_parameters)
+        _serialize_json_parameters(parameters_copy, present_parameters)
+
+        return parameters_copy
+
+    def validate(self, parameters: dict) -> None:
+        """Validate the provided input parameters
+
+        Args:
+            parameters: dict containing the parameters as key / value pairs
+
+        Raises:
+            ValidationError: The parameters are invalid for the instance
+        """
+        try:
+            serialized_parameters = self.serialize(parameters)
+            self._pydantic_model(**serialized_parameters)
+            self._validator.validate(serialized_parameters)
+        except (
+            ValidationError,
+            jsonschema.ValidationError,
+            json.JSONDecodeError,
+        ) as exc:
+            raise DjangoValidationError(exc)
+
+
+@lru_cache(maxsize=PARAMETER_VALIDATOR_CACHE_SIZE)
+def _get_cached_validator(
+    instance: Union["Function", "Workflow"], parameters_version: int
+) -> ParameterValidator:
+    """Build the validator for a version of the instance's parameter definitions.
+    parameters_version is not used to build it, only to key the cache."""
+    return ParameterValidator(instance)
+
+
+def get_validator(instance: Union["Function", "Workflow"]) -> ParameterValidator:
+    """Get the ParameterValidator for the instance's current parameter definitions
+
+    Validators are cached in each process and keyed by the instance's
+    parameters_version, so a validator is only built the first time a version of
+    the parameter definitions is used.
+
+    Args:
+        instance: Function or Workflow instance to validate parameters against
+
+    Returns:
+        A ParameterValidator for the instance
+    """
+    return _get_cached_validator(instance, instance.parameters_version)
 
 
 def validate_parameters(parameters: dict, instance: Union["Function", "Workflow"]):
@@ -148,15 +226,4 @@ def validate_parameters(parameters: dict, instance: Union["Function", "Workflow"
     Raises:
         ValidationError: The parameters are invalid for the provided instance
     """
-    try:
-        pydantic_model = _get_pydantic_model(instance)
-        serialized_parameters = _serialize_parameters(parameters, instance)
-        jsonschema.validate(
-            serialized_parameters, pydantic_model(**serialized_parameters).schema()
-        )
-    except (
-        ValidationError,
-        jsonschema.ValidationError,
-        json.JSONDecodeError,
-    ) as exc:
-        raise DjangoValidationError(exc)
+    get_validator(instance).validate(parameters)
@@ -1,21 +1,34 @@
 import logging
-from uuid import UUID
+from datetime import timedelta
+from typing import Callable, Iterable, Optional, Type, Union
 
 from celery.utils.log import get_task_logger
+from constance import config
 from django.conf import settings
+from django.db import transaction
+from django.db.models import Func, IntegerField, Sum
+from django.utils import timezone
 
 from core.celery import app
 from core.models import (
     Environment,
     ScheduledTask,
     Task,
+    TaskDispatch,
     TaskLog,
+    TaskLogChunk,
     TaskResult,
     WorkflowRunStep,
 )
-from core.utils.messaging import get_route, send_message
-from core.utils.minio import MinioInterface, generate_filename
+from core.utils.messaging import (
+    CONTROL_EXCHANGE,
+    BatchPublisher,
+    get_route,
+    send_message,
+)
+from core.utils.minio import MinioInterface, S3Error, generate_filename
 from core.utils.parameter import PARAMETER_TYPE
+from core.utils.variable import get_variables
 
 logger = get_task_logger(__name__)
 logger.setLevel(getattr(logging, settings.LOG_LEVEL))
@@ -23,13 +36,16 @@ logger.setLevel(getattr(logging, settings.LOG_LEVEL))
 
 def _generate_task_message(task: Task) -> dict:
     """Generates tasking message from the provided Task"""
-    variables = {var.name: var.value for var in task.variables}
+    variables = get_variables(task.environment).values(task.function.variables)
+
     return {
         "id": str(task.id),
         "package": task.function.package.full_image_name,
         "function": task.function.name,
         "function_parameters": task.parameters,
         "variables": variables,
+        "resources": task.function.resources,
+        "timeout": task.run_timeout,
     }
 
 
@@ -40,71 +56,367 @@ def _protect_output(task, output):
     long. This is arbitrary, but the results are easily reversed if
     its too short.
     """
-    mask = list(task.variables.filter(protect=True).values_list("value", flat=True))
-    protected_output = output
-    for to_mask in mask:
-        if len(to_mask) > 4:
-            protected_output = protected_output.replace(to_mask, "********")
+    return get_variables(task.environment).mask(output, task.function.variables)
 
-    return protected_output
 
+def dispatch_tasks(
+    batch_size: int = settings.TASK_DISPATCH_BATCH_SIZE,
+    environment: Optional[Environment] = None,
+    publisher_factory: Optional[Callable[[], BatchPublisher]] = None,
+) -> int:
+    """Publish a batch of the tasks waiting in the TaskDispatch outbox
 
-@app.task(
-    default_retry_delay=30,
-    retry_kwargs={
-        "max_retries": 3,
-    },
-    autoretry_for=(Exception,),
-)
-def publish_task(task_id: UUID) -> None:
-    """Publish the tasking message to the message broker so that it can be received
-    and executed by a runner.
+    The batch's outbox entries stay locked while their tasks are published, so that
+    several dispatchers can drain the outbox at once without publishing a task twice.
+    Entries are removed once their task is published, or if the task no longer needs
+    to be, such as when it was canceled. Entries whose task failed to publish are
+    retried after a delay that grows with each attempt. Once a task has failed to
+    publish TASK_DISPATCH_MAX_ATTEMPTS times it is marked as errored, along with any
+    ScheduledTask or WorkflowRun it belongs to, and its entry is removed.
 
     Args:
-        task_id: ID of the task to be executed
+        batch_size: The most tasks to publish
+        environment: Only publish the tasks of this Environment, rather than of every
+                     environment
+        publisher_factory: Creates the BatchPublisher that the tasks are published
+                           with. Defaults to BatchPublisher.
+
+    Returns:
+        The number of outbox entries that were handled
     """
-    logger.debug(f"Publishing message for Task: {task_id}")
+    entries = TaskDispatch.objects.filter(available_at__lte=timezone.now())
+
+    if environment is not None:
+        entries = entries.filter(task__environment=environment)
+
+    with transaction.atomic():
+        entries = list(
+            entries.select_for_update(skip_locked=True, of=("self",))
+            .select_related(
+                "task__function__package",
+                "task__environment",
+                "task__scheduled_task",
+            )
+            .order_by("available_at")[:batch_size]
+        )
+
+        if not entries:
+            return 0
+
+        publisher = (publisher_factory or BatchPublisher)()
+        publishing, done, failed = [], [], []
+        file_parameters = {}
+
+        for entry in entries:
+            task = entry.task
+
+            if task.status != Task.PENDING:
+                done.append(entry)
+                continue
+
+            try:
+                if task.function_id not in file_parameters:
+                    file_parameters[task.function_id] = _get_file_parameters(task)
+
+                _handle_file_parameters(task, file_parameters[task.function_id])
+                message = _generate_task_message(task)
+            except Exception as exc:
+                logger.warning(f"Unable to build message for Task {task.id}: {exc}")
+                failed.append((entry, exc))
+                continue
+
+            exchange, routing_key = get_route(task)
+            publisher.add(
+                exchange, routing_key, "TASK_PACKAGE", message, priority=task.priority
+            )
+            publishing.append(entry)
+
+        for entry, error in zip(publishing, publisher.publish()):
+            if error:
+                logger.warning(f"Unable to publish Task {entry.task_id}: {error!r}")
+                failed.append((entry, error))
+            else:
+                done.append(entry)
+
+        retrying, abandoned = [], []
+
+        for entry, error in failed:
+            entry.attempts += 1
+
+            if entry.attempts >= settings.TASK_DISPATCH_MAX_ATTEMPTS:
+                abandoned.append((entry.task, error))
+                done.append(entry)
+                continue
+
+            entry.available_at = timezone.now() + timedelta(
+                seconds=min(2**entry.attempts, settings.TASK_DISPATCH_MAX_BACKOFF)
+            )
+            retrying.append(entry)
+
+        TaskDispatch.objects.filter(id__in=[entry.id for entry in done]).delete()
+        TaskDispatch.objects.bulk_update(retrying, ["attempts", "available_at"])
+
+        if abandoned:
+            _fail_undispatchable_tasks(abandoned)
+
+    return len(entries)
+
+
+def _fail_undispatchable_tasks(abandoned: list[tuple[Task, Exception]]) -> None:
+    """Mark the tasks that could not be published as errored, recording the reason in
+    their log, and error the ScheduledTasks and WorkflowRuns they belong to"""
+    tasks = []
+    task_logs = []
+
+    for task, error in abandoned:
+        logger.error(f"Giving up on publishing Task {task.id}: {error!r}")
+        task.status = Task.ERROR
+        task.updated_at = timezone.now()
+        tasks.append(task)
+        task_logs.append(
+            _build_task_output(TaskLog, task, f"Unable to publish the task: {error}\n")
+        )
+
+    TaskLog.objects.bulk_create(task_logs, ignore_conflicts=True)
+    Task.objects.bulk_update(tasks, ["status", "updated_at"])
+
+    for task in tasks:
+        if task.scheduled_task is not None:
+            task.scheduled_task.error()
+
+    transaction.on_commit(lambda: _handle_workflow_runs(tasks))
+
+
+def record_task_log_chunks(task_log_chunk_messages: list[dict]) -> None:
+    """Masks and records a batch of log output chunks streamed from runners
+
+    Args:
+        task_log_chunk_messages: The message bodies from TASK_LOG_CHUNK messages.
+    """
+    tasks = _get_tasks_for_messages(task_log_chunk_messages, "log")
+    folded_sequences = dict(
+        TaskLog.objects.filter(
+            task__in=tasks.values(), folded_sequence__isnull=False
+        ).values_list("task", "folded_sequence")
+    )
+    chunks = []
+
+    for message in task_log_chunk_messages:
+        if not (task := tasks.get(str(message["task_id"]))):
+            continue
+
+        # Once the chunks are folded into a stored log that log is final, so chunks
+        # that arrive afterwards are dropped rather than shown ahead of it
+        if (folded_sequence := folded_sequences.get(task.id)) is not None:
+            if message["sequence"] > folded_sequence:
+                logger.warning(
+                    "Dropping log chunk %s of task %s that arrived after its log "
+                    "was stored",
+                    message["sequence"],
+                    task.id,
+                )
+            continue
+
+        chunks.append(
+            TaskLogChunk(
+                task=task,
+                sequence=message["sequence"],
+                data=_protect_output(task, message["data"]),
+            )
+        )
+
+    # Chunks are delivered at least once, so ignore any already recorded
+    TaskLogChunk.objects.bulk_create(chunks, ignore_conflicts=True)
+
+
+def record_task_results(task_result_messages: list[dict]) -> None:
+    """Records the logs, results and statuses for a batch of finished tasks
+
+    Everything is written in a single transaction. Continuing any WorkflowRuns that
+    the tasks are part of happens once the transaction is committed. Results for tasks
+    that have already finished, such as from a redelivered message, are ignored. The
+    output of canceled tasks is recorded, but they keep their status.
+
+    Args:
+        task_result_messages: The message bodies from TASK_RESULT messages.
+    """
+    tasks = _get_tasks_for_messages(task_result_messages, "results")
+    chunk_sizes = _get_log_chunk_sizes(tasks.values())
+    finished_tasks = []
+    task_logs = []
+    task_results = []
+
+    with transaction.atomic():
+        for message in task_result_messages:
+            task = tasks.pop(str(message["task_id"]), None)
+
+            if task is None or (
+                task.status in Task.FINISHED_STATUSES and task.status != Task.CANCELED
+            ):
+                continue
+
+            output = _protect_output(task, message.get("output", ""))
+            task_logs.append(_build_task_log(task, output, chunk_sizes.get(task.id, 0)))
+            task_results.append(_build_task_output(TaskResult, task, message["result"]))
+
+            if task.status == Task.CANCELED:
+                continue
+
+            task.status = _get_finished_status(message)
+            task.updated_at = timezone.now()
+            finished_tasks.append(task)
+
+        TaskLog.objects.bulk_create(task_logs, ignore_conflicts=True)
+        TaskResult.objects.bulk_create(task_results, ignore_conflicts=True)
+        Task.objects.bulk_update(finished_tasks, ["status", "updated_at"])
+
+        for task in finished_tasks:
+            if (
+                task.status in [Task.ERROR, Task.TIMEOUT]
+                and task.scheduled_task is not None
+            ):
+                task.scheduled_task.error()
 
-    task = Task.objects.select_related(
-        "function", "function__package", "environment"
-    ).get(id=task_id)
+        transaction.on_commit(lambda: _handle_workflow_runs(finished_tasks))
 
-    _handle_file_parameters(task)
 
-    exchange, routing_key = get_route(task)
-    send_message(exchange, routing_key, "TASK_PACKAGE", _generate_task_message(task))
+def _get_finished_status(task_result_message: dict) -> str:
+    """Determine the status of a finished task from its TASK_RESULT message"""
+    match task_result_message.get("reason"):
+        case "TIMEOUT":
+            return Task.TIMEOUT
+        case "CANCELED":
+            return Task.CANCELED
 
+    # TODO: This status determination feels like it belongs in the runner.
+    #       This should be reworked so that there are explicitly known
+    #       statuses that could come back from the runner, rather than
+    #       passing through the command exit status as is happening now.
+    return Task.COMPLETE if task_result_message["status"] == 0 else Task.ERROR
 
-@app.task()
-def record_task_result(task_result_message: dict) -> None:
-    """Parses the task result message and generates a TaskResult entry for it
+
+def cancel_task(task: Task) -> bool:
+    """Cancel a task that has not finished
+
+    The task is marked as canceled straight away and every runner is told to stop
+    it, in case one of them has already started it.
 
     Args:
-        task_result_message: The message body from a TASK_RESULT message.
+        task: The task to cancel
+
+    Returns:
+        True if the task was canceled, False if it had already finished
     """
-    task_id = task_result_message["task_id"]
-    status = task_result_message["status"]
-    output = task_result_message["output"]
-    result = task_result_message["result"]
+    with transaction.atomic():
+        canceled = Task.objects.filter(
+            id=task.id, status__in=[Task.PENDING, Task.IN_PROGRESS]
+        ).update(status=Task.CANCELED, updated_at=timezone.now())
+
+        if not canceled:
+            return False
+
+        task.refresh_from_db(fields=["status", "updated_at"])
+        transaction.on_commit(lambda: _handle_workflow_runs([task]))
+
+    try:
+        send_message(CONTROL_EXCHANGE, "", "CANCEL_TASK", {"task_id": str(task.id)})
+    except Exception as exc:
+        # The task is canceled even if no runner can be told about it
+        logger.warning(f"Unable to send cancel message for Task {task.id}: {exc}")
+
+    return True
+
+
+def _get_tasks_for_messages(messages: list[dict], description: str) -> dict:
+    """Fetch the tasks that the messages are for, keyed by task id"""
+    task_ids = {str(message["task_id"]) for message in messages}
+    tasks = {
+        str(task.id): task
+        for task in Task.objects.select_related(
+            "function", "environment", "scheduled_task"
+        ).filter(id__in=task_ids)
+    }
+
+    for task_id in task_ids - tasks.keys():
+        logger.error(
+            "Unable to record %s for task %s: task not found", description, task_id
+        )
+
+    return tasks
+
+
+def _exceeds_offload_size(size: int) -> bool:
+    """Whether output of the given size should be stored in S3"""
+    offload_size = config.TASK_OUTPUT_OFFLOAD_SIZE
+    return bool(offload_size) and size > offload_size
+
+
+def _build_task_output(
+    model: Union[Type[TaskLog], Type[TaskResult]], task: Task, content: str
+) -> Union[TaskLog, TaskResult]:
+    """Build a TaskLog or TaskResult for the content, storing the content in the
+    environment's S3 bucket if it is larger than the configured offload size"""
+    data = content.encode()
+    task_output = model(task=task, size=len(data), **{model.content_field: content})
+
+    if not _exceeds_offload_size(len(data)):
+        return task_output
+
+    object_name = f"{task.id}/{model.__name__.lower()}.gz"
 
     try:
-        task = Task.objects.select_related("function", "environment").get(id=task_id)
-    except Task.DoesNotExist:
-        logger.error("Unable to record results for task %s: task not found", task_id)
-        return
+        minio = MinioInterface(bucket_name=str(task.environment_id))
+        minio.put_compressed_file(data, object_name)
+    except S3Error as exc:
+        logger.warning("Storing output of task %s in the database: %s", task.id, exc)
+        return task_output
+
+    setattr(task_output, model.content_field, "")
+    task_output.object_name = object_name
 
-    TaskLog.objects.create(task=task, log=_protect_output(task, output))
-    TaskResult.objects.create(task=task, result=result)
+    return task_output
 
-    # TODO: This status determination feels like it belongs in the runner. This should
-    #       be reworked so that there are explicitly known statuses that could come
-    #       back from the runner, rather than passing through the command exit status
-    #       as is happening now.
-    _update_task_status(task, status)
 
-    # If this task is part of a WorkflowRun continue it or update its status
-    if workflow_run_step := WorkflowRunStep.objects.filter(task=task):
-        _handle_workflow_run(workflow_run_step.get(), task)
+class OctetLength(Func):
+    """The length of a text value in bytes, as Length counts characters"""
+
+    function = "OCTET_LENGTH"
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return super().as_sql(
+            compiler, connection, template="LENGTH(CAST(%(expressions)s AS BLOB))"
+        )
+
+
+def _get_log_chunk_sizes(tasks: Iterable[Task]) -> dict:
+    """Get the total size of the streamed log chunks of each task, keyed by task id.
+    The sizes are only needed to decide what to store in S3, so they are not queried
+    when that is disabled."""
+    if not config.TASK_OUTPUT_OFFLOAD_SIZE:
+        return {}
+
+    return dict(
+        TaskLogChunk.objects.filter(task__in=tasks)
+        .values_list("task")
+        .annotate(size=Sum(OctetLength("data")))
+    )
+
+
+def _build_task_log(task: Task, output: str, chunks_size: int) -> TaskLog:
+    """Build the TaskLog for the task's output. When the streamed log chunks and
+    output are large enough to be stored in S3 they are combined into a single stored
+    log."""
+    if not chunks_size or not _exceeds_offload_size(chunks_size + len(output.encode())):
+        return _build_task_output(TaskLog, task, output)
+
+    log_chunks = task.log_chunks.all()
+    sequences, chunks = zip(*log_chunks.values_list("sequence", "data"))
+    task_log = _build_task_output(TaskLog, task, "".join(chunks) + output)
+    task_log.folded_sequence = sequences[-1]
+    log_chunks.delete()
+
+    return task_log
 
 
 @app.task
@@ -136,34 +448,33 @@ def run_scheduled_task(scheduled_task_id: str) -> None:
     scheduled_task.update_most_recent_task(task)
 
 
-def _update_task_status(task: Task, status: int) -> None:
-    match status:
-        case 0:
-            task.status = Task.COMPLETE
-        case _:
-            task.status = Task.ERROR
-
-    task.save()
-
-    if task.scheduled_task is not None and status == "ERROR":
-        task.scheduled_task.error()
+def _handle_workflow_runs(tasks: list[Task]) -> None:
+    """Continue or update the status of the WorkflowRuns the tasks are part of"""
+    workflow_run_steps = WorkflowRunStep.objects.select_related("workflow_run").filter(
+        task__in=tasks
+    )
+    workflow_runs = {
+        workflow_run_step.workflow_run_id: workflow_run_step.workflow_run
+        for workflow_run_step in workflow_run_steps
+    }
 
+    # Each run is advanced once, however many of its tasks finished
+    for workflow_run in workflow_runs.values():
+        workflow_run.advance()
 
-def _handle_workflow_run(workflow_run_step: WorkflowRunStep, task: Task) -> None:
-    """Start the next task for a WorkflowRun or update its status as appropriate"""
-    workflow_run = workflow_run_step.workflow_run
 
-    match task.status:
-        case Task.COMPLETE:
-            if next_step := workflow_run_step.workflow_step.next:
-                next_step.execute(workflow_run=workflow_run)
-            else:
-                workflow_run.complete()
-        case Task.ERROR:
-            workflow_run.error()
+def _get_file_parameters(task: Task) -> list[str]:
+    """Get the names of the task's function's file parameters"""
+    return list(
+        task.function.parameters.filter(parameter_type=PARAMETER_TYPE.FILE).values_list(
+            "name", flat=True
+        )
+    )
 
 
-def _handle_file_parameters(task: Task) -> None:
+def _handle_file_parameters(
+    task: Task, file_parameters: Optional[list[str]] = None
+) -> None:
     """Update all file parameter's filenames to presigned URLs
 
     This function will mutate all file parameters to their
@@ -173,6 +484,8 @@ def _handle_file_parameters(task: Task) -> None:
 
     Arguments:
         task: The task that is about to be sent to the runner
+        file_parameters: The names of the function's file parameters, if already
+            known
 
     Returns:
         None
@@ -180,10 +493,12 @@ def _handle_file_parameters(task: Task) -> None:
     environment = task.environment
     parameters = task.parameters
 
-    for parameter in task.function.parameters.filter(
-        parameter_type=PARAMETER_TYPE.FILE, name__in=parameters.keys()
-    ):
-        param_name = parameter.name
+    if file_parameters is None:
+        file_parameters = _get_file_parameters(task)
+
+    for param_name in file_parameters:
+        if param_name not in parameters:
+            continue
 
         filename = generate_filename(task, param_name, parameters[param_name])
         parameters[param_name] = _get_presigned_url(filename, environment)
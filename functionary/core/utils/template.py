@@ -0,0 +1,245 @@
+"""Rendering of WorkflowStep parameter templates
+
+A parameter template is the JSON of a step's parameters, where values may be
+references to the workflow's parameters and step results, such as
+{"count": {{parameters.count}}, "name": "{{step_name.result}}"}.
+
+Templates that only contain references are compiled once into the parsed JSON, with
+placeholders where the references were. Rendering substitutes the referenced values
+into the parsed JSON, so results are neither serialized into text nor parsed again.
+Templates that use any other template syntax, such as filters or tags, are rendered
+as django templates.
+"""
+
+import json
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any, Union
+from uuid import UUID
+
+from django.template import Context, Template
+
+if TYPE_CHECKING:
+    from core.models import WorkflowStep
+
+# Compiled templates are small, so one is kept for every step likely to run
+PARAMETER_TEMPLATE_CACHE_SIZE = 1024
+
+REFERENCE = re.compile(r"{{\s*([\w\.]+)\s*}}")
+
+# References are replaced by their index between these while the template is parsed
+PLACEHOLDER = re.compile("\x00([0-9]+)\x00")
+
+
+def get_template_context(results: dict, **extra) -> Context:
+    """Build the django template Context for rendering parameter templates
+
+    Args:
+        results: The parameters and step results of a WorkflowRun
+        extra: Additional values to make available, such as the item that a mapped
+               step is run for
+
+    Returns:
+        A Context in which the parameters and additional values are JSON encoded
+    """
+    context = {**results, "parameters": {}}
+
+    for key, value in results["parameters"].items():
+        context["parameters"][key] = json.dumps(value)
+
+    for key, value in extra.items():
+        context[key] = json.dumps(value)
+
+    return Context(context)
+
+
+def resolve_reference(values: dict, reference: str) -> Any:
+    """Look up a dotted reference, such as step_name.result.key, in the values
+
+    Args:
+        values: The parameters and step results of a WorkflowRun, along with any
+                additional values such as the item that a mapped step is run for
+        reference: The dotted reference
+
+    Returns:
+        The referenced value
+
+    Raises:
+        ValueError: The reference does not resolve to a value
+    """
+    value: Any = values
+
+    for key in reference.split("."):
+        if isinstance(value, dict) and key in value:
+            value = value[key]
+        elif isinstance(value, list) and key.isdigit() and int(key) < len(value):
+            value = value[int(key)]
+        else:
+            raise ValueError(f"{reference} does not refer to a value")
+
+    return value
+
+
+class StructuredTemplate:
+    """A parameter template parsed as JSON, with placeholders for its references
+
+    Attributes:
+        references: The dotted reference of each placeholder
+        structure: The parsed template
+    """
+
+    def __init__(self, references: list[str], structure: Any) -> None:
+        self.references = references
+        self.structure = structure
+
+    def render(self, results: dict, **extra) -> Any:
+        """Substitute the referenced values into the template
+
+        Args:
+            results: The parameters and step results of a WorkflowRun
+            extra: Additional values to make available
+
+        Returns:
+            The parameters
+
+        Raises:
+            ValueError: A reference does not resolve to a value
+        """
+        available = {**results, **extra}
+        values = [
+            resolve_reference(available, reference) for reference in self.references
+        ]
+
+        return self._substitute(self.structure, values)
+
+    def _substitute(self, node: Any, values: list) -> Any:
+        match node:
+            case dict():
+                return {
+                    self._substitute(key, values): self._substitute(value, values)
+                    for key, value in node.items()
+                }
+            case list():
+                return [self._substitute(value, values) for value in node]
+            case str() if "\x00" in node:
+                # A value that is only a reference is replaced by the referenced value
+                if (match := PLACEHOLDER.fullmatch(node)) is not None:
+                    return values[int(match.group(1))]
+
+                return PLACEHOLDER.sub(
+                    lambda match: _to_text(values[int(match.group(1))]), node
+                )
+
+        return node
+
+
+class DjangoTemplate:
+    """A parameter template that is rendered as a django template
+
+    Attributes:
+        template: The compiled django template
+    """
+
+    def __init__(self, template: Template) -> None:
+        self.template = template
+
+    def render(self, results: dict, **extra) -> Any:
+        """Render the template and parse the result as JSON
+
+        Args:
+            results: The parameters and step results of a WorkflowRun
+            extra: Additional values to make available
+
+        Returns:
+            The parameters
+        """
+        context = get_template_context(results, **extra)
+
+        return json.loads(self.template.render(context).replace("&quot;", '"'))
+
+
+def _to_text(value: Any) -> str:
+    """The text to put in place of a reference within a string"""
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def compile_template(
+    parameter_template: str,
+) -> Union[StructuredTemplate, DjangoTemplate]:
+    """Compile a parameter template
+
+    Args:
+        parameter_template: The template
+
+    Returns:
+        A StructuredTemplate, or a DjangoTemplate if the template uses template
+        syntax other than references
+
+    Raises:
+        ValueError: The template is not valid JSON once its references are replaced
+    """
+    unreferenced = REFERENCE.sub("", parameter_template)
+
+    if "{%" in unreferenced or "{{" in unreferenced:
+        return DjangoTemplate(Template(parameter_template))
+
+    references = []
+    pieces = []
+    in_string = False
+    escaped = False
+    index = 0
+
+    # Track whether each reference is within a string, as references that are a
+    # value by themselves are not quoted
+    while index < len(parameter_template):
+        character = parameter_template[index]
+
+        if match := REFERENCE.match(parameter_template, index):
+            placeholder = f"\\u0000{len(references)}\\u0000"
+            references.append(match.group(1))
+            pieces.append(placeholder if in_string else f'"{placeholder}"')
+            index = match.end()
+            continue
+
+        if escaped:
+            escaped = False
+        elif character == "\\":
+            escaped = in_string
+        elif character == '"':
+            in_string = not in_string
+
+        pieces.append(character)
+        index += 1
+
+    return StructuredTemplate(references, json.loads("".join(pieces)))
+
+
+@lru_cache(maxsize=PARAMETER_TEMPLATE_CACHE_SIZE)
+def _get_cached_template(
+    step_id: UUID, revision: int, template: str
+) -> Union[StructuredTemplate, DjangoTemplate]:
+    """Compile the step's template. Saving the step changes its revision, so an
+    edited template misses the cache and is compiled again. Only the step's id is
+    part of the key, so that the cache does not keep step instances alive."""
+    return compile_template(template)
+
+
+def get_parameter_template(
+    step: "WorkflowStep",
+) -> Union[StructuredTemplate, DjangoTemplate]:
+    """Get the compiled parameter template of a WorkflowStep
+
+    Templates are cached in each process and keyed by the step's revision, which
+    changes whenever the step is saved, so a template is only compiled the first time
+    a revision of the step runs.
+
+    Args:
+        step: The WorkflowStep
+
+    Returns:
+        The compiled template
+
+    Raises:
+        ValueError: The template is not valid JSON once its references are replaced
+    """
+    return _get_cached_template(step.id, step.revision, step.parameter_template or "{}")
@@ -0,0 +1,124 @@
+import re
+from functools import lru_cache
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from django.db.models import Q
+
+if TYPE_CHECKING:
+    from core.models import Environment, Variable
+
+# Snapshots hold every variable of their environment, so fewer are kept than there
+# are validators or templates
+VARIABLE_SNAPSHOT_CACHE_SIZE = 256
+
+# Values this short are not masked. This is arbitrary, but the results are easily
+# reversed if they are too short.
+MIN_MASKED_LENGTH = 5
+
+MASK = "********"
+
+
+class VariableSnapshot:
+    """The resolved variables of an Environment at a point in time
+
+    Environment variables override Team variables of the same name. The patterns used
+    to mask protected values are compiled once per set of variable names and reused.
+
+    Attributes:
+        variables: the resolved variables, keyed by name
+    """
+
+    def __init__(self, variables: Iterable["Variable"]) -> None:
+        self.variables: dict[str, "Variable"] = {}
+
+        for variable in variables:
+            if variable.team_id is None or variable.name not in self.variables:
+                self.variables[variable.name] = variable
+
+        self._mask_patterns: dict[frozenset[str], Optional[re.Pattern]] = {}
+
+    def values(self, names: Iterable[str]) -> dict[str, str]:
+        """Get the values of the named variables that are set
+
+        Args:
+            names: the names of the variables to get
+
+        Returns:
+            A dict of the variable values keyed by name
+        """
+        return {
+            name: self.variables[name].value for name in names if name in self.variables
+        }
+
+    def mask(self, output: str, names: Iterable[str]) -> str:
+        """Mask the values of the named protected variables in the output
+
+        All of the values are replaced in a single pass over the output, with longer
+        values taking precedence over values they contain.
+
+        Args:
+            output: the text to mask
+            names: the names of the variables whose values should be masked
+
+        Returns:
+            The masked output
+        """
+        if not output:
+            return output
+
+        if pattern := self._get_mask_pattern(frozenset(names)):
+            return pattern.sub(MASK, output)
+
+        return output
+
+    def _get_mask_pattern(self, names: frozenset[str]) -> Optional[re.Pattern]:
+        """Get the compiled pattern matching the protected values of the named
+        variables, or None if there are none to mask"""
+        if names not in self._mask_patterns:
+            protected_values = {
+                variable.value
+                for name in names
+                if (variable := self.variables.get(name))
+                and variable.protect
+                and len(variable.value) >= MIN_MASKED_LENGTH
+            }
+            ordered_values = sorted(protected_values, key=len, reverse=True)
+
+            self._mask_patterns[names] = (
+                re.compile("|".join(re.escape(value) for value in ordered_values))
+                if ordered_values
+                else None
+            )
+
+        return self._mask_patterns[names]
+
+
+@lru_cache(maxsize=VARIABLE_SNAPSHOT_CACHE_SIZE)
+def _get_cached_snapshot(
+    environment: "Environment", variables_version: int
+) -> VariableSnapshot:
+    """Query the variables visible in the environment. A bumped variables_version
+    misses the cache, so changed variables are queried again."""
+    from core.models import Variable
+
+    variables = Variable.objects.filter(
+        Q(environment_id=environment.id) | Q(team_id=environment.team_id)
+    )
+
+    return VariableSnapshot(variables)
+
+
+def get_variables(environment: "Environment") -> VariableSnapshot:
+    """Get a snapshot of the variables visible in the environment
+
+    Snapshots are cached in each process and keyed by the environment's
+    variables_version, so the variables are only queried the first time a version
+    is used.
+
+    Args:
+        environment: The Environment to get the variables of
+
+    Returns:
+        A VariableSnapshot of the environment's variables
+    """
+    return _get_cached_snapshot(environment, environment.variables_version)
@@ -1,4 +1,4 @@
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Iterable
 
 from django.db import transaction
 
@@ -30,7 +30,8 @@ def add_step(
         The created WorkflowStep
 
     Raises:
-        ValueError: workflow and next.workflow do not match
+        ValueError: workflow and next.workflow do not match, or the steps would
+            depend on each other in a cycle
     """
     if next is not None and workflow != next.workflow:
         raise ValueError("Provided next step is not part of provided workflow")
@@ -50,6 +51,8 @@ def add_step(
             before_step.next = new_step
             before_step.save()
 
+        validate_sequence(workflow)
+
     return new_step
 
 
@@ -69,6 +72,12 @@ def remove_step(step: WorkflowStep) -> None:
             before.next = step.next
             before.save()
 
+        # Steps that depended on the removed step still wait for what it waited for
+        dependencies = list(step.depends_on.all())
+
+        for dependent in step.dependents.all():
+            dependent.depends_on.add(*dependencies)
+
         step.delete()
 
 
@@ -85,7 +94,8 @@ def move_step(step: WorkflowStep, next: WorkflowStep | None = None) -> None:
         None
 
     Raises:
-        ValueError: The provided steps are not part of the same Workflow
+        ValueError: The provided steps are not part of the same Workflow, or
+            moving the step would make the steps depend on each other in a cycle
     """
     if next is not None and step.workflow != next.workflow:
         raise ValueError("Provided step must be a member of the same Workflow")
@@ -105,3 +115,104 @@ def move_step(step: WorkflowStep, next: WorkflowStep | None = None) -> None:
 
         step.next = next
         step.save()
+
+        # Steps without declared dependencies depend on the step before them, so
+        # moving a step changes what they depend on
+        validate_sequence(step.workflow)
+
+
+def validate_dependencies(
+    step: WorkflowStep, depends_on: Iterable[WorkflowStep]
+) -> None:
+    """Check that a WorkflowStep is able to depend on the provided steps
+
+    Args:
+        step: The WorkflowStep that would depend on the steps
+        depends_on: The WorkflowSteps that step would depend on
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: The provided steps are not part of the same Workflow, or
+            depending on them would make the steps depend on each other in a cycle
+    """
+    depends_on = list(depends_on)
+
+    if any(dependency.workflow_id != step.workflow_id for dependency in depends_on):
+        raise ValueError("Provided steps must be members of the same Workflow")
+
+    graph = step.workflow.get_dependencies()
+
+    # Without any declared dependencies, step depends on the step before it
+    graph[step.id] = {dependency.id for dependency in depends_on} or set(
+        WorkflowStep.objects.filter(next=step).values_list("id", flat=True)
+    )
+
+    # Follow the dependencies from step, which must not lead back to it
+    visited = set()
+    to_visit = list(graph[step.id])
+
+    while to_visit:
+        if (step_id := to_visit.pop()) == step.id:
+            raise ValueError(f"Step {step.name} would depend on itself")
+
+        if step_id not in visited:
+            visited.add(step_id)
+            to_visit.extend(graph.get(step_id, ()))
+
+
+def validate_sequence(workflow: Workflow) -> None:
+    """Check that the steps of a Workflow do not depend on each other in a cycle,
+    counting the step before each step without declared dependencies
+
+    Args:
+        workflow: The Workflow to check
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: The steps depend on each other in a cycle
+    """
+    dependencies = workflow.get_dependencies()
+    remaining = {step_id: set(ids) for step_id, ids in dependencies.items()}
+
+    # Repeatedly remove the steps whose dependencies have all been removed. Only
+    # steps that are part of, or depend on, a cycle are left.
+    while ready := [step_id for step_id, ids in remaining.items() if not ids]:
+        for step_id in ready:
+            del remaining[step_id]
+
+        for ids in remaining.values():
+            ids.difference_update(ready)
+
+    if remaining:
+        names = WorkflowStep.objects.filter(id__in=remaining).values_list(
+            "name", flat=True
+        )
+        raise ValueError(
+            f"Steps {', '.join(sorted(names))} would depend on each other in a cycle"
+        )
+
+
+def set_dependencies(step: WorkflowStep, depends_on: Iterable[WorkflowStep]) -> None:
+    """Set the steps that a WorkflowStep depends on, so that it runs as soon as they
+    complete rather than after the step before it
+
+    Args:
+        step: The WorkflowStep to set the dependencies of
+        depends_on: The WorkflowSteps that must complete before step runs. When
+            empty, step depends on the step before it again.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: The provided steps are not part of the same Workflow, or
+            depending on them would make the steps depend on each other in a cycle
+    """
+    depends_on = list(depends_on)
+    validate_dependencies(step, depends_on)
+
+    step.depends_on.set(depends_on)
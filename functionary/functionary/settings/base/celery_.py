@@ -1,4 +1,5 @@
 """Celery related settings"""
+
 from os import getenv
 
 RABBITMQ_HOST = getenv("RABBITMQ_HOST", "localhost")
@@ -9,3 +10,24 @@ RABBITMQ_VHOST = getenv("RABBITMQ_FUNCTIONARY_VHOST", "functionary")
 CELERY_BROKER_URL = (
     f"amqp://{RABBITMQ_USER}:{RABBITMQ_PASSWORD}@{RABBITMQ_HOST}:{RABBITMQ_PORT}"
 )
+
+# The listener records task results in batches of up to this many messages, waiting at
+# most the window, in seconds, for a batch to fill
+RESULT_BATCH_SIZE = int(getenv("RESULT_BATCH_SIZE", 100))
+RESULT_BATCH_WINDOW = float(getenv("RESULT_BATCH_WINDOW", 0.5))
+
+# The number of unacked task result messages the broker will deliver to each of the
+# listener's consumers. Kept at no less than the batch size so that batches can fill.
+RESULT_PREFETCH_COUNT = max(
+    int(getenv("RESULT_PREFETCH_COUNT", 2 * RESULT_BATCH_SIZE)), RESULT_BATCH_SIZE
+)
+
+# When recording task results fails because the database is unavailable, the listener
+# requeues the messages after this many seconds, doubling the delay for each further
+# failure up to the maximum
+RESULT_RETRY_DELAY = float(getenv("RESULT_RETRY_DELAY", 1))
+RESULT_RETRY_MAX_DELAY = float(getenv("RESULT_RETRY_MAX_DELAY", 30))
+
+# The number of consumers each listener process records task results with. Each has
+# its own connection to RabbitMQ and its own thread.
+RESULT_CONSUMERS = int(getenv("RESULT_CONSUMERS", 1))
@@ -20,6 +20,12 @@ CONSTANCE_CONFIG = {
     "S3_SECRET_KEY": ("", "Secret Key", str),
     "S3_SECURE": (False, "Require Secure Access", bool),
     "S3_PRESIGNED_URL_TIMEOUT_MINUTES": (5, "Download URL Timeout (minutes)", int),
+    "TASK_OUTPUT_OFFLOAD_SIZE": (
+        0,
+        "Task logs and results larger than this many bytes are stored in S3 rather "
+        "than the database. Set to 0 to always use the database.",
+        int,
+    ),
 }
 CONSTANCE_CONFIG_FIELDSETS = {
     "S3 Settings": {
@@ -33,6 +39,7 @@ CONSTANCE_CONFIG_FIELDSETS = {
             "S3_PRESIGNED_URL_TIMEOUT_MINUTES",
         )
     },
+    "Task Output Settings": {"fields": ("TASK_OUTPUT_OFFLOAD_SIZE",)},
     "HIDDEN": {"fields": ("SOCIALACCOUNT_PROVIDERS",)},
 }
 
@@ -5,3 +5,23 @@ RABBITMQ_PORT = os.getenv("RABBITMQ_PORT", 5672)
 RABBITMQ_MANAGEMENT_PORT = os.getenv("RABBITMQ_MANAGEMENT_PORT", 15672)
 RABBITMQ_USER = os.getenv("RABBITMQ_USER")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD")
+
+# The most seconds that a batch of messages waits for the broker to confirm them
+RABBITMQ_CONFIRM_TIMEOUT = float(os.getenv("RABBITMQ_CONFIRM_TIMEOUT", 30))
+
+# Tasks are spread over this many queues by environment, so that a burst of tasks in
+# one environment only delays the environments that share its queue. Must match the
+# runners' FUNCTIONARY_TASK_QUEUE_SHARDS.
+TASK_QUEUE_SHARDS = int(os.getenv("TASK_QUEUE_SHARDS", 4))
+
+# The dispatcher publishes new tasks in batches of up to this many, checking for more
+# at the interval, in seconds, whenever it runs out
+TASK_DISPATCH_BATCH_SIZE = int(os.getenv("TASK_DISPATCH_BATCH_SIZE", 100))
+TASK_DISPATCH_INTERVAL = float(os.getenv("TASK_DISPATCH_INTERVAL", 0.2))
+
+# The most seconds to wait before retrying a task that failed to publish
+TASK_DISPATCH_MAX_BACKOFF = int(os.getenv("TASK_DISPATCH_MAX_BACKOFF", 300))
+
+# Tasks that fail to publish this many times are marked as errored and no longer
+# retried, as the failure is likely permanent, such as a missing file parameter
+TASK_DISPATCH_MAX_ATTEMPTS = int(os.getenv("TASK_DISPATCH_MAX_ATTEMPTS", 10))
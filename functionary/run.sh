@@ -32,6 +32,10 @@ run_listener() {
     python manage.py run_listener
 }
 
+run_dispatcher() {
+    python manage.py run_dispatcher
+}
+
 run_worker() {
     python manage.py run_worker
 }
@@ -60,6 +64,7 @@ start() {
 # load_fixture      - Load fixture data
 # runserver         - Start django dev server
 # run_listener      - Start the message listener
+# run_dispatcher    - Start the task dispatcher
 # run_worker        - Start the general task worker
 # run_build_worker  - Start the package build worker
 # start             - Start application in Production mode
@@ -81,6 +86,9 @@ case $mode in
     run_listener)
     run_listener;;
 
+    run_dispatcher)
+    run_dispatcher;;
+
     run_worker)
     run_worker;;
 
@@ -1,9 +1,11 @@
 from typing import TYPE_CHECKING, Union
 
 from django import forms
+from django.db import transaction
 from django.urls import reverse
 
 from core.models import WorkflowStep
+from core.utils.workflow import set_dependencies, validate_dependencies
 
 if TYPE_CHECKING:
     from uuid import UUID
@@ -60,4 +62,33 @@ class WorkflowStepUpdateForm(WorkflowStepCreateForm):
 
     class Meta:
         model = WorkflowStep
-        fields = ["name", "function"]
+        fields = ["name", "function", "depends_on", "map_over"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Only the other steps of the workflow can be depended on
+        self.fields["depends_on"].queryset = WorkflowStep.objects.filter(
+            workflow=self.instance.workflow_id
+        ).exclude(pk=self.instance.pk)
+
+    def clean_depends_on(self):
+        depends_on = self.cleaned_data["depends_on"]
+
+        try:
+            validate_dependencies(self.instance, depends_on)
+        except ValueError as exc:
+            raise forms.ValidationError(str(exc))
+
+        return depends_on
+
+    def save(self, commit=True):
+        """Custom save that sets the step's dependencies with set_dependencies"""
+        step = super().save(commit=False)
+
+        if commit:
+            with transaction.atomic():
+                step.save()
+                set_dependencies(step, self.cleaned_data["depends_on"])
+
+        return step
@@ -86,6 +86,8 @@ def execute(request: HttpRequest) -> HttpResponse:
                 function=func,
                 parameters=form.cleaned_data,
                 return_type=func.return_type,
+                # Someone is waiting on the result
+                priority=Task.PRIORITY_HIGH,
             )
             task.clean()
             handle_file_parameters(task, request)
@@ -18,7 +18,7 @@ from ui.tables.task import TaskListFilter, TaskListTable
 
 from .generic import PermissionedDetailView, PermissionedListView
 
-FINISHED_STATUS = ["COMPLETE", "ERROR"]
+FINISHED_STATUS = Task.FINISHED_STATUSES
 
 
 def _detect_csv(result):
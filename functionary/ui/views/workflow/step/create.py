@@ -45,19 +45,24 @@ class WorkflowStepCreateView(PermissionedCreateView):
         step_form = self.get_form()
 
         if step_form.is_valid() and parameter_form.is_valid():
-            step = add_step(
-                **step_form.cleaned_data,
-                parameter_template=parameter_form.parameter_template
-            )
-
-            success_url = reverse("ui:workflow-detail", kwargs={"pk": step.workflow.pk})
-
-            return HttpResponseClientRedirect(success_url)
-        else:
-            context = self.get_context_data()
-            context["parameter_form"] = parameter_form
-
-            return render(self.request, self.template_name, context)
+            try:
+                step = add_step(
+                    **step_form.cleaned_data,
+                    parameter_template=parameter_form.parameter_template
+                )
+            except ValueError as exc:
+                step_form.add_error(None, str(exc))
+            else:
+                success_url = reverse(
+                    "ui:workflow-detail", kwargs={"pk": step.workflow.pk}
+                )
+
+                return HttpResponseClientRedirect(success_url)
+
+        context = self.get_context_data(form=step_form)
+        context["parameter_form"] = parameter_form
+
+        return render(self.request, self.template_name, context)
 
     def test_func(self):
         """Permission check for view access"""
@@ -80,7 +80,10 @@ def move_workflow_step(request: HttpRequest, workflow_pk: UUID, pk: UUID):
         except (ValueError, WorkflowStep.DoesNotExist):
             raise BadRequest(f"{next} is not a valid next value for this WorkflowStep")
 
-    move_step(step, new_next_step)
+    try:
+        move_step(step, new_next_step)
+    except ValueError as exc:
+        raise BadRequest(str(exc))
 
     context = {"workflow": step.workflow}
     return render(request, "partials/workflows/step_list.html", context)
@@ -1,20 +1,37 @@
+import * as fs from 'fs'
 import * as functions from './functions.js'
 
-const validParams = ["--function", "--parameters"]
+const OUTPUT_SEPARATOR = "==== Output From Command ===="
+const validParams = ["--function", "--parameters", "--result-file"]
 const args = process.argv.slice(2, )
+const options = {}
 
-if (args.length != 4 || !validParams.includes(args[0]) || !validParams.includes(args[2])) {
+for (let i = 0; i < args.length; i += 2) {
+  options[args[i]] = args[i + 1]
+}
+
+if (
+  args.length % 2 != 0 ||
+  !Object.keys(options).every(option => validParams.includes(option)) ||
+  options["--function"] === undefined ||
+  options["--parameters"] === undefined
+) {
   console.log(
-    "Invalid commandline, --function <function_name> --parameters <parameters in JSON format>"
+    "Invalid commandline, --function <function_name> --parameters <parameters in JSON format> [--result-file <path>]"
   )
   console.log(`Got: ${args}`)
   process.exit(1)
 }
 
-const toCall = args[0] === "--function" ? args[1] : args[3]
-const parameters = args[2] === "--parameters" ? args[3] : args[1]
+const toCall = options["--function"]
+const parameters = options["--parameters"]
 
 const retVal = functions[toCall].apply(null, [JSON.parse(parameters)])
+const output = JSON.stringify(retVal)
 
-console.log("==== Output From Command ====")
-console.log(JSON.stringify(retVal))
+if (options["--result-file"] !== undefined) {
+  fs.writeFileSync(options["--result-file"], output === undefined ? "null" : output)
+} else {
+  console.log(OUTPUT_SEPARATOR)
+  console.log(output)
+}
@@ -1,12 +1,55 @@
 import argparse
 import json
 import logging
+import os
 import sys
+import traceback
 
 import functions
 
+OUTPUT_SEPARATOR = "==== Output From Command ===="
+READY_MARKER = "==== Ready For Commands ===="
+RESPONSE_HEADER = "==== Response {token} {length} ===="
+
 logging.basicConfig(level=logging.INFO, stream=sys.stdout)
 
+
+def serve():
+    """Run functions for requests read from stdin until stdin is closed
+
+    Each request is a line of JSON with the function, parameters and variables to run
+    it with, along with a token. Anything the function outputs is followed by the
+    RESPONSE_HEADER, holding the token and the response's length, and a line of JSON
+    holding the exit status and the result.
+    """
+    print(READY_MARKER, flush=True)
+
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+
+        request = json.loads(line)
+        variables = request.get("variables") or {}
+        original_environ = os.environ.copy()
+        os.environ.update(variables)
+
+        try:
+            result = getattr(functions, request["function"])(**request["parameters"])
+            response = {"status": 0, "result": result}
+        except Exception:
+            traceback.print_exc(file=sys.stdout)
+            response = {"status": 1, "result": None}
+        finally:
+            os.environ.clear()
+            os.environ.update(original_environ)
+
+        data = json.dumps(response, default=str)
+        header = RESPONSE_HEADER.format(
+            token=request.get("token", ""), length=len(data.encode())
+        )
+        print(f"{header}\n{data}", flush=True)
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("-f", "--function", help="the function to call")
@@ -15,10 +58,27 @@ if __name__ == "__main__":
         "--parameters",
         help="the parameters to pass to the function in JSON format",
     )
+    parser.add_argument(
+        "--result-file",
+        help="write the result to this file rather than after the output separator",
+    )
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="run functions for JSON requests read from stdin",
+    )
 
     args = parser.parse_args()
 
+    if args.serve:
+        serve()
+        sys.exit(0)
+
     result = getattr(functions, args.function)(**json.loads(args.parameters))
     output = json.dumps(result, default=str)
 
-    print(f"==== Output From Command ====\n{output}")
+    if args.result_file:
+        with open(args.result_file, "w") as result_file:
+            result_file.write(output)
+    else:
+        print(f"{OUTPUT_SEPARATOR}\n{output}")
@@ -3,28 +3,33 @@ import sys
 from os import getenv
 
 from runner import Listener, Worker
+from runner.celery import WORKER_CONCURRENCY
+from runner.slots import WorkerSlots
 
 LOG_LEVEL = getenv("LOG_LEVEL", "INFO")
 logging.basicConfig(stream=sys.stdout, level=LOG_LEVEL)
 
 
-def spawn_listener() -> Listener:
-    listener = Listener()
+def spawn_listener(slots: WorkerSlots) -> Listener:
+    listener = Listener(slots)
     listener.start()
 
     return listener
 
 
-def spawn_worker() -> Worker:
-    worker = Worker()
+def spawn_worker(slots: WorkerSlots) -> Worker:
+    worker = Worker(slots)
     worker.start()
 
     return worker
 
 
 if __name__ == "__main__":
-    listener = spawn_listener()
-    worker = spawn_worker()
+    # Shared by both processes so the listener can track the worker's free slots
+    slots = WorkerSlots(WORKER_CONCURRENCY)
+
+    listener = spawn_listener(slots)
+    worker = spawn_worker(slots)
 
     logging.debug("Started worker and listener processes")
 
@@ -5,9 +5,17 @@ from os import getenv
 from celery.apps.worker import Worker as CeleryWorker
 from setproctitle import setproctitle
 
-from runner.celery import WORKER_CONCURRENCY, WORKER_HOSTNAME, app
+from runner.celery import (
+    AUTOSCALE,
+    AUTOSCALE_MAX,
+    AUTOSCALE_MIN,
+    WORKER_CONCURRENCY,
+    WORKER_HOSTNAME,
+    app,
+)
 from runner.listener import start_listening
 from runner.messaging import wait_for_connection
+from runner.slots import WorkerSlots, set_worker_slots
 
 
 class Worker(Process):
@@ -19,11 +27,15 @@ class Worker(Process):
     Attributes:
         name: Identification name given to the process
         app: Celery App used to create Celery Workers
+        slots: WorkerSlots that finished tasks are reported to
     """
 
-    def __init__(self, name: str = "functionary: runner worker") -> None:
+    def __init__(
+        self, slots: WorkerSlots, name: str = "functionary: runner worker"
+    ) -> None:
         super().__init__(name=name)
         self.app = app
+        self.slots = slots
         self.loglevel = getLevelName(getenv("LOG_LEVEL", "INFO").upper())
 
     def run(self) -> None:
@@ -50,8 +62,14 @@ class Worker(Process):
         # name is correct if anything happens prior to celery forking the workers
         setproctitle(self.name)
 
+        # Set before the pool processes are forked so that they inherit it
+        set_worker_slots(self.slots)
+
         wait_for_connection()
-        worker = CeleryWorker(app=self.app, hostname=WORKER_HOSTNAME)
+        autoscale = (AUTOSCALE_MAX, AUTOSCALE_MIN) if AUTOSCALE else None
+        worker = CeleryWorker(
+            app=self.app, hostname=WORKER_HOSTNAME, autoscale=autoscale
+        )
         worker.setup_defaults(concurrency=WORKER_CONCURRENCY, loglevel=self.loglevel)
         worker.start()
 
@@ -63,11 +81,15 @@ class Listener(Process):
 
     Attributes:
         name: Identification name given to the process
+        slots: WorkerSlots that the worker reports finished tasks to
 
     """
 
-    def __init__(self, name: str = "functionary: runner listener") -> None:
+    def __init__(
+        self, slots: WorkerSlots, name: str = "functionary: runner listener"
+    ) -> None:
         super().__init__(name=name)
+        self.slots = slots
 
     def run(self) -> None:
         """Runs the Listener process
@@ -88,5 +110,9 @@ class Listener(Process):
 
         """
         setproctitle(self.name)
+
+        # Tasks canceled before they are delivered are skipped
+        set_worker_slots(self.slots)
+
         wait_for_connection()
-        start_listening()
+        start_listening(self.slots)
@@ -0,0 +1,167 @@
+"""Worker autoscaling
+
+Functions mostly wait on their containers, so the number of tasks a host can run at
+once is not tied to its number of cpus. When autoscaling is enabled the worker grows
+its pool while every process is busy and the host has headroom, and shrinks it when
+the host is overloaded or the processes are idle. The new concurrency is shared with
+the listener through the WorkerSlots, so that its prefetch window follows.
+"""
+
+import logging
+from multiprocessing import cpu_count
+from os import getenv, getloadavg
+from time import monotonic
+from typing import NamedTuple, Optional
+
+from celery.worker.autoscale import Autoscaler
+from docker.errors import DockerException
+from requests.exceptions import RequestException
+
+from .docker_client import get_docker_client
+from .slots import get_worker_slots
+
+# How often, in seconds, the host is sampled and the pool resized
+AUTOSCALE_INTERVAL = float(getenv("FUNCTIONARY_AUTOSCALE_INTERVAL", 10))
+
+# The one minute load average, per cpu, above which the host is overloaded
+AUTOSCALE_MAX_LOAD = float(getenv("FUNCTIONARY_AUTOSCALE_MAX_LOAD", 1.0))
+
+# The fraction of memory that must remain available for the host to not be overloaded
+AUTOSCALE_MIN_MEMORY = float(getenv("FUNCTIONARY_AUTOSCALE_MIN_MEMORY", 0.1))
+
+# The number of running containers at which the host is overloaded. 0 disables this.
+AUTOSCALE_MAX_CONTAINERS = int(getenv("FUNCTIONARY_AUTOSCALE_MAX_CONTAINERS", 0))
+
+logger = logging.getLogger(__name__)
+
+
+class HostSample(NamedTuple):
+    """A sample of the host's load
+
+    Attributes:
+        load: The one minute load average per cpu
+        memory_available: The fraction of memory that is available
+        containers: The number of running containers
+    """
+
+    load: float
+    memory_available: float
+    containers: int
+
+    @property
+    def overloaded(self) -> bool:
+        """Whether the host is too busy for more tasks"""
+        return (
+            self.load > AUTOSCALE_MAX_LOAD
+            or self.memory_available < AUTOSCALE_MIN_MEMORY
+            or 0 < AUTOSCALE_MAX_CONTAINERS <= self.containers
+        )
+
+
+def sample_host() -> HostSample:
+    """Sample the load on the host"""
+    try:
+        containers = len(get_docker_client().containers.list())
+    except (DockerException, RequestException) as exc:
+        logger.warning("Unable to count running containers: %s", exc)
+        containers = 0
+
+    return HostSample(
+        load=getloadavg()[0] / cpu_count(),
+        memory_available=_get_memory_available(),
+        containers=containers,
+    )
+
+
+def _get_memory_available(meminfo: str = "/proc/meminfo") -> float:
+    """The fraction of the host's memory that is available"""
+    values = {}
+
+    try:
+        with open(meminfo) as file:
+            for line in file:
+                name, _, value = line.partition(":")
+                values[name] = int(value.split()[0])
+    except (OSError, ValueError, IndexError):
+        return 1.0
+
+    if not values.get("MemTotal") or "MemAvailable" not in values:
+        return 1.0
+
+    return values["MemAvailable"] / values["MemTotal"]
+
+
+def get_target_concurrency(
+    current: int, busy: int, sample: HostSample, minimum: int, maximum: int
+) -> int:
+    """Decide how many worker processes there should be
+
+    Args:
+        current: The current number of processes
+        busy: The number of tasks that have been received and not finished
+        sample: The load on the host
+        minimum: The fewest processes to have
+        maximum: The most processes to have
+
+    Returns:
+        The number of processes to scale to
+    """
+    if sample.overloaded:
+        target = current - 1
+    elif busy >= current:
+        # Every process is busy and there is room for more, so grow by a quarter
+        target = current + max(1, current // 4)
+    else:
+        target = max(busy, current - 1)
+
+    return min(max(target, minimum), maximum)
+
+
+class HostAutoscaler(Autoscaler):
+    """Scales the worker pool with the demand for it and the load on the host
+
+    Growth happens straight away, but the pool is not shrunk until the keepalive has
+    passed since it last grew, so that it does not flap.
+    """
+
+    def __init__(self, *args, keepalive: float = AUTOSCALE_INTERVAL, **kwargs):
+        super().__init__(*args, keepalive=keepalive, **kwargs)
+        self._sample: Optional[HostSample] = None
+        self._sampled_at = 0.0
+
+    def _maybe_scale(self, req=None):
+        processes = self.processes
+        target = get_target_concurrency(
+            processes,
+            self.qty,
+            self.sample(),
+            self.min_concurrency,
+            self.max_concurrency,
+        )
+
+        if target > processes:
+            self.scale_up(target - processes)
+        elif target < processes and self._can_scale_down():
+            self._shrink(processes - target)
+        else:
+            return False
+
+        if (slots := get_worker_slots()) is not None:
+            slots.concurrency = target
+
+        return True
+
+    def sample(self) -> HostSample:
+        """Sample the host, at most once per keepalive since this is called for
+        every task received"""
+        if self._sample is None or monotonic() - self._sampled_at >= self.keepalive:
+            self._sample = sample_host()
+            self._sampled_at = monotonic()
+
+        return self._sample
+
+    def _can_scale_down(self) -> bool:
+        return (
+            self._last_scale_up is None
+            or monotonic() - self._last_scale_up > self.keepalive
+        )
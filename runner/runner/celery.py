@@ -22,7 +22,15 @@ RABBITMQ_USER = getenv("RABBITMQ_USER")
 RABBITMQ_PASSWORD = getenv("RABBITMQ_PASSWORD")
 RABBITMQ_VHOST = getenv("RUNNER_DEFAULT_VHOST", "public")
 
-WORKER_CONCURRENCY = cpu_count()
+# When autoscaling, the number of worker processes grows and shrinks between the
+# minimum and maximum with the demand for them and the load on the host
+AUTOSCALE = getenv("FUNCTIONARY_AUTOSCALE", "false").lower() == "true"
+AUTOSCALE_MIN = int(getenv("FUNCTIONARY_AUTOSCALE_MIN", cpu_count()))
+AUTOSCALE_MAX = int(getenv("FUNCTIONARY_AUTOSCALE_MAX", 4 * cpu_count()))
+
+# The number of processes the worker starts with and the most it can have
+WORKER_CONCURRENCY = AUTOSCALE_MIN if AUTOSCALE else cpu_count()
+WORKER_MAX_CONCURRENCY = AUTOSCALE_MAX if AUTOSCALE else WORKER_CONCURRENCY
 WORKER_HOSTNAME = "worker"
 WORKER_NAME = f"celery@{WORKER_HOSTNAME}"
 
@@ -36,6 +44,9 @@ app = Celery(
     ),
 )
 
+if AUTOSCALE:
+    app.conf.worker_autoscaler = "runner.autoscale:HostAutoscaler"
+
 
 @setup_logging.connect
 def config_loggers(*args, **kwargs):
@@ -0,0 +1,104 @@
+"""Per-process docker client
+
+Creating a client for every call opens a new connection pool to the docker daemon.
+Instead each worker process creates one client, whose connections are kept alive and
+shared by every pull, run, wait, logs and remove made by the process.
+"""
+
+import logging
+import os
+from os import getenv
+from time import monotonic
+from typing import Optional
+
+from docker.errors import DockerException
+from requests.exceptions import RequestException
+
+import docker
+from docker import DockerClient
+
+# The number of seconds after which the client is checked with a ping before use
+DOCKER_HEALTH_CHECK_INTERVAL = float(getenv("FUNCTIONARY_DOCKER_HEALTH_CHECK", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class SharedDockerClient:
+    """Holds the docker client of the current process
+
+    The client is created on first use. If it has not been used for a while, or an
+    error was reported since it was last used, it is pinged before being handed out
+    and replaced if the daemon can not be reached through it. After a fork, such as
+    when the worker starts its pool processes, the child creates its own client.
+
+    Attributes:
+        health_check_interval: The number of seconds after which the client is
+            pinged before use
+    """
+
+    def __init__(
+        self, health_check_interval: float = DOCKER_HEALTH_CHECK_INTERVAL
+    ) -> None:
+        self.health_check_interval = health_check_interval
+        self._client: Optional[DockerClient] = None
+        self._checked_at = 0.0
+
+    def get(self) -> DockerClient:
+        """Return the process's client, creating a new one if needed
+
+        Raises:
+            DockerException: if unable to connect to the docker daemon
+        """
+        if self._client is not None and not self._is_healthy():
+            logger.info("Docker client is unhealthy, reconnecting")
+            self.discard()
+
+        if self._client is None:
+            self._client = docker.from_env()
+            self._checked_at = monotonic()
+
+        return self._client
+
+    def reset(self) -> None:
+        """Forget the client without closing it"""
+        self._client = None
+
+    def discard(self) -> None:
+        """Close the client and forget it"""
+        client, self._client = self._client, None
+
+        if client is not None:
+            try:
+                client.close()
+            except (DockerException, RequestException):
+                pass
+
+    def report_error(self, exc: Exception) -> None:
+        """Note an error from using the client, so that it is checked before its
+        next use"""
+        logger.debug("Docker client error, checking before next use: %s", exc)
+        self._checked_at = 0.0
+
+    def _is_healthy(self) -> bool:
+        """Ping the daemon if the client has not been checked recently"""
+        if monotonic() - self._checked_at < self.health_check_interval:
+            return True
+
+        try:
+            self._client.ping()
+        except (DockerException, RequestException) as exc:
+            logger.debug("Docker ping failed: %s", exc)
+            return False
+
+        self._checked_at = monotonic()
+
+        return True
+
+
+shared_docker_client = SharedDockerClient()
+os.register_at_fork(after_in_child=shared_docker_client.reset)
+
+
+def get_docker_client() -> DockerClient:
+    """Return the docker client of the current process"""
+    return shared_docker_client.get()
@@ -1,14 +1,27 @@
-import itertools
 import json
 import logging
 from os import getenv
-
+from typing import Optional
+
+from celery.signals import (
+    task_failure,
+    task_postrun,
+    task_revoked,
+    worker_process_init,
+    worker_process_shutdown,
+)
 from docker.errors import DockerException
 
-import docker
-
 from .celery import app
+from .docker_client import get_docker_client, shared_docker_client
+from .images import image_cache
+from .logs import LOG_CHUNK_SIZE, LogStreamer, iter_lines
 from .messaging import send_message
+from .pool import WARM_POOL_ENABLED, container_pool
+from .resources import get_resource_kwargs
+from .results import RESULT_FILE, read_result_file, supports_result_file
+from .slots import release_slot
+from .watchdog import TaskWatchdog, get_task_timeout
 
 OUTPUT_SEPARATOR = b"==== Output From Command ====\n"
 
@@ -25,65 +38,187 @@ logger = logging.getLogger(__name__)
 def pull_image(task) -> None:
     package = task.get("package")
 
-    docker_client = docker.from_env()
-    docker_client.images.pull(package)
+    try:
+        pulled = image_cache.ensure(get_docker_client(), package)
+    except DockerException as exc:
+        shared_docker_client.report_error(exc)
+        raise
 
-    logger.debug(f"Pulled {package}")
+    if pulled:
+        logger.debug(f"Pulled {package}")
+    else:
+        logger.debug(f"Skipped pull of {package}, it is already present")
 
 
 @app.task()
 def run_task(_=None, task=None):
-    exit_status, output, result = _run_task(task)
+    log_streamer = LogStreamer(task["id"])
+    watchdog = TaskWatchdog(task["id"], get_task_timeout(task))
+    exit_status, result = _run_task(task, log_streamer, watchdog)
 
     return {
         "task_id": task["id"],
         "status": exit_status,
-        "output": output.decode() if isinstance(output, bytes) else output,
+        "reason": watchdog.reason,
+        "output": watchdog.note,
         "result": result.decode() if isinstance(result, bytes) else result,
     }
 
 
-def _run_task(task):
+@task_postrun.connect(sender=run_task)
+def _release_slot_after_run(kwargs=None, **_):
+    """Free the listener's slot for the task once it has been run"""
+    release_slot(kwargs["task"]["id"])
+
+
+@task_failure.connect(sender=pull_image)
+@task_failure.connect(sender=run_task)
+def _release_slot_after_failure(args=None, kwargs=None, **_):
+    """The rest of the chain is skipped when a task fails, and task_postrun is not
+    sent when the pool process running it is lost, such as when it is killed for
+    exceeding the hard time limit. Free the slot in either case. The listener ignores
+    releases for slots that have already been freed."""
+    if task_id := _get_task_id(args, kwargs):
+        release_slot(task_id)
+
+
+@task_revoked.connect(sender=pull_image)
+@task_revoked.connect(sender=run_task)
+def _release_slot_after_revoke(request=None, **_):
+    """Free the slot of a task whose chain was revoked before it finished"""
+    if request and (task_id := _get_task_id(request.args, request.kwargs)):
+        release_slot(task_id)
+
+
+def _get_task_id(args, kwargs) -> Optional[str]:
+    """The id of the functionary task in the arguments of pull_image or run_task"""
+    if kwargs and "task" in kwargs:
+        return kwargs["task"]["id"]
+    elif args and isinstance(args[0], dict):
+        return args[0]["id"]
+
+    return None
+
+
+@worker_process_init.connect
+def _connect_docker_client(**_):
+    """Create the process's docker client up front rather than on its first task"""
+    try:
+        get_docker_client()
+    except DockerException as exc:
+        logger.warning("Unable to connect to docker: %s", exc)
+
+
+@worker_process_shutdown.connect
+def _close_container_pool(**_):
+    """Remove the process's warm containers when the worker shuts down"""
+    container_pool.close()
+
+
+def _network_kwargs() -> dict:
+    """The arguments that attach a task's container to the configured network"""
+    if network := getenv("FUNCTIONARY_NETWORK"):
+        return {"network": network}
+    elif network_mode := getenv("FUNCTIONARY_NETWORK_MODE"):
+        return {"network_mode": network_mode}
+
+    return {}
+
+
+def _run_task(task, log_streamer: LogStreamer, watchdog: TaskWatchdog):
     package = task.get("package")
     function = task.get("function")
+
+    container_kwargs = {
+        **_network_kwargs(),
+        **get_resource_kwargs(task.get("resources")),
+    }
+
+    logger.info("Running %s from package %s", function, package)
+
+    if WARM_POOL_ENABLED and (
+        warm_container := container_pool.acquire(package, **container_kwargs)
+    ):
+        try:
+            with watchdog.watch(warm_container.stop):
+                return warm_container.run(
+                    {
+                        "function": function,
+                        "parameters": task["function_parameters"],
+                        "variables": task.get("variables"),
+                    },
+                    log_streamer,
+                )
+        finally:
+            container_pool.release(warm_container)
+
     parameters = json.dumps(task["function_parameters"])
     variables = task.get("variables")
     run_command = ["--function", function, "--parameters", parameters]
 
-    logger.info("Running %s from package %s", function, package)
-    docker_client = docker.from_env()
+    if result_file := supports_result_file(package):
+        run_command += ["--result-file", RESULT_FILE]
+
     try:
         kwargs = {
             "auto_remove": False,
             "detach": True,
             "command": run_command,
             "environment": variables,
+            **container_kwargs,
         }
 
-        if network := getenv("FUNCTIONARY_NETWORK"):
-            kwargs["network"] = network
-        elif network_mode := getenv("FUNCTIONARY_NETWORK_MODE"):
-            kwargs["network_mode"] = network_mode
-
-        container = docker_client.containers.run(package, **kwargs)
+        container = get_docker_client().containers.run(package, **kwargs)
     except DockerException as exc:
-        return (1, f"Unable to execute function. Encountered error: {exc}", "null")
-
-    exit_status = container.wait()["StatusCode"]
-    output, result = _parse_container_logs(container.logs(stream=True))
+        shared_docker_client.report_error(exc)
+        log_streamer.write(
+            f"Unable to execute function. Encountered error: {exc}".encode()
+        )
+        log_streamer.close()
+        return (1, "null")
+
+    # Following the logs streams them until the container exits
+    with watchdog.watch(container.kill):
+        result = _stream_container_logs(
+            container.logs(stream=True, follow=True),
+            log_streamer,
+            separator=None if result_file else OUTPUT_SEPARATOR,
+        )
+        exit_status = container.wait()["StatusCode"]
+
+    if result_file:
+        result = read_result_file(container)
 
     container.remove()
 
-    return (exit_status, output, result)
+    return (exit_status, result)
+
+
+def _stream_container_logs(
+    logs, log_streamer: LogStreamer, separator: Optional[bytes] = OUTPUT_SEPARATOR
+) -> bytes:
+    """Publish the output that precedes the separator as it is produced
+
+    Args:
+        logs: The container's log stream
+        log_streamer: The LogStreamer to publish the output with
+        separator: The line that the result follows, or None if the result is not
+            part of the output
+
+    Returns:
+        The result, which is everything after the separator
+    """
+    lines = iter_lines(logs, LOG_CHUNK_SIZE)
+
+    for line in lines:
+        if line == separator:
+            break
 
+        log_streamer.write(line)
 
-def _parse_container_logs(logs):
-    output = b"".join(
-        itertools.takewhile(lambda x: x != OUTPUT_SEPARATOR, logs)
-    ).rstrip()
-    result = b"".join(logs).rstrip()
+    log_streamer.close()
 
-    return output, result
+    return b"".join(lines).rstrip()
 
 
 @app.task(
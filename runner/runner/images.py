@@ -0,0 +1,210 @@
+"""Local package image cache
+
+Package images are tagged with the id of the build that produced them, so once an
+image with such a tag is present it never needs to be pulled again. Every worker
+process on the host shares the images of the docker daemon, so pulls are coordinated
+through a directory of per image files:
+
+- A lock on an image's file collapses concurrent pulls of the image into one. A
+  process that waited on another's pull skips its own.
+- The file's modification time records when the image was last used, so the least
+  recently used images can be removed when they take up more than the disk budget.
+"""
+
+import fcntl
+import json
+import logging
+import os
+import re
+from contextlib import contextmanager
+from hashlib import sha256
+from os import getenv
+from tempfile import gettempdir
+from time import time
+from typing import Iterator, Optional, TextIO
+
+from docker.errors import DockerException, ImageNotFound
+
+from docker import DockerClient
+
+# The directory that tracks the images pulled on this host
+IMAGE_CACHE_DIR = getenv(
+    "FUNCTIONARY_IMAGE_CACHE_DIR", os.path.join(gettempdir(), "functionary-images")
+)
+
+# The number of bytes the pulled images may take up before the least recently used
+# are removed. 0 disables removal.
+IMAGE_DISK_BUDGET = int(getenv("FUNCTIONARY_IMAGE_DISK_BUDGET", 0))
+
+# Build ids are UUIDs
+_IMMUTABLE_TAG = re.compile(
+    r"^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$", re.IGNORECASE
+)
+
+logger = logging.getLogger(__name__)
+
+
+def is_immutable(image: str) -> bool:
+    """Whether the image reference always refers to the same image
+
+    Args:
+        image: The image reference
+
+    Returns:
+        True if the image is referenced by digest or tagged with a build id
+    """
+    if "@" in image:
+        return True
+
+    name, _, tag = image.rpartition(":")
+
+    # A colon in the last path component separates the tag, otherwise it's a port
+    return bool(name) and "/" not in tag and bool(_IMMUTABLE_TAG.match(tag))
+
+
+class ImageCache:
+    """Ensures that package images are present, pulling only when needed
+
+    Attributes:
+        directory: The directory that tracks the pulled images
+        disk_budget: The number of bytes the pulled images may take up, or 0 for no
+            limit
+    """
+
+    def __init__(
+        self, directory: str = IMAGE_CACHE_DIR, disk_budget: int = IMAGE_DISK_BUDGET
+    ) -> None:
+        self.directory = directory
+        self.disk_budget = disk_budget
+
+    def ensure(self, docker_client: DockerClient, image: str) -> bool:
+        """Make sure that the image is present, pulling it if needed
+
+        Args:
+            docker_client: The client of the docker daemon to pull with
+            image: The image to make present
+
+        Returns:
+            True if the image was pulled, False if the pull was skipped
+        """
+        requested_at = time()
+
+        with self._open(image) as record:
+            details = _read_record(record)
+
+            if is_immutable(image) and _is_present(docker_client, image):
+                pulled = False
+            elif details.get("pulled_at", 0) >= requested_at:
+                # Pulled by another process while this one waited for the lock
+                pulled = False
+            else:
+                docker_client.images.pull(image)
+                details = {"image": image, "pulled_at": time()}
+                pulled = True
+
+            _write_record(record, details | {"image": image})
+
+        if pulled and self.disk_budget:
+            self.evict(docker_client, keep=image)
+
+        return pulled
+
+    def evict(self, docker_client: DockerClient, keep: Optional[str] = None) -> None:
+        """Remove the least recently used images until the rest fit the disk budget
+
+        Images that are in use by a container or being pulled are left in place.
+
+        Args:
+            docker_client: The client of the docker daemon to remove images with
+            keep: An image that must not be removed
+        """
+        records = []
+
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+
+            try:
+                with open(path) as record:
+                    image = _read_record(record).get("image")
+                size = docker_client.images.get(image).attrs["Size"]
+                records.append((os.path.getmtime(path), image, size))
+            except ImageNotFound:
+                # Removed from outside of the runner
+                os.remove(path)
+            except (OSError, DockerException, TypeError):
+                continue
+
+        total_size = sum(size for _, _, size in records)
+
+        for _, image, size in sorted(records):
+            if total_size <= self.disk_budget:
+                break
+
+            if image != keep and self._remove(docker_client, image):
+                total_size -= size
+
+    def _remove(self, docker_client: DockerClient, image: str) -> bool:
+        """Remove the image unless it is being pulled or is in use"""
+        path = self._path(image)
+
+        with open(path, "a+") as record:
+            try:
+                fcntl.flock(record, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+
+            try:
+                docker_client.images.remove(image)
+            except ImageNotFound:
+                pass
+            except DockerException as exc:
+                logger.debug("Unable to remove %s: %s", image, exc)
+                return False
+
+            os.remove(path)
+
+        logger.info("Removed least recently used image %s", image)
+        return True
+
+    @contextmanager
+    def _open(self, image: str) -> Iterator[TextIO]:
+        """Open and lock the image's record, marking the image as used"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(image)
+
+        with open(path, "a+") as record:
+            fcntl.flock(record, fcntl.LOCK_EX)
+            yield record
+
+        os.utime(path)
+
+    def _path(self, image: str) -> str:
+        return os.path.join(self.directory, sha256(image.encode()).hexdigest())
+
+
+def _is_present(docker_client: DockerClient, image: str) -> bool:
+    try:
+        docker_client.images.get(image)
+    except ImageNotFound:
+        return False
+
+    return True
+
+
+def _read_record(record: TextIO) -> dict:
+    record.seek(0)
+
+    try:
+        return json.loads(record.read())
+    except ValueError:
+        return {}
+
+
+def _write_record(record: TextIO, details: dict) -> None:
+    record.seek(0)
+    record.truncate()
+    record.write(json.dumps(details))
+    record.flush()
+
+
+image_cache = ImageCache()
@@ -1,119 +1,251 @@
+from functools import partial
 from json import loads
 from logging import getLogger
 from logging.config import dictConfig
-from time import sleep
+from os import getenv
+from threading import Thread
+from typing import Optional
 
 from celery import chain
-from celery.app.control import Inspect
-from pika.channel import Channel
+from pika.adapters.blocking_connection import BlockingChannel, BlockingConnection
+from pika.exchange_type import ExchangeType
 from pika.spec import Basic, BasicProperties
 
-from .celery import WORKER_CONCURRENCY, WORKER_NAME, app
 from .handlers import publish_result, pull_image, run_task
 from .logging_configs import LISTENER_LOGGING
 from .messaging import build_connection
+from .scheduling import FairScheduler
+from .slots import WorkerSlots, is_task_canceled
 
 logger = getLogger(__name__)
 dictConfig(LISTENER_LOGGING)
 
-WAIT_FOR_AVAILABLE_WORKER_DELAY = 2
-WAIT_FOR_MESSAGE_DELAY = 0.5
+PUBLIC_QUEUE = "public"
 
+# The number of queues that tasks are spread over by environment. Must match the
+# TASK_QUEUE_SHARDS setting of the core application.
+TASK_QUEUE_SHARDS = int(getenv("FUNCTIONARY_TASK_QUEUE_SHARDS", 4))
 
-def start_listening():
-    logger.info("Starting listener")
-    connection = build_connection()
-    channel = connection.channel()
+# The highest task priority, which the task queues are declared with. Must match
+# Task.MAX_PRIORITY in the core application, as RabbitMQ refuses to declare an
+# existing queue with different arguments and the listener would fail to start.
+MAX_PRIORITY = 2
+
+# The number of tasks delivered beyond the worker's free slots, for the listener to
+# choose between as slots become free. 0 delivers as many as the worker's concurrency.
+TASK_LOOKAHEAD = int(getenv("FUNCTIONARY_TASK_LOOKAHEAD", 0))
 
-    inspect = _get_inspect()
+# Messages for every runner, such as to cancel a task that any of them may be running
+CONTROL_EXCHANGE = "runners.control"
 
-    while True:
-        method, properties, body = channel.basic_get("public")
+# How often, in seconds, the prefetch window is checked against the worker's
+# concurrency
+CONCURRENCY_CHECK_INTERVAL = 1
 
-        if method is None:
-            sleep(WAIT_FOR_MESSAGE_DELAY)
-            continue
 
-        _handle_delivery(channel, method, properties, body)
-        _wait_for_available_worker(inspect)
+class Consumer:
+    """Push based consumer for tasking messages
 
+    Messages are delivered by the broker from every task queue as soon as they are
+    published, up to a prefetch window that covers the worker slots and a lookahead.
+    Tasks are buffered by a FairScheduler and dispatched as slots become free, in the
+    order that it picks. Every task keeps its delivery unacked until the worker
+    reports that it has finished, so once all of the workers are busy and the
+    lookahead is full the broker stops pushing messages.
 
-def _handle_delivery(
-    channel: Channel, method: Basic.GetOk, properties: BasicProperties, body: bytes
-):
-    """Called when we receive a message from RabbitMQ"""
+    Control messages are consumed from a queue of the listener's own, bound to the
+    exchange that they are sent to every runner on.
 
-    # TODO: Implement handling of specific exceptions
-    try:
-        msg_type = properties.headers.get("x-msg-type", "__NONE__")
-        msg_body = loads(body.decode())
+    Attributes:
+        connection: The connection to the message broker
+        channel: The channel that messages are consumed on
+        slots: The WorkerSlots that finished tasks are reported through
+        in_flight: Delivery tags of the dispatched tasks, keyed by task id
+        scheduler: The FairScheduler holding the tasks waiting for a slot
+        prefetch_count: The current size of the prefetch window, which follows the
+            worker's concurrency
+    """
 
-        logger.info("Received message %s", msg_type)
+    def __init__(
+        self,
+        connection: BlockingConnection,
+        channel: BlockingChannel,
+        slots: WorkerSlots,
+    ) -> None:
+        self.connection = connection
+        self.channel = channel
+        self.slots = slots
+        self.in_flight: dict[str, int] = {}
+        self.scheduler = FairScheduler()
+        self.prefetch_count = _get_prefetch_count(slots.concurrency)
+
+    def start(self) -> None:
+        """Start consuming messages. Blocks until the channel is closed."""
+        Thread(target=self._watch_released_slots, daemon=True).start()
+
+        # The window is shared by the consumers of all of the task queues
+        self.channel.basic_qos(prefetch_count=self.prefetch_count, global_qos=True)
+        self.connection.call_later(CONCURRENCY_CHECK_INTERVAL, self.follow_concurrency)
+        self._consume_control_messages()
+
+        for queue in get_task_queues():
+            self.channel.queue_declare(
+                queue,
+                durable=True,
+                auto_delete=False,
+                arguments={"x-max-priority": MAX_PRIORITY},
+            )
+            self.channel.basic_consume(queue, on_message_callback=self.on_message)
+
+        self.channel.start_consuming()
+
+    def on_message(
+        self,
+        channel: BlockingChannel,
+        method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        """Called when the broker delivers a message"""
+        if (properties.headers or {}).get("x-msg-type") == "TASK_PACKAGE":
+            self.scheduler.add(
+                properties.priority,
+                method.routing_key,
+                (method.delivery_tag, properties, body),
+            )
+            self.dispatch_ready()
+        else:
+            self._dispatch(method.delivery_tag, properties, body)
+
+    def dispatch_ready(self) -> None:
+        """Dispatch buffered tasks to the worker while it has free slots"""
+        while len(self.in_flight) < self.slots.concurrency and (
+            (delivery := self.scheduler.next()) is not None
+        ):
+            self._dispatch(*delivery)
+
+    def on_control_message(
+        self,
+        channel: BlockingChannel,
+        method: Basic.Deliver,
+        properties: BasicProperties,
+        body: bytes,
+    ) -> None:
+        """Called when the broker delivers a control message"""
+        msg_type = (properties.headers or {}).get("x-msg-type", "__NONE__")
 
         match msg_type:
-            case "PULL_IMAGE":
-                pull_image.delay(**msg_body)
-            case "TASK_PACKAGE":
-                pull_image_s = pull_image.s(msg_body)
-                run_task_s = run_task.s(task=msg_body)
-                publish_task_s = publish_result.s()
-
-                chain(pull_image_s, run_task_s, publish_task_s).delay()
+            case "CANCEL_TASK":
+                task_id = loads(body.decode())["task_id"]
+                logger.info("Canceling task %s", task_id)
+                self.slots.cancel(task_id)
             case _:
-                logger.error("Unrecognized message type: %s", msg_type)
+                logger.error("Unrecognized control message type: %s", msg_type)
+
+    def release(self, task_id: str) -> None:
+        """Ack the delivery of a finished task, freeing its slot in the prefetch
+        window"""
+        if (delivery_tag := self.in_flight.pop(task_id, None)) is not None:
+            self.channel.basic_ack(delivery_tag)
+
+        logger.debug("Released slot for %s, %s in flight", task_id, len(self.in_flight))
+        self.dispatch_ready()
+
+    def follow_concurrency(self) -> None:
+        """Resize the prefetch window if the worker's concurrency has changed"""
+        concurrency = self.slots.concurrency
+
+        if (prefetch_count := _get_prefetch_count(concurrency)) != self.prefetch_count:
+            logger.info("Worker concurrency changed to %s", concurrency)
+            self.channel.basic_qos(prefetch_count=prefetch_count, global_qos=True)
+            self.prefetch_count = prefetch_count
+            self.dispatch_ready()
+
+        self.connection.call_later(CONCURRENCY_CHECK_INTERVAL, self.follow_concurrency)
+
+    def _dispatch(
+        self, delivery_tag: int, properties: BasicProperties, body: bytes
+    ) -> None:
+        """Hand a delivered message to the worker"""
+        try:
+            task_id = _handle_delivery(properties, body)
+        except Exception as exc:
+            logger.error("Error handling received message: %s", exc)
+            self.channel.basic_reject(delivery_tag, requeue=False)
+            return
+
+        if task_id is None:
+            self.channel.basic_ack(delivery_tag)
+        else:
+            self.in_flight[task_id] = delivery_tag
+
+    def _consume_control_messages(self) -> None:
+        """Bind a queue that only this listener consumes to the control exchange"""
+        self.channel.exchange_declare(
+            CONTROL_EXCHANGE,
+            exchange_type=ExchangeType.fanout,
+            durable=True,
+            auto_delete=False,
+        )
+        queue = self.channel.queue_declare("", exclusive=True).method.queue
+        self.channel.queue_bind(queue, CONTROL_EXCHANGE)
+        self.channel.basic_consume(
+            queue, on_message_callback=self.on_control_message, auto_ack=True
+        )
 
-        channel.basic_ack(method.delivery_tag)
-    except Exception as exc:
-        logger.error("Error handling received message: %s", exc)
+    def _watch_released_slots(self) -> None:
+        """Hand released slots over to the connection's thread as they come in"""
+        while True:
+            task_id = self.slots.wait_for_release()
+            self.connection.add_callback_threadsafe(partial(self.release, task_id))
 
 
-def _get_inspect() -> Inspect:
-    """Return Celery Inspect object after connection to Celery Workers is established"""
-    inspect = Inspect(app=app)
-    while inspect.ping() is None:
-        logger.info("Waiting for connection to Celery workers to be established.")
-        sleep(1)
+def get_task_queues() -> list[str]:
+    """The names of the queues that tasks are delivered on"""
+    return [f"{PUBLIC_QUEUE}.{shard}" for shard in range(TASK_QUEUE_SHARDS)]
 
-    logger.info("Connection to Celery workers has been established.")
-    return inspect
 
+def _get_prefetch_count(concurrency: int) -> int:
+    """The size of the prefetch window for the given worker concurrency"""
+    return concurrency + (TASK_LOOKAHEAD or concurrency)
 
-def _get_current_worker_tasks(inspect: Inspect) -> list[dict]:
-    """Get the number of tasks that the Celery worker is processing
 
-    Returns a dictionary containing the number of tasks the worker
-    is currently processing.
+def start_listening(slots: WorkerSlots):
+    logger.info("Starting listener")
+    connection = build_connection()
+    channel = connection.channel()
 
-    Args:
-        None
+    Consumer(connection, channel, slots).start()
 
-    Returns:
-        values: A list of of tasks the worker is processing
-    """
-    return inspect.active()[WORKER_NAME]
 
+def _handle_delivery(properties: BasicProperties, body: bytes) -> Optional[str]:
+    """Dispatch the received message to the workers
 
-def _get_worker_concurrency() -> int:
-    """Return the concurrency amount for the workers"""
-    return WORKER_CONCURRENCY
+    Returns:
+        The id of the dispatched task if the message will occupy a worker slot,
+        otherwise None
+    """
+    msg_type = properties.headers.get("x-msg-type", "__NONE__")
+    msg_body = loads(body.decode())
 
+    logger.info("Received message %s", msg_type)
 
-def _has_available_worker(inspect: Inspect) -> bool:
-    """Check if there are any available worker processes"""
-    worker_tasks = _get_current_worker_tasks(inspect)
-    worker_concurrency = _get_worker_concurrency()
+    match msg_type:
+        case "PULL_IMAGE":
+            pull_image.delay(**msg_body)
+        case "TASK_PACKAGE":
+            if is_task_canceled(msg_body["id"]):
+                logger.info("Skipping canceled task %s", msg_body["id"])
+                return None
 
-    logger.debug(f"List of worker tasks: {worker_tasks}")
-    logger.debug(f"Worker's concurrency amount: {worker_concurrency}")
+            pull_image_s = pull_image.s(msg_body)
+            run_task_s = run_task.s(task=msg_body)
+            publish_task_s = publish_result.s()
 
-    return True if len(worker_tasks) < worker_concurrency else False
+            chain(pull_image_s, run_task_s, publish_task_s).delay()
 
+            return msg_body["id"]
+        case _:
+            logger.error("Unrecognized message type: %s", msg_type)
 
-def _wait_for_available_worker(inspect: Inspect) -> None:
-    """Wait for an available worker process before consuming another message"""
-    while not _has_available_worker(inspect):
-        logger.info(
-            "No available worker processes. "
-            f"Checking again in {WAIT_FOR_AVAILABLE_WORKER_DELAY} seconds."
-        )
-        sleep(WAIT_FOR_AVAILABLE_WORKER_DELAY)
+    return None
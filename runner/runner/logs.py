@@ -0,0 +1,147 @@
+"""Streaming of container output
+
+Container output is read as it is produced and published in bounded chunks, rather
+than being buffered until the container exits, so that the memory used while
+running a task does not depend on how much output the task produces.
+"""
+
+from os import getenv
+from typing import Iterable, Iterator
+
+from .messaging import send_message
+
+# The maximum size, in bytes, of each published log chunk
+LOG_CHUNK_SIZE = int(getenv("FUNCTIONARY_LOG_CHUNK_SIZE", 64 * 1024))
+
+# The maximum number of bytes of output published for a task. Output past this is
+# discarded.
+LOG_MAX_BYTES = int(getenv("FUNCTIONARY_LOG_MAX_BYTES", 16 * 1024 * 1024))
+
+
+def iter_lines(stream: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    """Split a stream of bytes into lines
+
+    Lines longer than max_length are split into pieces so that no more than
+    max_length bytes of an unfinished line are held at a time.
+
+    Args:
+        stream: The stream to split, such as the output of a container
+        max_length: The maximum length of each yielded line
+
+    Yields:
+        Each line, including its trailing newline
+    """
+    partial = b""
+
+    for data in stream:
+        partial += data
+        start = 0
+
+        while True:
+            if (newline := partial.find(b"\n", start, start + max_length)) != -1:
+                end = newline + 1
+            elif len(partial) - start > max_length:
+                end = _safe_split_index(partial, start, start + max_length)
+            else:
+                break
+
+            yield partial[start:end]
+            start = end
+
+        partial = partial[start:]
+
+    if partial:
+        yield partial
+
+
+def _safe_split_index(data: bytes, start: int, end: int) -> int:
+    """Move the end of data[start:end] back so that it does not split a UTF-8
+    character"""
+    index = end
+
+    # UTF-8 continuation bytes are of the form 0b10xxxxxx
+    while index > start + 1 and data[index] & 0xC0 == 0x80:
+        index -= 1
+
+    return index if index > start + 1 else end
+
+
+class LogStreamer:
+    """Publishes a task's log output in chunks
+
+    Lines are collected until a chunk is full and the chunk is then published as a
+    TASK_LOG_CHUNK message. Chunks only break between lines, unless a single line is
+    longer than the chunk size. Once max_bytes of output have been published the
+    rest is counted but discarded.
+
+    Attributes:
+        task_id: The id of the task the output belongs to
+        chunk_size: The maximum size of each chunk in bytes
+        max_bytes: The maximum number of bytes to publish
+        sequence: The number of chunks that have been published
+        total_bytes: The number of bytes of output received
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        chunk_size: int = LOG_CHUNK_SIZE,
+        max_bytes: int = LOG_MAX_BYTES,
+    ) -> None:
+        self.task_id = task_id
+        self.chunk_size = chunk_size
+        self.max_bytes = max_bytes
+        self.sequence = 0
+        self.total_bytes = 0
+        self._published_bytes = 0
+        self._buffer: list[bytes] = []
+        self._buffer_size = 0
+
+    def write(self, line: bytes) -> None:
+        """Add a line of output, publishing a chunk if the chunk size is reached"""
+        self.total_bytes += len(line)
+        remaining = self.max_bytes - self._published_bytes - self._buffer_size
+
+        if remaining <= 0:
+            return
+
+        line = line[:remaining]
+
+        if self._buffer_size + len(line) > self.chunk_size:
+            self.flush()
+
+        self._buffer.append(line)
+        self._buffer_size += len(line)
+
+    def flush(self) -> None:
+        """Publish the buffered output, if there is any"""
+        if not self._buffer:
+            return
+
+        data = b"".join(self._buffer)
+
+        send_message(
+            "tasking.results",
+            "TASK_LOG_CHUNK",
+            {
+                "task_id": self.task_id,
+                "sequence": self.sequence,
+                "data": data.decode(errors="replace"),
+            },
+        )
+
+        self.sequence += 1
+        self._published_bytes += len(data)
+        self._buffer = []
+        self._buffer_size = 0
+
+    def close(self) -> None:
+        """Publish any remaining output along with a note if output was discarded"""
+        discarded = self.total_bytes - self._published_bytes - self._buffer_size
+
+        if discarded > 0:
+            self._buffer.append(
+                f"\n[Output truncated: {discarded} bytes discarded]\n".encode()
+            )
+
+        self.flush()
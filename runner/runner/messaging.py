@@ -2,10 +2,17 @@ import json
 import logging
 import os
 import ssl
+import threading
 from time import sleep
 
 import pika
-from pika.exceptions import AMQPConnectionError, UnroutableError
+from pika.adapters.blocking_connection import BlockingChannel
+from pika.exceptions import (
+    AMQPChannelError,
+    AMQPConnectionError,
+    NackError,
+    UnroutableError,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -53,6 +60,73 @@ def build_connection(ca=None, cert=None, key=None, open_callback=None):
         return pika.BlockingConnection(parameters)
 
 
+class PublisherPool:
+    """Per-process pool of persistent publisher channels
+
+    Each thread is given its own connection and confirm mode channel, since pika
+    connections are not thread safe. Connections are opened on first use and reopened
+    if they have gone away. After a fork, such as when the worker starts its pool
+    processes, the child discards the parent's connections and opens its own.
+    """
+
+    def __init__(self) -> None:
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        """Forget all pooled connections without closing them"""
+        self._local = threading.local()
+
+    def get_channel(self) -> BlockingChannel:
+        """Return this thread's publisher channel, opening a new one if needed"""
+        channel: BlockingChannel | None = getattr(self._local, "channel", None)
+
+        if channel is None or channel.is_closed or channel.connection.is_closed:
+            self.discard()
+
+            channel = build_connection().channel()
+            channel.confirm_delivery()
+            self._local.channel = channel
+
+        return channel
+
+    def discard(self) -> None:
+        """Close this thread's publisher connection and remove it from the pool"""
+        channel: BlockingChannel | None = getattr(self._local, "channel", None)
+        self._local.channel = None
+
+        if channel is not None and channel.connection.is_open:
+            try:
+                channel.connection.close()
+            except AMQPConnectionError:
+                pass
+
+    def publish(self, **kwargs) -> None:
+        """Publish a message on this thread's channel
+
+        A pooled connection that has been closed by the broker, or lost, since it was
+        last used is replaced and the publish is retried once.
+
+        Args:
+            kwargs: Passed through to BlockingChannel.basic_publish
+
+        Raises:
+            pika.exceptions.UnroutableError: if unable to publish the message
+            pika.exceptions.NackError: if the broker rejected the message
+        """
+        try:
+            self.get_channel().basic_publish(**kwargs)
+        except (UnroutableError, NackError):
+            raise
+        except (AMQPChannelError, AMQPConnectionError) as exc:
+            logger.debug("Publisher connection lost, reconnecting: %s", exc)
+            self.discard()
+            self.get_channel().basic_publish(**kwargs)
+
+
+publisher_pool = PublisherPool()
+os.register_at_fork(after_in_child=publisher_pool.reset)
+
+
 def send_message(routing_key, msg_type, message):
     """Sends a JSON message to the specified queue.
 
@@ -69,7 +143,6 @@ def send_message(routing_key, msg_type, message):
     """
 
     headers = {"x-msg-type": msg_type} if msg_type else {}
-    # TODO Update this to use a persistent connection to the queue
     publish_props = pika.BasicProperties(
         content_type="application/json",
         content_encoding="utf-8",
@@ -77,12 +150,8 @@ def send_message(routing_key, msg_type, message):
         delivery_mode=1,
     )
 
-    connection = build_connection()
-    channel = connection.channel()
-    channel.confirm_delivery()
-
     try:
-        channel.basic_publish(
+        publisher_pool.publish(
             exchange="",
             routing_key=routing_key,
             body=json.dumps(message),
@@ -93,8 +162,6 @@ def send_message(routing_key, msg_type, message):
         # TODO revisit this and handle exceptions better. Currently used for retry logic
         logger.error("Failed to send message")
         raise ue
-    finally:
-        connection.close()
 
 
 def connection_ready() -> bool:
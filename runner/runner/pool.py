@@ -0,0 +1,344 @@
+"""Warm container pool
+
+Starting a container for every task costs far more than running a short function.
+When enabled, each worker process keeps a long-lived container for each of the
+package images it has recently run. The containers run the package's main.py in
+serve mode, which reads one JSON request per line from stdin and writes the function's
+output to stdout, followed by the response. The response is framed by a header that
+holds a token unique to the request and the length of the JSON response, so nothing
+the function prints can be mistaken for it.
+
+Each worker process runs one task at a time, so a container is never shared by two
+tasks at once. Containers that have been idle for longer than the TTL, or whose image
+is the least recently used once the pool is full, are removed.
+"""
+
+import json
+import logging
+import re
+from collections import OrderedDict
+from os import getenv
+from time import monotonic
+from typing import Callable, Iterable, Iterator, Optional
+from uuid import uuid4
+
+from docker.errors import DockerException, NotFound
+from docker.utils.socket import frames_iter
+
+from .docker_client import get_docker_client, shared_docker_client
+from .logs import LOG_CHUNK_SIZE, LogStreamer, iter_lines
+
+# Precedes each response, with the request's token and the response's length
+RESPONSE_HEADER = "==== Response {token} {length} ===="
+READY_MARKER = b"==== Ready For Commands ====\n"
+
+# Whether tasks are run in warm containers rather than a new container each
+WARM_POOL_ENABLED = getenv("FUNCTIONARY_WARM_POOL", "false").lower() == "true"
+
+# The maximum number of images each worker process keeps a warm container for
+WARM_POOL_MAX_IMAGES = int(getenv("FUNCTIONARY_WARM_POOL_MAX_IMAGES", 8))
+
+# The number of seconds a warm container may sit idle before it is removed
+WARM_POOL_TTL = float(getenv("FUNCTIONARY_WARM_POOL_TTL", 300))
+
+# The number of seconds to wait for a new warm container to be ready for requests
+WARM_POOL_START_TIMEOUT = float(getenv("FUNCTIONARY_WARM_POOL_START_TIMEOUT", 30))
+
+logger = logging.getLogger(__name__)
+
+
+class WarmContainer:
+    """A running package container that accepts requests to run functions
+
+    Attributes:
+        container: The docker container
+        image: The package image the container is running
+        image_id: The id of the image when the container was started
+        key: The image and container options that the container is pooled under
+        last_used: The monotonic time at which the container was last used
+        alive: Whether the container is still able to accept requests
+    """
+
+    def __init__(
+        self,
+        container,
+        image: str,
+        output: Iterable[bytes],
+        send: Callable[[bytes], None],
+        image_id: Optional[str] = None,
+    ) -> None:
+        self.container = container
+        self.image = image
+        self.image_id = image_id
+        self.key = image
+        self.last_used = monotonic()
+        self.alive = True
+        self._lines = iter_lines(output, LOG_CHUNK_SIZE)
+        self._send = send
+
+    def wait_until_ready(self) -> bool:
+        """Wait for the container to report that it is ready for requests
+
+        Returns:
+            True if the container is ready, False if it exited first, such as when the
+            image's main.py does not support serve mode
+        """
+        try:
+            for line in self._lines:
+                if line == READY_MARKER:
+                    return True
+
+                logger.debug("Output from %s before ready: %s", self.image, line)
+        except OSError as exc:
+            logger.warning("Error waiting for %s to be ready: %s", self.image, exc)
+
+        self.alive = False
+        return False
+
+    def run(self, request: dict, log_streamer: LogStreamer) -> tuple[int, str]:
+        """Run a function in the container
+
+        Args:
+            request: The function, parameters and variables to run it with
+            log_streamer: The LogStreamer to publish the function's output with
+
+        Returns:
+            The exit status and the JSON encoded result
+        """
+        self.last_used = monotonic()
+        token = uuid4().hex
+
+        try:
+            self._send(json.dumps({**request, "token": token}).encode() + b"\n")
+            response = self._read_response(log_streamer, token)
+        except (OSError, ValueError) as exc:
+            logger.warning("Lost warm container for %s: %s", self.image, exc)
+            response = None
+
+        self.last_used = monotonic()
+
+        if response is None:
+            self.alive = False
+            log_streamer.write(b"Container exited while running the function\n")
+
+        log_streamer.close()
+
+        if response is None:
+            return (1, "null")
+
+        return (response["status"], json.dumps(response["result"]))
+
+    def _read_response(self, log_streamer: LogStreamer, token: str) -> Optional[dict]:
+        """Publish the function's output and return the response that follows it, or
+        None if the container exits first"""
+        header = re.compile(
+            RESPONSE_HEADER.format(token=token, length=r"(\d+)").encode() + b"\n$"
+        )
+
+        for line in self._lines:
+            # Output without a trailing newline runs into the header
+            if match := header.search(line):
+                if start := match.start():
+                    log_streamer.write(line[:start])
+                length = int(match.group(1))
+                break
+
+            log_streamer.write(line)
+        else:
+            return None
+
+        # The response is a single line, though it may be read in several pieces
+        pieces = []
+
+        for piece in self._lines:
+            pieces.append(piece)
+
+            if piece.endswith(b"\n"):
+                response = b"".join(pieces)[:-1]
+
+                if len(response) != length:
+                    raise ValueError(f"Expected {length} bytes, got {len(response)}")
+
+                return json.loads(response)
+
+        return None
+
+    def stop(self) -> None:
+        """Stop and remove the container"""
+        self.alive = False
+
+        try:
+            self.container.remove(force=True)
+        except NotFound:
+            # Already removed, such as when the task it was running was stopped
+            pass
+        except DockerException as exc:
+            logger.warning(
+                "Unable to remove warm container for %s: %s", self.image, exc
+            )
+
+
+class ContainerPool:
+    """The warm containers of a worker process, one for each recently used image
+
+    Functions with different resource limits need differently configured containers,
+    so containers are pooled by their image and container options.
+
+    Attributes:
+        max_images: The maximum number of images to keep a warm container for
+        ttl: The number of seconds a container may be idle before it is removed
+    """
+
+    def __init__(
+        self,
+        max_images: int = WARM_POOL_MAX_IMAGES,
+        ttl: float = WARM_POOL_TTL,
+    ) -> None:
+        self.max_images = max_images
+        self.ttl = ttl
+        self._idle: OrderedDict[str, WarmContainer] = OrderedDict()
+        self._unsupported: set[str] = set()
+
+    def acquire(self, image: str, **kwargs) -> Optional[WarmContainer]:
+        """Take the idle container for the image, starting one if there is none
+
+        Args:
+            image: The package image to run
+            kwargs: Additional arguments for creating a new container
+
+        Returns:
+            The container, or None if the image does not support serve mode
+        """
+        self.evict_expired()
+
+        key = _get_pool_key(image, kwargs)
+
+        if (container := self._idle.pop(key, None)) is not None:
+            # The image may have been replaced by a newly published version
+            if container.image_id == _get_image_id(image):
+                return container
+
+            container.stop()
+
+        if image in self._unsupported:
+            return None
+
+        try:
+            container = _start_container(image, **kwargs)
+        except DockerException as exc:
+            logger.warning("Unable to start warm container for %s: %s", image, exc)
+            shared_docker_client.report_error(exc)
+            return None
+
+        if not container.alive:
+            logger.info("%s does not support warm containers", image)
+            self._unsupported.add(image)
+            container.stop()
+            return None
+
+        container.key = key
+
+        return container
+
+    def release(self, container: WarmContainer) -> None:
+        """Return a container to the pool once the task it ran has finished
+
+        Args:
+            container: The container to return
+        """
+        if not container.alive:
+            container.stop()
+            return
+
+        if (previous := self._idle.pop(container.key, None)) is not None:
+            previous.stop()
+
+        self._idle[container.key] = container
+
+        while len(self._idle) > self.max_images:
+            _, least_recent = self._idle.popitem(last=False)
+            least_recent.stop()
+
+    def evict_expired(self) -> None:
+        """Remove the containers that have been idle for longer than the TTL"""
+        now = monotonic()
+
+        for key, container in list(self._idle.items()):
+            if now - container.last_used > self.ttl:
+                del self._idle[key]
+                container.stop()
+
+    def close(self) -> None:
+        """Remove all of the idle containers"""
+        while self._idle:
+            _, container = self._idle.popitem()
+            container.stop()
+
+
+def _start_container(image: str, **kwargs) -> WarmContainer:
+    """Start a container for the image in serve mode and wait for it to be ready
+
+    Args:
+        image: The package image to run
+        kwargs: Additional arguments for creating the container
+
+    Returns:
+        The container, which is no longer alive if it exited before becoming ready
+
+    Raises:
+        DockerException: The container could not be started
+    """
+    container = get_docker_client().containers.create(
+        image,
+        command=["--serve"],
+        stdin_open=True,
+        labels={"functionary.warm": "true"},
+        **kwargs,
+    )
+    socket = container.attach_socket(
+        params={"stdin": 1, "stdout": 1, "stderr": 1, "stream": 1}
+    )
+    container.start()
+
+    raw_socket = getattr(socket, "_sock", socket)
+    raw_socket.settimeout(WARM_POOL_START_TIMEOUT)
+
+    warm_container = WarmContainer(
+        container,
+        image,
+        _read_frames(socket),
+        raw_socket.sendall,
+        image_id=container.attrs.get("Image"),
+    )
+
+    # Functions may run for as long as they need once the container is ready
+    if warm_container.wait_until_ready():
+        raw_socket.settimeout(None)
+
+    return warm_container
+
+
+def _get_pool_key(image: str, kwargs: dict) -> str:
+    """The key that containers for the image with the given options are pooled
+    under"""
+    if not kwargs:
+        return image
+
+    return f"{image} {json.dumps(kwargs, sort_keys=True)}"
+
+
+def _get_image_id(image: str) -> Optional[str]:
+    """Get the id of the local image with the given name"""
+    try:
+        return get_docker_client().images.get(image).id
+    except DockerException:
+        return None
+
+
+def _read_frames(socket) -> Iterator[bytes]:
+    """Read the combined stdout and stderr of an attached container"""
+    for _, data in frames_iter(socket, tty=False):
+        yield data
+
+
+container_pool = ContainerPool()
@@ -0,0 +1,77 @@
+"""Resource limits for task containers
+
+Functions may declare limits on the cpus, memory and number of processes their
+containers use, so that one heavy function can not starve the others on the host.
+When cpu pinning is enabled, each worker slot is also given its own set of the docker
+host's cpus, so that the containers of different slots do not compete for cpus.
+"""
+
+from functools import lru_cache
+from os import getenv
+from typing import Optional
+
+from celery.utils.log import current_process_index
+
+from .celery import WORKER_MAX_CONCURRENCY
+from .docker_client import get_docker_client
+
+# Whether each worker slot's containers are pinned to their own cpus
+CPU_PINNING = getenv("FUNCTIONARY_CPU_PINNING", "false").lower() == "true"
+
+
+def get_resource_kwargs(resources: Optional[dict]) -> dict:
+    """Get the container options that apply a function's resource limits
+
+    Args:
+        resources: The function's resource limits, with optional cpus, memory and
+            pids
+
+    Returns:
+        The keyword arguments for creating the container
+    """
+    resources = resources or {}
+    kwargs = {}
+
+    if cpus := resources.get("cpus"):
+        kwargs["nano_cpus"] = int(cpus * 1e9)
+
+    if memory := resources.get("memory"):
+        kwargs["mem_limit"] = memory
+
+    if pids := resources.get("pids"):
+        kwargs["pids_limit"] = pids
+
+    if CPU_PINNING and (slot := current_process_index(base=0)) is not None:
+        cpuset = get_slot_cpuset(slot, WORKER_MAX_CONCURRENCY, _get_host_cpu_count())
+        kwargs["cpuset_cpus"] = ",".join(str(cpu) for cpu in cpuset)
+
+    return kwargs
+
+
+def get_slot_cpuset(slot: int, slots: int, cpu_count: int) -> list[int]:
+    """Get the cpus that the containers of a worker slot are pinned to
+
+    The cpus are shared out evenly between the slots. When there are fewer cpus than
+    slots, slots share cpus round robin.
+
+    Args:
+        slot: The index of the worker slot
+        slots: The number of worker slots
+        cpu_count: The number of cpus on the docker host
+
+    Returns:
+        The cpus for the slot
+    """
+    if cpu_count <= slots:
+        return [slot % cpu_count]
+
+    per_slot = cpu_count // slots
+    start = (slot % slots) * per_slot
+
+    return list(range(start, start + per_slot))
+
+
+@lru_cache(maxsize=1)
+def _get_host_cpu_count() -> int:
+    """The number of cpus on the docker host, which may not be the runner's host"""
+    return get_docker_client().info()["NCPU"]
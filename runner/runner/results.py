@@ -0,0 +1,72 @@
+"""Function results
+
+Package images built from the current templates are labeled as writing the
+function's result to a file in the container, rather than printing it to stdout after
+a separator. Once the container exits, the runner copies the file out of it. The
+output is then only ever streamed as logs, so it never needs to be scanned for the
+result and nothing a function prints can be mistaken for it.
+
+Images without the label are older builds, whose result still follows the separator
+in their output.
+"""
+
+import logging
+import tarfile
+from io import BytesIO
+
+from docker.errors import DockerException, NotFound
+
+from .docker_client import get_docker_client, shared_docker_client
+
+# The label of images whose main.py accepts --result-file
+RESULT_FILE_LABEL = "functionary.result-file"
+
+# Where, in the container, the function's result is written
+RESULT_FILE = "/tmp/functionary-result.json"
+
+logger = logging.getLogger(__name__)
+
+
+def supports_result_file(image: str) -> bool:
+    """Whether the image writes the function's result to a file
+
+    Args:
+        image: The package image
+
+    Returns:
+        True if the image is labeled as accepting --result-file
+    """
+    try:
+        labels = get_docker_client().images.get(image).labels
+    except DockerException as exc:
+        logger.debug("Unable to inspect %s: %s", image, exc)
+        return False
+
+    return (labels or {}).get(RESULT_FILE_LABEL) == "true"
+
+
+def read_result_file(container) -> bytes:
+    """Copy the function's result out of the exited container
+
+    Args:
+        container: The container that ran the function
+
+    Returns:
+        The JSON encoded result, or null if the function did not write one, such as
+        when it raised an exception or was stopped
+    """
+    try:
+        chunks, _ = container.get_archive(RESULT_FILE)
+        archive = BytesIO(b"".join(chunks))
+    except NotFound:
+        return b"null"
+    except DockerException as exc:
+        logger.warning("Unable to read the result of %s: %s", container.id, exc)
+        shared_docker_client.report_error(exc)
+        return b"null"
+
+    with tarfile.open(fileobj=archive) as tar:
+        member = tar.next()
+        result_file = tar.extractfile(member) if member else None
+
+        return result_file.read() if result_file else b"null"
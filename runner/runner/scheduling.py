@@ -0,0 +1,91 @@
+"""Fair ordering of task deliveries
+
+The listener is delivered more tasks than the worker has slots for, and picks which
+to run as slots become free. Tasks are taken from each priority in proportion to the
+priority's weight, so higher priority tasks get ahead without lower priority tasks
+being starved. Within a priority, the queues that the tasks were delivered from,
+which each hold the tasks of a share of the environments, take turns.
+"""
+
+from collections import OrderedDict, deque
+from os import getenv
+from typing import Any, Optional, Sequence
+
+# The share of tasks taken from each priority, from lowest to highest
+PRIORITY_WEIGHTS = [
+    float(weight)
+    for weight in getenv("FUNCTIONARY_PRIORITY_WEIGHTS", "1,2,4").split(",")
+]
+
+# The priority of tasks published without one
+DEFAULT_PRIORITY = 1
+
+
+class FairScheduler:
+    """Weighted fair ordering of buffered tasks
+
+    Each priority advances by the inverse of its weight every time a task is taken
+    from it, and the task is taken from the priority that has advanced the least. A
+    priority that had no tasks waiting does not build up credit while idle.
+
+    Attributes:
+        weights: The weight of each priority, from lowest to highest
+    """
+
+    def __init__(self, weights: Sequence[float] = PRIORITY_WEIGHTS) -> None:
+        self.weights = weights
+        self._ready: list[OrderedDict[str, deque]] = [OrderedDict() for _ in weights]
+        self._pass = [0.0 for _ in weights]
+        self._virtual_time = 0.0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, priority: Optional[int], queue: str, item: Any) -> None:
+        """Buffer a task
+
+        Args:
+            priority: The task's priority, or None for the default
+            queue: The queue the task was delivered from
+            item: The task
+        """
+        if priority is None:
+            priority = DEFAULT_PRIORITY
+
+        priority = max(0, min(priority, len(self.weights) - 1))
+        ready = self._ready[priority]
+
+        if not ready:
+            self._pass[priority] = max(self._pass[priority], self._virtual_time)
+
+        ready.setdefault(queue, deque()).append(item)
+        self._size += 1
+
+    def next(self) -> Optional[Any]:
+        """Take the task that should run next
+
+        Returns:
+            The task, or None if no tasks are buffered
+        """
+        waiting = [priority for priority, ready in enumerate(self._ready) if ready]
+
+        if not waiting:
+            return None
+
+        # Ties go to the higher priority
+        priority = min(waiting, key=lambda p: (self._pass[p], -p))
+        self._virtual_time = self._pass[priority]
+        self._pass[priority] += 1 / self.weights[priority]
+
+        # Move the queue to the back so that the other queues go first next time
+        ready = self._ready[priority]
+        queue, items = ready.popitem(last=False)
+        item = items.popleft()
+
+        if items:
+            ready[queue] = items
+
+        self._size -= 1
+
+        return item
@@ -0,0 +1,128 @@
+"""Worker slot accounting
+
+The listener and the Celery worker run in separate processes. Rather than asking the
+worker which tasks it is running, the listener tracks the tasks it has dispatched and
+the worker's pool processes report each task as it finishes.
+
+The tasks that have been canceled are shared the same way, so that the listener can
+record a cancellation and the pool process running the task can stop it.
+"""
+
+from multiprocessing import Array, SimpleQueue, Value
+from typing import Optional
+
+# The number of recently canceled tasks that are remembered
+CANCELED_TASKS_SIZE = 256
+
+# Task ids are UUIDs
+_TASK_ID_SIZE = 36
+
+
+class WorkerSlots:
+    """Tracks the freeing up of worker slots across processes
+
+    Must be created before the listener and worker processes are started so that both
+    of them, along with the worker's pool processes, share the same queue,
+    concurrency and canceled tasks.
+
+    Attributes:
+        concurrency: The number of tasks the worker can run at once. Shared between
+            processes, so that the listener follows changes made by the worker.
+    """
+
+    def __init__(self, concurrency: int) -> None:
+        self._concurrency = Value("i", concurrency)
+        self._released: SimpleQueue = SimpleQueue()
+        self._canceled = Array("c", CANCELED_TASKS_SIZE * _TASK_ID_SIZE)
+        self._next_canceled = Value("i", 0, lock=False)
+
+    @property
+    def concurrency(self) -> int:
+        return self._concurrency.value
+
+    @concurrency.setter
+    def concurrency(self, concurrency: int) -> None:
+        self._concurrency.value = concurrency
+
+    def release(self, task_id: str) -> None:
+        """Report that the task has finished and its slot is free
+
+        Args:
+            task_id: The id of the finished task
+        """
+        self._released.put(task_id)
+
+    def wait_for_release(self) -> str:
+        """Block until a slot is released
+
+        Returns:
+            The id of the task whose slot was released
+        """
+        return self._released.get()
+
+    def cancel(self, task_id: str) -> None:
+        """Record that the task has been canceled
+
+        Only the most recently canceled tasks are remembered, replacing the oldest
+        once CANCELED_TASKS_SIZE have been recorded.
+
+        Args:
+            task_id: The id of the canceled task
+        """
+        with self._canceled.get_lock():
+            index = self._next_canceled.value
+            self._canceled[_task_id_slice(index)] = _encode_task_id(task_id)
+            self._next_canceled.value = (index + 1) % CANCELED_TASKS_SIZE
+
+    def is_canceled(self, task_id: str) -> bool:
+        """Whether the task has recently been canceled
+
+        Args:
+            task_id: The id of the task to check
+        """
+        if not task_id:
+            return False
+
+        encoded = _encode_task_id(task_id)
+
+        with self._canceled.get_lock():
+            canceled = self._canceled[:]
+
+        return any(
+            canceled[_task_id_slice(index)] == encoded
+            for index in range(CANCELED_TASKS_SIZE)
+        )
+
+
+def _task_id_slice(index: int) -> slice:
+    """The part of the canceled tasks array that holds the task id at the index"""
+    return slice(index * _TASK_ID_SIZE, (index + 1) * _TASK_ID_SIZE)
+
+
+def _encode_task_id(task_id: str) -> bytes:
+    return task_id.encode()[:_TASK_ID_SIZE].ljust(_TASK_ID_SIZE, b"\0")
+
+
+_worker_slots: Optional[WorkerSlots] = None
+
+
+def set_worker_slots(slots: WorkerSlots) -> None:
+    """Set the WorkerSlots that finished tasks in this process are reported to"""
+    global _worker_slots
+    _worker_slots = slots
+
+
+def get_worker_slots() -> Optional[WorkerSlots]:
+    """Get the WorkerSlots of this process, if slots are being tracked"""
+    return _worker_slots
+
+
+def release_slot(task_id: str) -> None:
+    """Release the slot held by the given task, if slots are being tracked"""
+    if _worker_slots is not None:
+        _worker_slots.release(task_id)
+
+
+def is_task_canceled(task_id: str) -> bool:
+    """Whether the task has recently been canceled, if slots are being tracked"""
+    return _worker_slots is not None and _worker_slots.is_canceled(task_id)
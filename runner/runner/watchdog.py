@@ -0,0 +1,104 @@
+"""Task timeouts and cancellation
+
+While a task's container runs, a watchdog thread checks whether the task has run for
+longer than its timeout or has been canceled. If so, the container is killed, which
+ends the task, and the reason is reported along with the task's result.
+"""
+
+import logging
+from contextlib import contextmanager
+from os import getenv
+from threading import Event, Thread
+from time import monotonic
+from typing import Callable, Iterator, Optional
+
+from docker.errors import DockerException
+
+from .slots import is_task_canceled
+
+TIMEOUT = "TIMEOUT"
+CANCELED = "CANCELED"
+
+# The number of seconds tasks may run for when their function does not set a
+# timeout. 0 allows them to run for as long as they need.
+TASK_TIMEOUT = int(getenv("FUNCTIONARY_TASK_TIMEOUT", 0))
+
+# How often, in seconds, running tasks are checked
+WATCHDOG_INTERVAL = 0.5
+
+logger = logging.getLogger(__name__)
+
+
+class TaskWatchdog:
+    """Stops a task that runs for too long or is canceled
+
+    Attributes:
+        task_id: The id of the task
+        timeout: The number of seconds the task may run for, or None for no limit
+        interval: How often, in seconds, the task is checked
+        reason: TIMEOUT or CANCELED if the task was stopped, otherwise None
+    """
+
+    def __init__(
+        self,
+        task_id: str,
+        timeout: Optional[int] = None,
+        interval: float = WATCHDOG_INTERVAL,
+    ) -> None:
+        self.task_id = task_id
+        self.timeout = timeout
+        self.interval = interval
+        self.reason: Optional[str] = None
+
+    @contextmanager
+    def watch(self, kill: Callable[[], None]) -> Iterator[None]:
+        """Watch the task for as long as the context is active
+
+        Args:
+            kill: Called to stop the task's container
+        """
+        stopped = Event()
+        thread = Thread(target=self._watch, args=(kill, stopped), daemon=True)
+        thread.start()
+
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
+
+    @property
+    def note(self) -> str:
+        """A note for the task's log explaining why it was stopped, if it was"""
+        match self.reason:
+            case "TIMEOUT":
+                return f"\n[Task timed out after {self.timeout} seconds]\n"
+            case "CANCELED":
+                return "\n[Task canceled]\n"
+
+        return ""
+
+    def _watch(self, kill: Callable[[], None], stopped: Event) -> None:
+        deadline = monotonic() + self.timeout if self.timeout else None
+
+        while not stopped.wait(self.interval):
+            if is_task_canceled(self.task_id):
+                self.reason = CANCELED
+            elif deadline is not None and monotonic() >= deadline:
+                self.reason = TIMEOUT
+            else:
+                continue
+
+            logger.info("Stopping task %s: %s", self.task_id, self.reason)
+
+            try:
+                kill()
+            except DockerException as exc:
+                logger.warning("Unable to stop task %s: %s", self.task_id, exc)
+
+            return
+
+
+def get_task_timeout(task: dict) -> Optional[int]:
+    """The number of seconds the task may run for, if it is limited"""
+    return task.get("timeout") or TASK_TIMEOUT or None
@@ -0,0 +1,71 @@
+import pytest
+
+from runner.autoscale import (
+    HostAutoscaler,
+    HostSample,
+    _get_memory_available,
+    get_target_concurrency,
+)
+from runner.slots import WorkerSlots
+
+IDLE_HOST = HostSample(load=0.2, memory_available=0.8, containers=2)
+LOADED_HOST = HostSample(load=2.0, memory_available=0.8, containers=2)
+
+
+@pytest.mark.parametrize(
+    "current, busy, sample, target",
+    [
+        (8, 8, IDLE_HOST, 10),
+        (2, 2, IDLE_HOST, 3),
+        (8, 8, LOADED_HOST, 7),
+        (8, 3, IDLE_HOST, 7),
+        (16, 16, IDLE_HOST, 16),
+        (2, 0, IDLE_HOST, 2),
+    ],
+)
+def test_target_concurrency(current, busy, sample, target):
+    """The pool grows while busy with headroom and shrinks when loaded or idle"""
+    assert get_target_concurrency(current, busy, sample, 2, 16) == target
+
+
+def test_low_memory_is_overloaded():
+    """A host without enough available memory is overloaded"""
+    assert HostSample(load=0.1, memory_available=0.05, containers=0).overloaded
+
+
+def test_memory_available(tmp_path):
+    """The available fraction of memory is read from meminfo"""
+    meminfo = tmp_path / "meminfo"
+    meminfo.write_text("MemTotal: 1000 kB\nMemFree: 100 kB\nMemAvailable: 250 kB\n")
+
+    assert _get_memory_available(str(meminfo)) == 0.25
+
+
+@pytest.fixture
+def autoscaler(mocker):
+    pool = mocker.MagicMock(num_processes=4)
+    autoscaler = HostAutoscaler(pool, 16, 2)
+    mocker.patch.object(autoscaler, "sample", return_value=IDLE_HOST)
+
+    return autoscaler
+
+
+def test_autoscaler_updates_slots(mocker, autoscaler):
+    """Scaling the pool updates the concurrency shared with the listener"""
+    slots = WorkerSlots(4)
+    mocker.patch("runner.autoscale.get_worker_slots", return_value=slots)
+    mocker.patch.object(HostAutoscaler, "qty", 4)
+
+    assert autoscaler._maybe_scale()
+
+    autoscaler.pool.grow.assert_called_once_with(1)
+    assert slots.concurrency == 5
+
+
+def test_autoscaler_waits_to_shrink(mocker, autoscaler):
+    """The pool is not shrunk until the keepalive has passed since it grew"""
+    mocker.patch.object(HostAutoscaler, "qty", 0)
+    autoscaler.scale_up(0)
+
+    assert not autoscaler._maybe_scale()
+    autoscaler.pool.shrink.assert_not_called()
@@ -0,0 +1,52 @@
+import pytest
+from docker.errors import APIError, DockerException
+
+from runner.docker_client import SharedDockerClient
+
+
+@pytest.fixture
+def from_env(mocker):
+    return mocker.patch(
+        "runner.docker_client.docker.from_env",
+        side_effect=lambda: mocker.MagicMock(),
+    )
+
+
+def test_client_is_reused(from_env):
+    """The same client is returned for every call"""
+    shared_client = SharedDockerClient()
+
+    assert shared_client.get() is shared_client.get()
+    from_env.assert_called_once()
+
+
+def test_client_is_checked_after_interval(from_env):
+    """A client that has not been checked recently is pinged before use"""
+    shared_client = SharedDockerClient(health_check_interval=0)
+    client = shared_client.get()
+
+    assert shared_client.get() is client
+    client.ping.assert_called_once()
+
+
+def test_unhealthy_client_is_replaced(from_env):
+    """A client that fails its ping after an error is closed and replaced"""
+    shared_client = SharedDockerClient()
+    client = shared_client.get()
+    client.ping.side_effect = DockerException("gone")
+
+    shared_client.report_error(APIError("error"))
+
+    assert shared_client.get() is not client
+    client.close.assert_called_once()
+
+
+def test_reset_forgets_client(from_env):
+    """After a reset, such as in a forked child, a new client is created"""
+    shared_client = SharedDockerClient()
+    client = shared_client.get()
+
+    shared_client.reset()
+
+    assert shared_client.get() is not client
+    client.close.assert_not_called()
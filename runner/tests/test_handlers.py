@@ -0,0 +1,57 @@
+from types import SimpleNamespace
+
+import pytest
+from billiard.exceptions import WorkerLostError
+from celery.signals import task_failure, task_revoked
+
+from runner.handlers import pull_image, run_task
+
+TASK = {"id": "task-id", "package": "package"}
+
+
+@pytest.fixture
+def release_slot(mocker):
+    return mocker.patch("runner.handlers.release_slot")
+
+
+def test_slot_released_when_run_is_lost(release_slot):
+    """The slot is freed when the pool process running the task is lost"""
+    task_failure.send(
+        sender=run_task,
+        task_id="celery-id",
+        exception=WorkerLostError(),
+        args=[None],
+        kwargs={"task": TASK},
+    )
+
+    release_slot.assert_called_once_with(TASK["id"])
+
+
+def test_slot_released_when_pull_fails(release_slot):
+    """The slot is freed when the rest of the chain is skipped"""
+    task_failure.send(
+        sender=pull_image,
+        task_id="celery-id",
+        exception=Exception(),
+        args=[TASK],
+        kwargs={},
+    )
+
+    release_slot.assert_called_once_with(TASK["id"])
+
+
+@pytest.mark.parametrize(
+    "sender, args, kwargs",
+    [(pull_image, [TASK], {}), (run_task, [None], {"task": TASK})],
+)
+def test_slot_released_when_revoked(release_slot, sender, args, kwargs):
+    """The slot is freed when the chain is revoked at either step"""
+    task_revoked.send(
+        sender=sender,
+        request=SimpleNamespace(args=args, kwargs=kwargs),
+        terminated=True,
+        signum=9,
+        expired=False,
+    )
+
+    release_slot.assert_called_once_with(TASK["id"])
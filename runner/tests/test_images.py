@@ -0,0 +1,94 @@
+import os
+
+import pytest
+from docker.errors import APIError, ImageNotFound
+
+from runner.images import ImageCache, is_immutable
+
+BUILD_ID = "0b7e6f0a-8f3c-4b5e-9a1d-2c3e4f5a6b7c"
+
+
+@pytest.fixture
+def docker_client(mocker):
+    client = mocker.MagicMock()
+    client.images.get.side_effect = ImageNotFound("missing")
+
+    return client
+
+
+@pytest.fixture
+def image_cache(tmp_path) -> ImageCache:
+    return ImageCache(directory=str(tmp_path))
+
+
+@pytest.mark.parametrize(
+    "image, immutable",
+    [
+        (f"registry:5000/1/package:{BUILD_ID}", True),
+        ("registry/package@sha256:abcdef", True),
+        ("registry/package:latest", False),
+        ("registry:5000/package", False),
+    ],
+)
+def test_is_immutable(image, immutable):
+    """Only images referenced by digest or build id are immutable"""
+    assert is_immutable(image) == immutable
+
+
+def test_missing_image_is_pulled(docker_client, image_cache):
+    """An image that is not present is pulled"""
+    assert image_cache.ensure(docker_client, f"package:{BUILD_ID}")
+
+    docker_client.images.pull.assert_called_once_with(f"package:{BUILD_ID}")
+
+
+def test_present_immutable_image_is_not_pulled(docker_client, image_cache):
+    """An immutable image that is already present is not pulled again"""
+    docker_client.images.get.side_effect = None
+
+    assert not image_cache.ensure(docker_client, f"package:{BUILD_ID}")
+
+    docker_client.images.pull.assert_not_called()
+
+
+def test_mutable_image_is_always_pulled(docker_client, image_cache):
+    """An image with a mutable tag is pulled even when present"""
+    docker_client.images.get.side_effect = None
+
+    assert image_cache.ensure(docker_client, "package:latest")
+    assert image_cache.ensure(docker_client, "package:latest")
+
+    assert docker_client.images.pull.call_count == 2
+
+
+def test_pull_during_wait_is_reused(mocker, docker_client, image_cache):
+    """A pull completed by another process while waiting for the lock is reused"""
+    mocker.patch("runner.images.time", side_effect=[100, 150, 120])
+
+    image_cache.ensure(docker_client, "package:latest")
+    image_cache.ensure(docker_client, "package:latest")
+
+    docker_client.images.pull.assert_called_once()
+
+
+def test_least_recently_used_images_are_evicted(docker_client, image_cache):
+    """Pulled images are removed, least recently used first, to fit the budget"""
+    images = [f"package{index}:{BUILD_ID}" for index in range(3)]
+
+    for index, image in enumerate(images):
+        image_cache.ensure(docker_client, image)
+        os.utime(image_cache._path(image), (index, index))
+
+    image_cache.disk_budget = 250
+    docker_client.images.get.side_effect = None
+    docker_client.images.get.return_value.attrs = {"Size": 100}
+    docker_client.images.remove.side_effect = [APIError("in use"), None]
+
+    image_cache.evict(docker_client, keep=images[2])
+
+    assert [call.args[0] for call in docker_client.images.remove.call_args_list] == [
+        images[0],
+        images[1],
+    ]
+    assert os.path.exists(image_cache._path(images[0]))
+    assert not os.path.exists(image_cache._path(images[1]))
@@ -1,59 +1,144 @@
 import pytest
-from celery.app.control import Inspect
+from pika.spec import Basic, BasicProperties
 
-from runner.listener import _has_available_worker
+from runner import slots
+from runner.listener import Consumer, _handle_delivery
+from runner.slots import WorkerSlots
 
 
 @pytest.fixture
-def get_inspect() -> Inspect:
-    """Return empty Inspect object"""
-    return Inspect()
+def consumer(mocker) -> Consumer:
+    return Consumer(mocker.MagicMock(), mocker.MagicMock(), WorkerSlots(2))
 
 
-def test_has_all_available_workers(mocker, get_inspect):
-    def mock_worker_tasks(inspect: Inspect = get_inspect):
-        return []
+def _deliver(consumer: Consumer, delivery_tag: int):
+    method = Basic.Deliver(delivery_tag=delivery_tag)
+    consumer.on_message(consumer.channel, method, BasicProperties(), b"{}")
 
-    def mock_worker_concurrency():
-        return 4
 
-    mocker.patch("runner.listener._get_current_worker_tasks", mock_worker_tasks)
-    mocker.patch("runner.listener._get_worker_concurrency", mock_worker_concurrency)
+def test_dispatched_deliveries_stay_unacked(mocker, consumer):
+    """Deliveries are held until the worker reports their task finished"""
+    mocker.patch("runner.listener._handle_delivery", side_effect=["task1", "task2"])
 
-    assert _has_available_worker(get_inspect)
+    _deliver(consumer, 1)
+    _deliver(consumer, 2)
 
-    worker_tasks = mock_worker_tasks()
-    worker_concurrency = mock_worker_concurrency()
-    assert len(worker_tasks) < worker_concurrency
+    consumer.channel.basic_ack.assert_not_called()
+    assert consumer.in_flight == {"task1": 1, "task2": 2}
 
 
-def test_has_some_available_workers(mocker, get_inspect):
-    def mock_worker_tasks(inspect: Inspect = get_inspect):
-        return [1, 2]
+def test_released_slots_are_acked(mocker, consumer):
+    """Releasing a task's slot acks its delivery"""
+    mocker.patch("runner.listener._handle_delivery", side_effect=["task1", "task2"])
 
-    def mock_worker_concurrency():
-        return 4
+    _deliver(consumer, 1)
+    _deliver(consumer, 2)
+    consumer.release("task2")
 
-    mocker.patch("runner.listener._get_current_worker_tasks", mock_worker_tasks)
-    mocker.patch("runner.listener._get_worker_concurrency", mock_worker_concurrency)
-    assert _has_available_worker(get_inspect)
+    consumer.channel.basic_ack.assert_called_once_with(2)
+    assert consumer.in_flight == {"task1": 1}
 
-    worker_tasks = mock_worker_tasks()
-    worker_concurrency = mock_worker_concurrency()
-    assert len(worker_tasks) < worker_concurrency
 
+def test_unknown_released_slots_are_ignored(consumer):
+    """Releasing a slot that was never dispatched does nothing"""
+    consumer.release("unknown")
 
-def test_has_no_available_workers(mocker, get_inspect):
-    def mock_worker_tasks(inspect: Inspect = get_inspect):
-        return [1, 2, 3, 4]
+    consumer.channel.basic_ack.assert_not_called()
 
-    def mock_worker_concurrency():
-        return 4
 
-    mocker.patch("runner.listener._get_current_worker_tasks", mock_worker_tasks)
-    mocker.patch("runner.listener._get_worker_concurrency", mock_worker_concurrency)
-    assert not _has_available_worker(get_inspect)
+def test_non_task_deliveries_are_acked(mocker, consumer):
+    """Messages that do not occupy a worker are acked right away"""
+    mocker.patch("runner.listener._handle_delivery", return_value=None)
 
-    worker_tasks = mock_worker_tasks()
-    worker_concurrency = mock_worker_concurrency()
-    assert len(worker_tasks) == worker_concurrency
+    _deliver(consumer, 1)
+
+    consumer.channel.basic_ack.assert_called_once_with(1)
+    assert not consumer.in_flight
+
+
+def test_prefetch_matches_concurrency(consumer):
+    """The prefetch window covers the worker slots and as many again to choose
+    from, shared by every task queue"""
+    consumer.start()
+
+    consumer.channel.basic_qos.assert_called_once_with(
+        prefetch_count=4, global_qos=True
+    )
+    assert consumer.channel.basic_consume.call_count == 5
+
+
+def test_prefetch_follows_concurrency(consumer):
+    """A change to the worker's concurrency resizes the prefetch window"""
+    consumer.slots.concurrency = 5
+
+    consumer.follow_concurrency()
+    consumer.follow_concurrency()
+
+    consumer.channel.basic_qos.assert_called_once_with(
+        prefetch_count=10, global_qos=True
+    )
+    assert consumer.connection.call_later.call_count == 2
+
+
+def test_tasks_wait_for_free_slots(mocker, consumer):
+    """Tasks delivered while the worker is busy are dispatched highest priority
+    first as slots become free"""
+    handle_delivery = mocker.patch(
+        "runner.listener._handle_delivery",
+        side_effect=lambda properties, body: body.decode(),
+    )
+
+    for tag, priority in enumerate([1, 1, 0, 2], 1):
+        consumer.on_message(
+            consumer.channel,
+            Basic.Deliver(delivery_tag=tag, routing_key="public.0"),
+            BasicProperties(headers={"x-msg-type": "TASK_PACKAGE"}, priority=priority),
+            f"task{tag}".encode(),
+        )
+
+    assert consumer.in_flight == {"task1": 1, "task2": 2}
+    assert len(consumer.scheduler) == 2
+
+    consumer.release("task1")
+
+    assert handle_delivery.call_args.args[1] == b"task4"
+    assert consumer.in_flight == {"task2": 2, "task4": 4}
+
+
+def test_cancel_messages_are_recorded(consumer):
+    """A CANCEL_TASK control message marks the task as canceled"""
+    properties = BasicProperties(headers={"x-msg-type": "CANCEL_TASK"})
+
+    consumer.on_control_message(
+        consumer.channel, Basic.Deliver(), properties, b'{"task_id": "task1"}'
+    )
+
+    assert consumer.slots.is_canceled("task1")
+    assert not consumer.slots.is_canceled("task2")
+
+
+def test_canceled_tasks_are_not_dispatched(mocker):
+    """A task that was canceled before it was delivered is skipped"""
+    chain = mocker.patch("runner.listener.chain")
+    worker_slots = WorkerSlots(1)
+    worker_slots.cancel("task1")
+    slots.set_worker_slots(worker_slots)
+    properties = BasicProperties(headers={"x-msg-type": "TASK_PACKAGE"})
+
+    try:
+        assert _handle_delivery(properties, b'{"id": "task1"}') is None
+    finally:
+        slots.set_worker_slots(None)
+
+    chain.assert_not_called()
+
+
+def test_slots_are_released_across_processes():
+    """Released task ids are received in the order they were released"""
+    slots = WorkerSlots(2)
+
+    slots.release("task1")
+    slots.release("task2")
+
+    assert slots.wait_for_release() == "task1"
+    assert slots.wait_for_release() == "task2"
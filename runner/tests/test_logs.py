@@ -0,0 +1,81 @@
+import pytest
+
+from runner.handlers import OUTPUT_SEPARATOR, _stream_container_logs
+from runner.logs import LogStreamer, iter_lines
+
+
+@pytest.fixture
+def send_message(mocker):
+    return mocker.patch("runner.logs.send_message")
+
+
+def _published_chunks(send_message) -> list[str]:
+    return [call.args[2]["data"] for call in send_message.call_args_list]
+
+
+def test_iter_lines_splits_frames():
+    """Lines are split out of frames regardless of how the frames are broken up"""
+    frames = [b"one\ntw", b"o\nthree\n", b"four"]
+
+    assert list(iter_lines(frames, 100)) == [b"one\n", b"two\n", b"three\n", b"four"]
+
+
+def test_iter_lines_bounds_long_lines():
+    """Lines longer than the maximum are split without breaking UTF-8 characters"""
+    frames = ["aaé".encode() * 3, b"\n"]
+
+    lines = list(iter_lines(frames, 4))
+
+    assert all(len(line) <= 4 for line in lines)
+    assert b"".join(lines).decode() == "aaéaaéaaé\n"
+    assert all(line.decode() for line in lines)
+
+
+def test_chunks_are_line_aligned(send_message):
+    """Chunks are published as they fill, breaking only between lines"""
+    streamer = LogStreamer("task", chunk_size=10, max_bytes=100)
+
+    for line in [b"12345\n", b"1234\n", b"123\n"]:
+        streamer.write(line)
+
+    streamer.close()
+
+    assert _published_chunks(send_message) == ["12345\n", "1234\n123\n"]
+    assert [c.args[2]["sequence"] for c in send_message.call_args_list] == [0, 1]
+
+
+def test_output_over_max_bytes_is_discarded(send_message):
+    """Output past max_bytes is counted but not published"""
+    streamer = LogStreamer("task", chunk_size=10, max_bytes=8)
+
+    for _ in range(4):
+        streamer.write(b"1234\n")
+
+    streamer.close()
+    published = "".join(_published_chunks(send_message))
+
+    assert published.startswith("1234\n123")
+    assert "12 bytes discarded" in published
+    assert streamer.total_bytes == 20
+
+
+def test_result_follows_separator(send_message):
+    """Output before the separator is streamed and the rest is the result"""
+    logs = [b"log line\n", OUTPUT_SEPARATOR, b'{"result": 1}\n']
+
+    result = _stream_container_logs(iter(logs), LogStreamer("task"))
+
+    assert result == b'{"result": 1}'
+    assert _published_chunks(send_message) == ["log line\n"]
+
+
+def test_output_without_separator(send_message):
+    """Without a separator all of the output is streamed"""
+    logs = [b"log line\n", OUTPUT_SEPARATOR, b'{"result": 1}\n']
+
+    result = _stream_container_logs(iter(logs), LogStreamer("task"), separator=None)
+
+    assert result == b""
+    assert "".join(_published_chunks(send_message)) == (
+        'log line\n==== Output From Command ====\n{"result": 1}\n'
+    )
@@ -0,0 +1,199 @@
+import json
+
+import pytest
+
+from runner.pool import READY_MARKER, ContainerPool, WarmContainer
+
+
+@pytest.fixture
+def log_streamer(mocker):
+    return mocker.MagicMock()
+
+
+def _warm_container(mocker, output, image="package", image_id="sha256:1"):
+    container = WarmContainer(
+        mocker.MagicMock(), image, iter(output), mocker.MagicMock(), image_id
+    )
+    container.wait_until_ready()
+
+    return container
+
+
+@pytest.fixture
+def tokens(mocker):
+    """Give requests predictable tokens"""
+    uuid4 = mocker.patch("runner.pool.uuid4")
+    uuid4.side_effect = [mocker.MagicMock(hex=f"token{i}") for i in range(3)]
+
+
+def _response(status=0, result=None, token="token0") -> list[bytes]:
+    data = json.dumps({"status": status, "result": result}).encode()
+
+    return [f"==== Response {token} {len(data)} ====\n".encode(), data + b"\n"]
+
+
+@pytest.mark.usefixtures("tokens")
+def test_run_sends_request_and_reads_response(mocker, log_streamer):
+    """The function's output is published and the response after it is returned"""
+    container = _warm_container(
+        mocker,
+        [
+            b"import output\n",
+            READY_MARKER,
+            b"hello\n",
+            *_response(result={"answer": 42}),
+        ],
+    )
+
+    status, result = container.run({"function": "hello"}, log_streamer)
+
+    container._send.assert_called_once_with(
+        b'{"function": "hello", "token": "token0"}\n'
+    )
+    log_streamer.write.assert_called_once_with(b"hello\n")
+    log_streamer.close.assert_called_once()
+    assert (status, json.loads(result)) == (0, {"answer": 42})
+    assert container.alive
+
+
+@pytest.mark.usefixtures("tokens")
+def test_run_reads_consecutive_requests(mocker, log_streamer):
+    """A container runs one request after another"""
+    no_newline, *response = _response(status=1, token="token1")
+    container = _warm_container(
+        mocker,
+        [
+            READY_MARKER,
+            *_response(result=1),
+            b"no newline" + no_newline,
+            *response,
+        ],
+    )
+
+    assert container.run({}, log_streamer) == (0, "1")
+    assert container.run({}, log_streamer) == (1, "null")
+    log_streamer.write.assert_called_once_with(b"no newline")
+
+
+@pytest.mark.usefixtures("tokens")
+def test_output_is_not_mistaken_for_the_response(mocker, log_streamer):
+    """Output that looks like a response, but without the request's token, is
+    published as output"""
+    fake_response = _response(result="fake", token="guess")
+    container = _warm_container(
+        mocker, [READY_MARKER, *fake_response, *_response(result="real")]
+    )
+
+    assert container.run({}, log_streamer) == (0, '"real"')
+    assert [call.args[0] for call in log_streamer.write.call_args_list] == (
+        fake_response
+    )
+
+
+def test_run_when_container_exits(mocker, log_streamer):
+    """A container that exits before responding fails the task and is not reused"""
+    container = _warm_container(mocker, [READY_MARKER, b"partial output\n"])
+
+    assert container.run({}, log_streamer) == (1, "null")
+    assert not container.alive
+
+
+def test_unsupported_image(mocker):
+    """Images whose main.py exits without serving are remembered and skipped"""
+    start_container = mocker.patch(
+        "runner.pool._start_container",
+        side_effect=lambda image: _warm_container(mocker, [b"usage: main.py\n"]),
+    )
+    pool = ContainerPool()
+
+    assert pool.acquire("package") is None
+    assert pool.acquire("package") is None
+    start_container.assert_called_once()
+
+
+def test_released_containers_are_reused(mocker):
+    """A released container is handed out for the next task with the same image"""
+    mocker.patch("runner.pool._get_image_id", return_value="sha256:1")
+    start_container = mocker.patch(
+        "runner.pool._start_container",
+        side_effect=lambda image: _warm_container(mocker, [READY_MARKER], image),
+    )
+    pool = ContainerPool()
+
+    container = pool.acquire("package")
+    pool.release(container)
+
+    assert pool.acquire("package") is container
+    start_container.assert_called_once()
+
+
+def test_replaced_image_is_not_reused(mocker):
+    """A container for an image that has since been replaced is removed"""
+    mocker.patch("runner.pool._get_image_id", return_value="sha256:2")
+    mocker.patch(
+        "runner.pool._start_container",
+        side_effect=lambda image: _warm_container(mocker, [READY_MARKER], image),
+    )
+    pool = ContainerPool()
+
+    container = pool.acquire("package")
+    pool.release(container)
+
+    assert pool.acquire("package") is not container
+    container.container.remove.assert_called_once_with(force=True)
+
+
+def test_least_recently_used_image_is_evicted(mocker):
+    """Once the pool is full the container of the least recently used image is
+    removed"""
+    pool = ContainerPool(max_images=2)
+    containers = [
+        _warm_container(mocker, [READY_MARKER], image) for image in ["a", "b", "c"]
+    ]
+
+    for container in containers:
+        pool.release(container)
+
+    containers[0].container.remove.assert_called_once_with(force=True)
+    assert list(pool._idle) == ["b", "c"]
+
+
+def test_idle_containers_expire(mocker):
+    """Containers idle for longer than the TTL are removed"""
+    pool = ContainerPool(ttl=60)
+    container = _warm_container(mocker, [READY_MARKER])
+    pool.release(container)
+
+    container.last_used -= 61
+    pool.evict_expired()
+
+    container.container.remove.assert_called_once_with(force=True)
+    assert not pool._idle
+
+
+def test_dead_containers_are_not_pooled(mocker):
+    """Containers that exited are removed rather than returned to the pool"""
+    pool = ContainerPool()
+    container = _warm_container(mocker, [READY_MARKER])
+    container.alive = False
+
+    pool.release(container)
+
+    container.container.remove.assert_called_once_with(force=True)
+    assert not pool._idle
+
+
+def test_containers_are_pooled_by_options(mocker):
+    """Containers started with different options are not shared"""
+    mocker.patch("runner.pool._get_image_id", return_value="sha256:1")
+    mocker.patch(
+        "runner.pool._start_container",
+        side_effect=lambda image, **_: _warm_container(mocker, [READY_MARKER], image),
+    )
+    pool = ContainerPool()
+
+    container = pool.acquire("package", mem_limit="256m")
+    pool.release(container)
+
+    assert pool.acquire("package") is not container
+    assert pool.acquire("package", mem_limit="256m") is container
@@ -0,0 +1,42 @@
+import pytest
+
+from runner import resources
+from runner.resources import get_resource_kwargs, get_slot_cpuset
+
+
+def test_resource_limits():
+    """Declared limits are mapped to their container options"""
+    assert get_resource_kwargs({"cpus": 0.5, "memory": "256m", "pids": 64}) == {
+        "nano_cpus": 500000000,
+        "mem_limit": "256m",
+        "pids_limit": 64,
+    }
+
+
+def test_no_resource_limits():
+    """Functions without limits get no container options"""
+    assert get_resource_kwargs(None) == {}
+
+
+@pytest.mark.parametrize(
+    "slot, slots, cpu_count, cpuset",
+    [
+        (0, 4, 8, [0, 1]),
+        (3, 4, 8, [6, 7]),
+        (1, 3, 8, [2, 3]),
+        (5, 4, 2, [1]),
+    ],
+)
+def test_slot_cpuset(slot, slots, cpu_count, cpuset):
+    """Cpus are shared out evenly between the worker slots"""
+    assert get_slot_cpuset(slot, slots, cpu_count) == cpuset
+
+
+def test_cpu_pinning(mocker):
+    """When pinning is enabled, containers are pinned to their slot's cpus"""
+    mocker.patch.object(resources, "CPU_PINNING", True)
+    mocker.patch.object(resources, "WORKER_MAX_CONCURRENCY", 2)
+    mocker.patch.object(resources, "current_process_index", return_value=1)
+    mocker.patch.object(resources, "_get_host_cpu_count", return_value=4)
+
+    assert get_resource_kwargs({}) == {"cpuset_cpus": "2,3"}
@@ -0,0 +1,56 @@
+import tarfile
+from io import BytesIO
+
+import pytest
+from docker.errors import NotFound
+
+from runner.results import read_result_file, supports_result_file
+
+
+@pytest.fixture
+def docker_client(mocker):
+    client = mocker.MagicMock()
+    mocker.patch("runner.results.get_docker_client", return_value=client)
+
+    return client
+
+
+def _archive(content: bytes) -> list[bytes]:
+    """A tar archive of the result file, in the chunks that get_archive returns"""
+    archive = BytesIO()
+
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        info = tarfile.TarInfo("functionary-result.json")
+        info.size = len(content)
+        tar.addfile(info, BytesIO(content))
+
+    data = archive.getvalue()
+
+    return [data[:100], data[100:]]
+
+
+@pytest.mark.parametrize(
+    "labels, supported",
+    [({"functionary.result-file": "true"}, True), ({}, False), (None, False)],
+)
+def test_supports_result_file(docker_client, labels, supported):
+    """Only labeled images are given a result file"""
+    docker_client.images.get.return_value.labels = labels
+
+    assert supports_result_file("package") == supported
+
+
+def test_read_result_file(mocker):
+    """The result is copied out of the container as is"""
+    container = mocker.MagicMock()
+    container.get_archive.return_value = (_archive(b'{"answer": 42}'), {})
+
+    assert read_result_file(container) == b'{"answer": 42}'
+
+
+def test_missing_result_file(mocker):
+    """A function that did not write a result has a null result"""
+    container = mocker.MagicMock()
+    container.get_archive.side_effect = NotFound("missing")
+
+    assert read_result_file(container) == b"null"
@@ -0,0 +1,61 @@
+from runner.scheduling import FairScheduler
+
+
+def _take(scheduler: FairScheduler, count: int) -> list:
+    return [scheduler.next() for _ in range(count)]
+
+
+def test_empty_scheduler():
+    """Nothing is returned when no tasks are buffered"""
+    assert FairScheduler().next() is None
+
+
+def test_priorities_are_weighted():
+    """Tasks are taken from each priority in proportion to its weight"""
+    scheduler = FairScheduler(weights=[1, 3])
+
+    for index in range(8):
+        scheduler.add(0, "queue", f"low{index}")
+        scheduler.add(1, "queue", f"high{index}")
+
+    taken = _take(scheduler, 8)
+
+    assert sum(item.startswith("high") for item in taken) == 6
+    assert len(scheduler) == 8
+
+
+def test_queues_take_turns():
+    """Within a priority, the queues that tasks were delivered from take turns"""
+    scheduler = FairScheduler(weights=[1])
+
+    for index in range(3):
+        scheduler.add(0, "busy", f"busy{index}")
+
+    scheduler.add(0, "quiet", "quiet0")
+
+    assert _take(scheduler, 4) == ["busy0", "quiet0", "busy1", "busy2"]
+
+
+def test_idle_priorities_do_not_build_up_credit():
+    """A priority that was idle does not get a run of tasks ahead of the others"""
+    scheduler = FairScheduler(weights=[1, 1])
+
+    for index in range(10):
+        scheduler.add(1, "queue", f"high{index}")
+
+    _take(scheduler, 6)
+
+    for index in range(4):
+        scheduler.add(0, "queue", f"low{index}")
+
+    assert _take(scheduler, 4) == ["low0", "high6", "low1", "high7"]
+
+
+def test_unknown_priorities_are_clamped():
+    """Missing and out of range priorities are treated as the nearest known one"""
+    scheduler = FairScheduler(weights=[1, 1, 1])
+
+    scheduler.add(None, "queue", "default")
+    scheduler.add(7, "queue", "high")
+
+    assert _take(scheduler, 2) == ["high", "default"]
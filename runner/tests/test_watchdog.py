@@ -0,0 +1,55 @@
+from threading import Event
+
+import pytest
+
+from runner import slots
+from runner.slots import WorkerSlots
+from runner.watchdog import CANCELED, TIMEOUT, TaskWatchdog
+
+
+@pytest.fixture
+def worker_slots():
+    worker_slots = WorkerSlots(1)
+    slots.set_worker_slots(worker_slots)
+
+    yield worker_slots
+
+    slots.set_worker_slots(None)
+
+
+def test_task_that_finishes_is_not_stopped(mocker):
+    """A task that finishes within its timeout is left alone"""
+    kill = mocker.MagicMock()
+    watchdog = TaskWatchdog("task1", timeout=60, interval=0.01)
+
+    with watchdog.watch(kill):
+        pass
+
+    kill.assert_not_called()
+    assert watchdog.reason is None
+    assert watchdog.note == ""
+
+
+def test_task_past_its_timeout_is_stopped():
+    """A task that runs past its timeout has its container killed"""
+    killed = Event()
+    watchdog = TaskWatchdog("task1", timeout=0.05, interval=0.01)
+
+    with watchdog.watch(killed.set):
+        assert killed.wait(5)
+
+    assert watchdog.reason == TIMEOUT
+    assert "timed out" in watchdog.note
+
+
+def test_canceled_task_is_stopped(worker_slots):
+    """A task that is canceled while it runs has its container killed"""
+    killed = Event()
+    watchdog = TaskWatchdog("task1", interval=0.01)
+
+    with watchdog.watch(killed.set):
+        worker_slots.cancel("task1")
+        assert killed.wait(5)
+
+    assert watchdog.reason == CANCELED
+    assert "canceled" in watchdog.note